@@ -30,7 +30,7 @@ CORS(
         'http://127.0.0.1:3000', 'http://127.0.0.1:3001',
     ],
     allow_headers=['Content-Type', 'Authorization'],
-    expose_headers=['Content-Type', 'Authorization'],
+    expose_headers=['Content-Type', 'Authorization', 'X-Next-Cursor'],
     supports_credentials=True,
     methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
     max_age=3600,
@@ -47,27 +47,6 @@ if not app.secret_key:
 # Session -------------------------------------------------------------
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 
-# ---------------------------------------------------------------------------
-# MongoEngine
-# ---------------------------------------------------------------------------
-try:
-    connect(host=app.config['MONGODB_URI'])
-    print("✅ Connected to MongoDB with MongoEngine!")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
-
-# ---------------------------------------------------------------------------
-# ML Verification System
-# ---------------------------------------------------------------------------
-try:
-    from image_verification import ImageVerificationSystem
-    verifier = ImageVerificationSystem()
-    app.config['VERIFIER'] = verifier
-    print("✅ ML Verification System initialized!")
-except Exception as e:
-    print(f"⚠️ Warning: ML Verification System failed to initialize: {e}")
-    app.config['VERIFIER'] = None
-
 # ---------------------------------------------------------------------------
 # Flask-Login
 # ---------------------------------------------------------------------------
@@ -123,7 +102,9 @@ def health_check():
         db, _ = get_mongodb_db()
         if db is not None:
             db.command('ping')
-            return {"status": "healthy", "database": "connected"}, 200
+            from verification_jobs import pool_state
+            return {"status": "healthy", "database": "connected",
+                    "verification_pool": pool_state()}, 200
         return {"status": "unhealthy", "database": "disconnected"}, 503
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}, 503
@@ -143,35 +124,79 @@ def server_error(e):
 
 
 # ---------------------------------------------------------------------------
-# Register Blueprints
+# Bootstrap
 # ---------------------------------------------------------------------------
-from routes.auth import auth_bp
-from routes.products import products_bp
-from routes.cart import cart_bp
-from routes.farmers import farmers_bp
-from routes.orders import orders_bp
-from routes.profile import profile_bp
-from routes.admin import admin_bp
-from routes.api import api_bp
-
-app.register_blueprint(auth_bp)
-app.register_blueprint(products_bp)
-app.register_blueprint(cart_bp)
-app.register_blueprint(farmers_bp)
-app.register_blueprint(orders_bp)
-app.register_blueprint(profile_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(api_bp)
+def bootstrap():
+    """Connect to MongoDB, start background services and register blueprints."""
+    # MongoEngine
+    try:
+        connect(host=app.config['MONGODB_URI'])
+        print("✅ Connected to MongoDB with MongoEngine!")
+    except Exception as e:
+        print(f"❌ MongoDB connection failed: {e}")
 
-# ---------------------------------------------------------------------------
-# Test MongoEngine connection on startup
-# ---------------------------------------------------------------------------
-try:
-    from models import User
-    User.objects.limit(1).count()
-    print("✅ Models imported & MongoDB connection verified!")
-except Exception as e:
-    print(f"❌ Model/DB test failed: {e}")
+    # PyMongo indexes
+    try:
+        from db import get_mongodb_db
+        from indexes import ensure_indexes, explain_hot_queries
+        with app.app_context():
+            db, _ = get_mongodb_db()
+            if db is not None:
+                summary = ensure_indexes(db)
+                if not summary['skipped']:
+                    print(f"✅ Indexes at version {summary['version']} "
+                          f"({len(summary['created'])} created, {len(summary['failed'])} failed)")
+                    for report in explain_hot_queries(db):
+                        if report['collscan']:
+                            print(f"⚠️ COLLSCAN on {report['collection']} for {report['filter']}")
+    except Exception as e:
+        print(f"⚠️ Index bootstrap failed: {e}")
+
+    # Email outbox workers
+    try:
+        from email_outbox import start_email_workers
+        start_email_workers(app)
+    except Exception as e:
+        print(f"⚠️ Email outbox failed to start: {e}")
+
+    # Permit verification workers (each builds the ML verifier on start-up)
+    from verification_jobs import VERIFIER_WARMUP, warm_pool
+    if VERIFIER_WARMUP:
+        warm_pool(app.config['MONGODB_URI'])
+
+    # Blueprints
+    from routes.auth import auth_bp
+    from routes.products import products_bp
+    from routes.cart import cart_bp
+    from routes.farmers import farmers_bp
+    from routes.orders import orders_bp
+    from routes.profile import profile_bp
+    from routes.admin import admin_bp
+    from routes.api import api_bp
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(products_bp)
+    app.register_blueprint(cart_bp)
+    app.register_blueprint(farmers_bp)
+    app.register_blueprint(orders_bp)
+    app.register_blueprint(profile_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp)
+
+    # Test MongoEngine connection on startup
+    try:
+        from models import User
+        User.objects.limit(1).count()
+        print("✅ Models imported & MongoDB connection verified!")
+    except Exception as e:
+        print(f"❌ Model/DB test failed: {e}")
+
+
+# The verification worker pool uses ``spawn``, whose children re-import the
+# script that started the parent as ``__mp_main__``.  When this file is run
+# directly they must not connect, build indexes or start email workers again.
+if __name__ != '__mp_main__':
+    bootstrap()
 
 # ---------------------------------------------------------------------------
 # Run
@@ -0,0 +1,145 @@
+"""
+Small in-process caches.
+
+``TTLCache`` is a thread-safe, size-bounded LRU map whose entries also expire
+after a fixed time-to-live.  The catalog caches below sit in front of the
+public product endpoints; the farmer product write paths call
+``invalidate_catalog`` so edits show up immediately in this process.  Each
+gunicorn worker keeps its own copy, so other workers see changes once their
+entries expire (``CATALOG_LISTING_TTL`` seconds at most).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, maxsize=1024, ttl=60.0, name='cache'):
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else float(ttl))
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss.
+
+        ``None`` results are not cached so transient lookup failures retry.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        if value is not None:
+            self.set(key, value, ttl=ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': size,
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Catalog caches
+# ---------------------------------------------------------------------------
+CATALOG_PRODUCT_TTL = float(os.environ.get('CATALOG_PRODUCT_TTL') or 300)
+CATALOG_LISTING_TTL = float(os.environ.get('CATALOG_LISTING_TTL') or 30)
+CATALOG_FACET_TTL = float(os.environ.get('CATALOG_FACET_TTL') or 300)
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE') or 2048)
+
+product_cache = TTLCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_PRODUCT_TTL, name='products')
+listing_cache = TTLCache(maxsize=max(64, CATALOG_CACHE_SIZE // 4), ttl=CATALOG_LISTING_TTL, name='listings')
+facet_cache = TTLCache(maxsize=8, ttl=CATALOG_FACET_TTL, name='facets')
+
+
+def get_cached_product(db, product_id):
+    """Look a product up by ObjectId or legacy ``id``, via ``product_cache``.
+
+    Returns a shallow copy so callers can tweak the dict without touching
+    the cached document.
+    """
+    from bson import ObjectId
+
+    def _load():
+        doc = None
+        if ObjectId.is_valid(str(product_id)):
+            doc = db.products.find_one({'_id': ObjectId(str(product_id))})
+        if not doc:
+            doc = db.products.find_one({'id': str(product_id)})
+        return doc
+
+    doc = product_cache.get_or_load(str(product_id), _load)
+    return dict(doc) if doc else None
+
+
+def invalidate_catalog(*product_ids):
+    """Drop cached entries after a product write.
+
+    The given products are evicted by id and every cached listing and facet
+    count is cleared, since any write can change what those contain.
+    """
+    for pid in product_ids:
+        if pid is not None:
+            product_cache.delete(str(pid))
+    listing_cache.clear()
+    facet_cache.clear()
+
+
+def catalog_cache_stats():
+    return {
+        'products': product_cache.stats(),
+        'listings': listing_cache.stats(),
+        'facets': facet_cache.stats(),
+    }
@@ -0,0 +1,130 @@
+"""
+Cart hydration helpers: resolve every product / farmer referenced by a cart
+in a fixed number of round trips instead of one query per cart line.
+"""
+from bson import ObjectId
+
+
+def _split_ids(raw_ids):
+    """Split raw id values into (ObjectIds, legacy string ids).
+
+    Every id is also kept as a legacy string so documents that use a custom
+    ``id`` field that happens to look like an ObjectId are still matched.
+    """
+    object_ids = []
+    legacy_ids = []
+    for raw in raw_ids:
+        if raw is None or raw == '':
+            continue
+        value = str(raw)
+        if ObjectId.is_valid(value):
+            object_ids.append(ObjectId(value))
+        legacy_ids.append(value)
+    return list(dict.fromkeys(object_ids)), list(dict.fromkeys(legacy_ids))
+
+
+def fetch_products_by_ids(db, product_ids, projection=None):
+    """Load all products referenced by ``product_ids`` with a single ``$in`` query.
+
+    Returns a dict mapping each requested id (as a string) to its product
+    document.  ``_id`` matches win over legacy ``id`` matches, mirroring the
+    per-item lookups this replaces.
+    """
+    object_ids, legacy_ids = _split_ids(product_ids)
+    if not object_ids and not legacy_ids:
+        return {}
+
+    or_filters = []
+    if object_ids:
+        or_filters.append({'_id': {'$in': object_ids}})
+    if legacy_ids:
+        or_filters.append({'id': {'$in': legacy_ids}})
+
+    by_object_id = {}
+    by_legacy_id = {}
+    for doc in db.products.find({'$or': or_filters}, projection):
+        by_object_id[str(doc.get('_id'))] = doc
+        if doc.get('id') is not None:
+            by_legacy_id.setdefault(str(doc['id']), doc)
+
+    resolved = {}
+    for pid in product_ids:
+        key = str(pid)
+        doc = by_object_id.get(key) or by_legacy_id.get(key)
+        if doc is not None:
+            resolved[key] = doc
+    return resolved
+
+
+def fetch_users_by_refs(db, refs, projection=None):
+    """Load all users referenced by ``refs`` (app ``id`` or ObjectId) in one query.
+
+    Returns a dict mapping each ref (as a string) to its user document.
+    Matches on the app-level ``id`` field take precedence over ``_id``.
+    """
+    object_ids, legacy_ids = _split_ids(refs)
+    if not object_ids and not legacy_ids:
+        return {}
+
+    or_filters = []
+    if legacy_ids:
+        or_filters.append({'id': {'$in': legacy_ids}})
+    if object_ids:
+        or_filters.append({'_id': {'$in': object_ids}})
+
+    by_app_id = {}
+    by_object_id = {}
+    for doc in db.users.find({'$or': or_filters}, projection):
+        if doc.get('id') is not None:
+            by_app_id.setdefault(str(doc['id']), doc)
+        by_object_id[str(doc.get('_id'))] = doc
+
+    resolved = {}
+    for ref in refs:
+        key = str(ref)
+        doc = by_app_id.get(key) or by_object_id.get(key)
+        if doc is not None:
+            resolved[key] = doc
+    return resolved
+
+
+def product_farmer_ref(product):
+    """Return the farmer reference stored on a product document, if any."""
+    return product.get('farmer') or product.get('farmer_id') or product.get('farmer_user_id')
+
+
+def hydrate_cart(db, cart_doc, include_farmers=True):
+    """Resolve the products (and optionally farmers) for every line of a cart.
+
+    Costs at most two queries regardless of cart size.  Returns a list of
+    dicts with ``product_id``, ``quantity``, ``price``, ``product`` and
+    ``farmer`` (the raw farmer user document or ``None``).  Lines whose
+    product no longer exists are dropped.
+    """
+    if not cart_doc:
+        return []
+
+    cart_items = cart_doc.get('items', []) or []
+    products = fetch_products_by_ids(db, [item.get('product_id') for item in cart_items])
+
+    farmers = {}
+    if include_farmers and products:
+        farmer_refs = [product_farmer_ref(p) for p in products.values()]
+        farmers = fetch_users_by_refs(db, [ref for ref in farmer_refs if ref])
+
+    lines = []
+    for item in cart_items:
+        product_id = item.get('product_id')
+        product = products.get(str(product_id))
+        if not product:
+            continue
+
+        farmer_ref = product_farmer_ref(product)
+        lines.append({
+            'product_id': product_id,
+            'quantity': int(item.get('quantity', 1)),
+            'price': float(product.get('price', 0) or 0),
+            'product': product,
+            'farmer': farmers.get(str(farmer_ref)) if farmer_ref else None,
+        })
+    return lines
@@ -0,0 +1,171 @@
+"""
+Product catalog listing: filter building, projection and keyset pagination
+for the public product endpoints.
+
+Pagination is opt-in: without ``limit`` or ``cursor`` the listing returns
+every matching product, as it always has, so existing clients keep getting
+the full catalogue.
+"""
+import base64
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = 60
+MAX_PAGE_SIZE = 200
+
+# Only the fields ``/api/products`` actually emits are pulled from MongoDB.
+LISTING_PROJECTION = {
+    'name': 1,
+    'description': 1,
+    'price': 1,
+    'image': 1,
+    'farmer_name': 1,
+    'category': 1,
+    'quantity': 1,
+    'unit': 1,
+    'location': 1,
+    'created_at': 1,
+}
+
+LISTING_SORT = [('created_at', DESCENDING), ('_id', DESCENDING)]
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(doc):
+    """Build an opaque cursor pointing just past ``doc`` in ``LISTING_SORT`` order.
+
+    A missing ``created_at`` is encoded as empty (those documents sort last).
+    Any other non-datetime value has no place in the keyset order, so it is
+    rejected rather than silently treated as missing.
+    """
+    created_at = doc.get('created_at')
+    if created_at is None:
+        ts = ''
+    elif isinstance(created_at, datetime):
+        ts = created_at.isoformat()
+    else:
+        raise ValueError(f"product {doc['_id']} has a non-datetime created_at ({type(created_at).__name__})")
+    raw = f"{ts}|{doc['_id']}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at or None, ObjectId)`` for a cursor from ``encode_cursor``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        ts, oid = raw.split('|', 1)
+        created_at = datetime.fromisoformat(ts) if ts else None
+        if not ObjectId.is_valid(oid):
+            raise ValueError('bad object id')
+        return created_at, ObjectId(oid)
+    except Exception as e:
+        raise InvalidCursor(f'Invalid cursor: {e}')
+
+
+def _keyset_filter(cursor):
+    created_at, last_id = decode_cursor(cursor)
+    if created_at is None:
+        # Documents without created_at sort last; page through them by _id.
+        return {'created_at': None, '_id': {'$lt': last_id}}
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, '_id': {'$lt': last_id}},
+        {'created_at': None},
+    ]}
+
+
+def build_listing_query(category=None, min_price=None, max_price=None, farmer=None):
+    """Build the MongoDB filter for the available-products listing."""
+    clauses = [{'available': True}]
+    if category:
+        clauses.append({'category': category})
+    price = {}
+    if min_price is not None:
+        price['$gte'] = min_price
+    if max_price is not None:
+        price['$lte'] = max_price
+    if price:
+        clauses.append({'price': price})
+    if farmer:
+        clauses.append({'$or': [{'farmer': farmer}, {'farmer_user_id': farmer}]})
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def parse_listing_args(args):
+    """Parse listing params from a request args mapping.
+
+    Returns ``(filters, limit, cursor)``; ``limit`` is ``None`` (no
+    pagination) when neither ``limit`` nor ``cursor`` is given.  Raises
+    ``ValueError`` on bad input.
+    """
+    def _float(name):
+        value = (args.get(name) or '').strip()
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f'{name} must be a number')
+
+    filters = {
+        'category': (args.get('category') or '').strip() or None,
+        'min_price': _float('min_price'),
+        'max_price': _float('max_price'),
+        'farmer': (args.get('farmer') or '').strip() or None,
+    }
+
+    cursor = (args.get('cursor') or '').strip() or None
+    limit_raw = (args.get('limit') or '').strip()
+    if not limit_raw and not cursor:
+        return filters, None, None
+    try:
+        limit = int(limit_raw) if limit_raw else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError('limit must be a whole number')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return filters, limit, cursor
+
+
+def list_products_page(db, filters, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """Fetch one page of available products (all of them when ``limit`` is ``None``).
+
+    Returns ``(docs, next_cursor)``; ``next_cursor`` is ``None`` on the last
+    page.  One extra document is read to know whether another page exists.
+    """
+    query = build_listing_query(**filters)
+    if limit is None:
+        return list(db.products.find(query, LISTING_PROJECTION).sort(LISTING_SORT)), None
+    if cursor:
+        query = {'$and': [query, _keyset_filter(cursor)]}
+
+    docs = list(
+        db.products.find(query, LISTING_PROJECTION)
+        .sort(LISTING_SORT)
+        .limit(limit + 1)
+    )
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1])
+    return docs, next_cursor
+
+
+def serialize_listing_product(p):
+    """Shape a product document the way ``GET /api/products`` returns it."""
+    return {
+        'id': str(p.get('_id', '')),
+        'name': p.get('name', ''),
+        'description': p.get('description', ''),
+        'price': p.get('price', 0),
+        'image': p.get('image', ''),
+        'farmer_name': p.get('farmer_name', ''),
+        'category': p.get('category', ''),
+        'quantity': p.get('quantity', 0),
+        'unit': p.get('unit', ''),
+        'location': p.get('location', ''),
+    }
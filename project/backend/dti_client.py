@@ -0,0 +1,202 @@
+"""
+HTTP access to the DTI BNRS registration pages referenced by permit QR codes.
+
+``ImageVerificationSystem.validate_with_dti`` goes through this module
+instead of calling ``requests.get`` directly:
+
+* one keep-alive ``requests.Session`` per process, with a pooled adapter, so
+  repeated lookups against the BNRS host reuse TCP/TLS connections;
+* ``dti_page_cache``, a ``TTLCache`` of parsed page details keyed by the
+  normalised URL.  Confirmed registrations are kept for ``DTI_CACHE_TTL``
+  seconds, definitive negatives (404, pages without DTI markers) for the
+  shorter ``DTI_NEGATIVE_TTL``; transport errors, throttling (403/429) and
+  any other error status are never cached;
+* ``dti_breaker``, a circuit breaker that opens after
+  ``DTI_BREAKER_THRESHOLD`` consecutive transport failures (5xx and 429
+  answers count too).  While it is open
+  lookups fail immediately as unreachable (so the submission falls through
+  to manual review) instead of waiting out the timeout; after
+  ``DTI_BREAKER_COOLDOWN`` seconds a single probe request is let through.
+
+State is per process (each verification worker has its own).
+"""
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import TTLCache
+
+DTI_CONNECT_TIMEOUT = float(os.environ.get('DTI_CONNECT_TIMEOUT') or 5)
+DTI_READ_TIMEOUT = float(os.environ.get('DTI_READ_TIMEOUT') or 15)
+DTI_CACHE_TTL = float(os.environ.get('DTI_CACHE_TTL') or 6 * 3600)
+DTI_NEGATIVE_TTL = float(os.environ.get('DTI_NEGATIVE_TTL') or 600)
+DTI_BREAKER_THRESHOLD = int(os.environ.get('DTI_BREAKER_THRESHOLD') or 3)
+DTI_BREAKER_COOLDOWN = float(os.environ.get('DTI_BREAKER_COOLDOWN') or 60)
+
+# BNRS answers these when it throttles or its WAF blocks us; they say
+# nothing about the registration.
+THROTTLED_STATUSES = (403, 429)
+
+DTI_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.0.0 Safari/537.36'
+    ),
+    'Accept': 'text/html,application/xhtml+xml,*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide keep-alive session used for BNRS requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(DTI_HEADERS)
+            _session = session
+        return _session
+
+
+def normalize_url(url):
+    """Canonical cache key for a QR URL: lower-case host, sorted query, no fragment."""
+    parts = urlsplit((url or '').strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower().rstrip('.'), path, query, ''))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    def __init__(self, threshold=DTI_BREAKER_THRESHOLD, cooldown=DTI_BREAKER_COOLDOWN, name='breaker'):
+        self.threshold = int(threshold)
+        self.cooldown = float(cooldown)
+        self.name = name
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Return ``True`` if a request may be attempted now."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    print(f"⚠️ {self.name} circuit opened after {self._failures} failure(s)")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """End an attempt that says nothing about the service's health."""
+        with self._lock:
+            self._probing = False
+
+    def retry_after(self):
+        """Seconds until the next probe is allowed (0 when closed)."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+
+dti_page_cache = TTLCache(maxsize=2048, ttl=DTI_CACHE_TTL, name='dti_pages')
+dti_breaker = CircuitBreaker(name='DTI BNRS')
+
+
+# Raised before anything reaches BNRS (the URL from the QR code is malformed),
+# so they must not count against the breaker.
+_REQUEST_INPUT_ERRORS = (
+    requests.exceptions.InvalidURL,
+    requests.exceptions.InvalidSchema,
+    requests.exceptions.MissingSchema,
+    requests.exceptions.URLRequired,
+)
+
+
+class DTIUnavailable(Exception):
+    """BNRS could not be asked: the breaker is open or the request failed in transit."""
+
+
+def fetch_page(url):
+    """GET ``url`` through the pooled session, feeding ``dti_breaker``.
+
+    Returns the response.  Raises ``DTIUnavailable`` when the breaker is open
+    and re-raises ``requests`` errors after recording them; every attempt,
+    including a half-open probe, ends in a success, a failure or (for a
+    malformed URL) a release.  A 5xx or 429 answer counts as a failure for
+    the breaker but is returned.
+    """
+    if not dti_breaker.allow():
+        raise DTIUnavailable(
+            f"DTI BNRS is temporarily unavailable (retrying in {dti_breaker.retry_after():.0f}s)."
+        )
+    try:
+        resp = get_session().get(
+            url, timeout=(DTI_CONNECT_TIMEOUT, DTI_READ_TIMEOUT), allow_redirects=True,
+        )
+    except _REQUEST_INPUT_ERRORS:
+        dti_breaker.release()
+        raise
+    except BaseException:
+        # Timeouts, refused connections, redirect loops, truncated bodies...
+        dti_breaker.record_failure()
+        raise
+    if resp.status_code >= 500 or resp.status_code == 429:
+        dti_breaker.record_failure()
+    elif resp.status_code == 403:
+        dti_breaker.release()
+    else:
+        dti_breaker.record_success()
+    return resp
+
+
+def cache_ttl(valid, details):
+    """How long to keep a parsed lookup, or ``None`` if it should not be cached.
+
+    Only a confirmed registration, a 404 and a 200 page without DTI markers
+    are definitive; anything else (throttling, other errors) is retried.
+    """
+    if not details.get('reachable'):
+        return None
+    if valid:
+        return DTI_CACHE_TTL
+    if details.get('http_status') in (200, 404):
+        return DTI_NEGATIVE_TTL
+    return None
@@ -0,0 +1,233 @@
+"""
+Persistent email outbox delivered by a background worker pool.
+
+Request handlers call ``enqueue_email``, which stores the message in the
+``email_outbox`` collection and returns immediately.  ``start_email_workers``
+(called once from ``app.py``) runs ``EMAIL_WORKERS`` threads per process that
+claim pending messages atomically, send them over a long-lived authenticated
+SMTP connection and retry failures with exponential backoff.  Because the
+claim is a single ``find_one_and_update``, several gunicorn workers can share
+one outbox safely; a message whose sender died mid-send is reclaimed once its
+lease expires.
+"""
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, ReturnDocument
+
+from helpers import build_email_message, open_smtp_connection, smtp_settings
+
+OUTBOX_COLLECTION = 'email_outbox'
+
+EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS') or 2)
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS') or 6)
+EMAIL_RETRY_BASE = float(os.environ.get('EMAIL_RETRY_BASE') or 30)
+EMAIL_RETRY_MAX = float(os.environ.get('EMAIL_RETRY_MAX') or 3600)
+EMAIL_POLL_INTERVAL = float(os.environ.get('EMAIL_POLL_INTERVAL') or 10)
+EMAIL_LEASE_SECONDS = 120
+# Servers drop idle sessions; probe with NOOP before reusing an older one.
+SMTP_IDLE_CHECK = 60
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def enqueue_email(db, to_email, subject, body, attachments=None, html_body=None, receipt_order_id=None):
+    """Store a message in the outbox and wake the workers.
+
+    Takes the same arguments as ``helpers.send_system_email`` (minus the app).
+    ``receipt_order_id`` attaches that order's receipt PDF at send time, so
+    the request never waits on rendering.  Returns the outbox id, or ``None``
+    when there is no recipient.
+    """
+    if not to_email:
+        return None
+    now = datetime.utcnow()
+    result = db[OUTBOX_COLLECTION].insert_one({
+        'to': to_email,
+        'subject': subject,
+        'body': body,
+        'html_body': html_body,
+        'receipt_order_id': str(receipt_order_id) if receipt_order_id else None,
+        'attachments': [
+            {
+                'filename': att.get('filename'),
+                'content': att.get('content'),
+                'maintype': att.get('maintype', 'application'),
+                'subtype': att.get('subtype', 'octet-stream'),
+            }
+            for att in (attachments or [])
+        ],
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'last_error': None,
+        'created_at': now,
+        'updated_at': now,
+    })
+    _wakeup.set()
+    return result.inserted_id
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retry number ``attempts`` (1-based)."""
+    return min(EMAIL_RETRY_MAX, EMAIL_RETRY_BASE * (2 ** max(0, attempts - 1)))
+
+
+def claim_next(db):
+    """Atomically lease the oldest due message, or return ``None``."""
+    now = datetime.utcnow()
+    return db[OUTBOX_COLLECTION].find_one_and_update(
+        {'$or': [
+            {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+            {'status': 'sending', 'lease_expires_at': {'$lte': now}},
+        ]},
+        {'$set': {
+            'status': 'sending',
+            'lease_expires_at': now + timedelta(seconds=EMAIL_LEASE_SECONDS),
+            'updated_at': now,
+        }},
+        sort=[('next_attempt_at', ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+class SMTPConnection:
+    """One authenticated SMTP session, reopened when the server drops it."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        self.close()
+        self._server = open_smtp_connection(self.settings)
+
+    def _alive(self):
+        if self._server is None:
+            return False
+        if time.monotonic() - self._last_used < SMTP_IDLE_CHECK:
+            return True
+        try:
+            return self._server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, msg):
+        if not self._alive():
+            self._connect()
+        try:
+            self._server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Stale session the NOOP probe did not catch; retry once on a new one.
+            self._connect()
+            self._server.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+        self._server = None
+
+
+def deliver(db, settings, connection, doc):
+    """Send one claimed outbox message and record the outcome."""
+    now = datetime.utcnow()
+    try:
+        attachments = list(doc.get('attachments') or [])
+        if doc.get('receipt_order_id'):
+            from receipts import get_receipt_pdf, receipt_filename
+
+            receipt_pdf = get_receipt_pdf(db, doc['receipt_order_id'])
+            if receipt_pdf:
+                attachments.append({
+                    'filename': receipt_filename(doc['receipt_order_id']),
+                    'content': receipt_pdf,
+                    'maintype': 'application',
+                    'subtype': 'pdf',
+                })
+        msg = build_email_message(
+            settings['sender'], doc['to'], doc['subject'], doc['body'],
+            attachments=attachments, html_body=doc.get('html_body'),
+        )
+        connection.send(msg)
+    except Exception as e:
+        attempts = int(doc.get('attempts', 0)) + 1
+        failed = attempts >= EMAIL_MAX_ATTEMPTS
+        db[OUTBOX_COLLECTION].update_one({'_id': doc['_id']}, {'$set': {
+            'status': 'failed' if failed else 'pending',
+            'attempts': attempts,
+            'last_error': str(e),
+            'next_attempt_at': now + timedelta(seconds=retry_delay(attempts)),
+            'updated_at': now,
+        }, '$unset': {'lease_expires_at': ''}})
+        print(f"{'❌' if failed else '⚠️'} Email to {doc['to']} failed (attempt {attempts}): {e}")
+        connection.close()
+        return False
+
+    db[OUTBOX_COLLECTION].update_one({'_id': doc['_id']}, {'$set': {
+        'status': 'sent',
+        'attempts': int(doc.get('attempts', 0)) + 1,
+        'sent_at': now,
+        'updated_at': now,
+        # Attachments are only needed until delivery; keep sent docs small.
+        'attachments': [],
+    }, '$unset': {'lease_expires_at': ''}})
+    return True
+
+
+def _worker_loop(app):
+    from db import get_mongodb_db
+
+    connection = None
+    with app.app_context():
+        while True:
+            try:
+                settings = smtp_settings(app)
+                db, _ = get_mongodb_db()
+                if settings is None or db is None:
+                    # Not _wakeup.wait(): once set, the event would never block again.
+                    time.sleep(EMAIL_POLL_INTERVAL)
+                    continue
+                if connection is None:
+                    connection = SMTPConnection(settings)
+
+                doc = claim_next(db)
+                if doc is None:
+                    if _wakeup.wait(EMAIL_POLL_INTERVAL):
+                        _wakeup.clear()
+                    continue
+                deliver(db, settings, connection, doc)
+            except Exception as e:
+                print(f"⚠️ Email worker error: {e}")
+                time.sleep(EMAIL_POLL_INTERVAL)
+
+
+def start_email_workers(app, workers=EMAIL_WORKERS):
+    """Start the outbox delivery threads for this process (idempotent)."""
+    with _workers_lock:
+        if _workers:
+            return len(_workers)
+        for i in range(max(0, int(workers))):
+            thread = threading.Thread(target=_worker_loop, args=(app,), name=f'email-outbox-{i}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+    if _workers:
+        print(f"✅ Email outbox started with {len(_workers)} worker(s)")
+    return len(_workers)
+
+
+def outbox_stats(db):
+    """Message counts per outbox status."""
+    rows = db[OUTBOX_COLLECTION].aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}])
+    return {row['_id']: row['count'] for row in rows}
@@ -0,0 +1,82 @@
+"""
+Product facet counts (categories, price ranges, farms, locations) computed
+in a single aggregation over available products and cached in
+``cache.facet_cache`` until the next product write.
+"""
+from cache import facet_cache
+
+# Upper-exclusive price bucket boundaries, in PHP.
+PRICE_BOUNDARIES = [0, 50, 100, 250, 500, 1000]
+_FACETS_KEY = 'product_facets'
+
+
+def _price_label(lower, upper):
+    return f"₱{lower}–₱{upper}" if upper is not None else f"₱{lower}+"
+
+
+def _build_pipeline():
+    def _group_count(field):
+        return [
+            {'$match': {field: {'$nin': [None, '']}}},
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1, '_id': 1}},
+        ]
+
+    return [
+        {'$match': {'available': True}},
+        {'$facet': {
+            'categories': _group_count('category'),
+            'farms': _group_count('farm_name'),
+            'locations': _group_count('location'),
+            'prices': [
+                # The default bucket is only for prices above the last
+                # boundary, so negative, NaN and non-numeric prices stay out.
+                {'$match': {'price': {'$type': 'number', '$gte': 0}}},
+                {'$bucket': {
+                    'groupBy': '$price',
+                    'boundaries': PRICE_BOUNDARIES,
+                    'default': 'over',
+                    'output': {'count': {'$sum': 1}},
+                }},
+            ],
+            'total': [{'$count': 'count'}],
+        }},
+    ]
+
+
+def compute_product_facets(db):
+    """Run the facet aggregation and shape it for the API (uncached)."""
+    raw = next(db.products.aggregate(_build_pipeline()), {}) or {}
+
+    def _named(rows):
+        return [{'name': row['_id'], 'count': row['count']} for row in rows]
+
+    counts_by_lower = {row['_id']: row['count'] for row in raw.get('prices', [])}
+    price_ranges = []
+    for lower, upper in zip(PRICE_BOUNDARIES, PRICE_BOUNDARIES[1:]):
+        price_ranges.append({
+            'label': _price_label(lower, upper),
+            'min': lower,
+            'max': upper,
+            'count': counts_by_lower.get(lower, 0),
+        })
+    price_ranges.append({
+        'label': _price_label(PRICE_BOUNDARIES[-1], None),
+        'min': PRICE_BOUNDARIES[-1],
+        'max': None,
+        'count': counts_by_lower.get('over', 0),
+    })
+
+    total = raw.get('total') or [{'count': 0}]
+    return {
+        'categories': _named(raw.get('categories', [])),
+        'price_ranges': price_ranges,
+        'farms': _named(raw.get('farms', [])),
+        'locations': _named(raw.get('locations', [])),
+        'total': total[0]['count'],
+    }
+
+
+def get_product_facets(db):
+    """Return cached facets, recomputing after a product write or TTL expiry."""
+    return facet_cache.get_or_load(_FACETS_KEY, lambda: compute_product_facets(db))
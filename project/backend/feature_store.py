@@ -0,0 +1,148 @@
+"""
+On-disk cache of permit feature vectors for training.
+
+``train_permit_model.py`` re-extracts features for every original and
+augmented image on each run, although most files do not change between
+runs.  ``FeatureStore`` keeps one float32 matrix (``<key>.npy``, opened
+memory-mapped) plus a JSON index mapping each image's SHA-256 to its row.
+``key`` combines the extractor's feature schema version and a digest of its
+feature names, so changing either starts a fresh store and stale vectors
+are never mixed into a training set.
+
+    store = FeatureStore(FEATURE_CACHE_DIR, extractor)
+    X, ok_paths, failures = store.extract(paths, workers=4)
+
+Only images whose content is not in the store are extracted.  Read failures
+are not cached, so they are retried on the next run.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from permit_feature_extractor import feature_names
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def feature_version_key(schema_version):
+    names_digest = hashlib.sha256('\n'.join(feature_names(schema_version)).encode()).hexdigest()[:12]
+    return f"features-s{schema_version}-{names_digest}"
+
+
+class FeatureStore:
+    """Content-addressed feature vectors for one extractor configuration."""
+
+    def __init__(self, directory, extractor):
+        self.directory = directory
+        self.extractor = extractor
+        self.key = feature_version_key(extractor.schema_version)
+        self.width = len(extractor.feature_names)
+        self.matrix_path = os.path.join(directory, f'{self.key}.npy')
+        self.index_path = os.path.join(directory, f'{self.key}.index.json')
+        self._matrix = None
+        self._index = None
+        self._used = set()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _load(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._matrix = np.zeros((0, self.width), dtype=np.float32)
+        if not (os.path.exists(self.index_path) and os.path.exists(self.matrix_path)):
+            return
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            print(f"  [WARN] Ignoring unreadable feature cache {self.key}: {e}")
+            return
+        if matrix.ndim != 2 or matrix.shape[1] != self.width or \
+                any(row >= matrix.shape[0] for row in index.values()):
+            print(f"  [WARN] Feature cache {self.key} is inconsistent; rebuilding")
+            return
+        self._index, self._matrix = index, matrix
+
+    def _save(self, matrix, index):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_matrix = self.matrix_path + '.tmp.npy'
+        tmp_index = self.index_path + '.tmp'
+        np.save(tmp_matrix, matrix)
+        with open(tmp_index, 'w') as f:
+            json.dump(index, f)
+        # Release the old memory map so the file can be replaced (Windows).
+        self._matrix = None
+        # Matrix first: an index never points past the rows on disk.
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_index, self.index_path)
+        self._matrix = np.load(self.matrix_path, mmap_mode='r')
+        self._index = index
+
+    def __len__(self):
+        self._load()
+        return len(self._index)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def extract(self, paths, workers=None):
+        """Like ``PermitFeatureExtractor.extract_batch``, served from the store.
+
+        Returns ``(X, ok_paths, failures)`` in input order.
+        """
+        self._load()
+        paths = list(paths)
+        hashes = {}
+        failures = []
+        for path in paths:
+            try:
+                hashes[path] = file_sha256(path)
+            except OSError as e:
+                failures.append((path, str(e)))
+
+        missing, seen = [], set()
+        for path, digest in hashes.items():
+            if digest not in self._index and digest not in seen:
+                seen.add(digest)
+                missing.append(path)
+
+        if missing:
+            X_new, new_paths, new_failures = self.extractor.extract_batch(missing, workers=workers)
+            failures.extend(new_failures)
+            if new_paths:
+                index = dict(self._index)
+                base = self._matrix.shape[0]
+                for i, path in enumerate(new_paths):
+                    index[hashes[path]] = base + i
+                self._save(np.vstack([np.asarray(self._matrix), X_new]), index)
+
+        failed = {path for path, _ in failures}
+        ok_paths = [p for p in paths if p not in failed and hashes.get(p) in self._index]
+        self._used.update(hashes[p] for p in ok_paths)
+        rows = [self._index[hashes[p]] for p in ok_paths]
+        X = np.asarray(self._matrix[rows], dtype=np.float32).reshape(len(rows), self.width)
+        print(f"   Feature cache: {len(paths) - len(missing)} hit(s), {len(missing)} extracted")
+        return X, ok_paths, failures
+
+    def compact(self):
+        """Drop vectors not used by any ``extract`` call on this store (e.g. replaced augmentations)."""
+        self._load()
+        live = [(digest, row) for digest, row in self._index.items() if digest in self._used]
+        if len(live) == len(self._index):
+            return 0
+        removed = len(self._index) - len(live)
+        matrix = np.asarray(self._matrix[[row for _, row in live]], dtype=np.float32)
+        self._save(matrix.reshape(len(live), self.width),
+                   {digest: i for i, (digest, _) in enumerate(live)})
+        return removed
@@ -1,6 +1,7 @@
 """
 Utility helpers: email sending, PDF receipt generation, file helpers.
 """
+import functools
 import io
 import os
 import smtplib
@@ -20,22 +21,25 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def send_system_email(app, to_email, subject, body, attachments=None, html_body=None):
-    """Send an email using the app's SMTP settings."""
-    mail_user = app.config.get('MAIL_USERNAME')
-    mail_pass = app.config.get('MAIL_PASSWORD')
-    mail_server = app.config.get('MAIL_SERVER')
-    mail_port = app.config.get('MAIL_PORT')
-    mail_use_tls = app.config.get('MAIL_USE_TLS')
-    mail_sender = app.config.get('MAIL_DEFAULT_SENDER')
-
-    if not all([mail_user, mail_pass, mail_server, mail_port, mail_sender]):
-        print("Email not configured: missing SMTP settings.")
-        return False
+def smtp_settings(app):
+    """Return the app's SMTP settings, or ``None`` when email is not configured."""
+    settings = {
+        'username': app.config.get('MAIL_USERNAME'),
+        'password': app.config.get('MAIL_PASSWORD'),
+        'server': app.config.get('MAIL_SERVER'),
+        'port': app.config.get('MAIL_PORT'),
+        'use_tls': app.config.get('MAIL_USE_TLS'),
+        'sender': app.config.get('MAIL_DEFAULT_SENDER'),
+    }
+    if not all(settings[k] for k in ('username', 'password', 'server', 'port', 'sender')):
+        return None
+    return settings
 
+
+def build_email_message(sender, to_email, subject, body, attachments=None, html_body=None):
     msg = EmailMessage()
     msg['Subject'] = subject
-    msg['From'] = mail_sender
+    msg['From'] = sender
     msg['To'] = to_email
     msg.set_content(body)
     if html_body:
@@ -49,18 +53,44 @@ def send_system_email(app, to_email, subject, body, attachments=None, html_body=
             subtype = att.get('subtype', 'octet-stream')
             if fn and content:
                 msg.add_attachment(content, maintype=maintype, subtype=subtype, filename=fn)
+    return msg
+
 
+def open_smtp_connection(settings):
+    """Open and authenticate an SMTP connection from ``smtp_settings``."""
+    context = ssl.create_default_context()
+    if settings['use_tls']:
+        server = smtplib.SMTP(settings['server'], settings['port'])
+        try:
+            server.starttls(context=context)
+        except Exception:
+            server.close()
+            raise
+    else:
+        server = smtplib.SMTP_SSL(settings['server'], settings['port'], context=context)
     try:
-        context = ssl.create_default_context()
-        if mail_use_tls:
-            with smtplib.SMTP(mail_server, mail_port) as server:
-                server.starttls(context=context)
-                server.login(mail_user, mail_pass)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP_SSL(mail_server, mail_port, context=context) as server:
-                server.login(mail_user, mail_pass)
-                server.send_message(msg)
+        server.login(settings['username'], settings['password'])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def send_system_email(app, to_email, subject, body, attachments=None, html_body=None):
+    """Send an email synchronously using the app's SMTP settings.
+
+    Request handlers should use ``email_outbox.enqueue_email`` instead so the
+    SMTP round trips happen off the request path.
+    """
+    settings = smtp_settings(app)
+    if not settings:
+        print("Email not configured: missing SMTP settings.")
+        return False
+
+    msg = build_email_message(settings['sender'], to_email, subject, body, attachments, html_body)
+    try:
+        with open_smtp_connection(settings) as server:
+            server.send_message(msg)
         return True
     except Exception as e:
         print(f"Email send error: {e}")
@@ -97,7 +127,23 @@ def build_email_html(title, subtitle, content_html, badge_text=None):
     """
 
 
-def generate_receipt_pdf(order_id, buyer_name, buyer_email, items, total_amount):
+_RECEIPT_LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'images', 'farm.jpg')
+
+
+@functools.lru_cache(maxsize=1)
+def _receipt_logo():
+    """Decode the receipt logo once per process (``None`` if unavailable)."""
+    if not os.path.exists(_RECEIPT_LOGO_PATH):
+        return None
+    try:
+        logo = ImageReader(_RECEIPT_LOGO_PATH)
+        logo.getRGBData()  # force the decode now rather than on first draw
+        return logo
+    except Exception:
+        return None
+
+
+def generate_receipt_pdf(order_id, buyer_name, buyer_email, items, total_amount, issued_at=None):
     buffer = io.BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter
@@ -108,10 +154,9 @@ def generate_receipt_pdf(order_id, buyer_name, buyer_email, items, total_amount)
     pdf.setFillColorRGB(0.17, 0.48, 0.17)
     pdf.rect(0, height - 80, width, 80, stroke=0, fill=1)
     pdf.setFillColorRGB(1, 1, 1)
-    logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'images', 'farm.jpg')
-    if os.path.exists(logo_path):
+    logo = _receipt_logo()
+    if logo is not None:
         try:
-            logo = ImageReader(logo_path)
             pdf.drawImage(logo, margin_x, height - 70, width=42, height=42, mask='auto')
         except Exception:
             pass
@@ -127,7 +172,7 @@ def generate_receipt_pdf(order_id, buyer_name, buyer_email, items, total_amount)
     pdf.drawString(margin_x, top - 40, f"Order ID: {order_id}")
     pdf.drawString(margin_x, top - 55, f"Customer: {buyer_name}")
     pdf.drawString(margin_x, top - 70, f"Email: {buyer_email}")
-    pdf.drawString(margin_x, top - 85, f"Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
+    pdf.drawString(margin_x, top - 85, f"Date: {(issued_at or datetime.utcnow()).strftime('%Y-%m-%d %H:%M UTC')}")
 
     pdf.setStrokeColorRGB(0.9, 0.9, 0.9)
     pdf.line(margin_x, top - 95, width - margin_x, top - 95)
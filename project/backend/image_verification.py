@@ -25,11 +25,19 @@ from PIL import Image, ImageEnhance, ImageFilter
 import os
 import re
 import json
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 from urllib.parse import urlparse
 from difflib import SequenceMatcher
 
+import dti_client
+import ocr_pool
+import permit_inference
+from permit_image import PermitImage
+
 try:
     from pyzbar.pyzbar import decode as pyzbar_decode
     from pyzbar.pyzbar import ZBarSymbol
@@ -64,6 +72,21 @@ try:
 except ImportError:
     JOBLIB_AVAILABLE = False
 
+# Parallel QR scanning: pyzbar (ctypes) and OpenCV release the GIL, so
+# preprocessing variants can be decoded on threads.  1 disables fan-out.
+QR_SCAN_WORKERS = int(os.environ.get('QR_SCAN_WORKERS') or min(4, os.cpu_count() or 1))
+
+_qr_executor = None
+_qr_executor_lock = threading.Lock()
+
+
+def _get_qr_executor():
+    global _qr_executor
+    with _qr_executor_lock:
+        if _qr_executor is None:
+            _qr_executor = ThreadPoolExecutor(max_workers=QR_SCAN_WORKERS, thread_name_prefix='qr-scan')
+        return _qr_executor
+
 
 class ImageVerificationSystem:
     """QR-code + ML + Name-cross-check DTI business permit verification."""
@@ -94,7 +117,30 @@ class ImageVerificationSystem:
         # --- Load trained ML model ---
         self.ml_model = None
         self.ml_extractor = None
-        self._load_ml_model()
+        # Client for the resident inference server (permit_inference.py)
+        # when PERMIT_INFERENCE_ADDRESS is set; the model is then not loaded here.
+        self.inference = None
+        # Content hash of permit_classifier.pkl; keys cached results so they
+        # are dropped automatically when the model is retrained.
+        self.model_version = 'no-model'
+        if not (permit_inference.INFERENCE_ADDRESS and self._connect_inference()):
+            self._load_ml_model()
+
+    def _connect_inference(self):
+        """Use the resident inference server if it is reachable."""
+        try:
+            client = permit_inference.InferenceClient()
+            info = client.info()
+            from permit_feature_extractor import PermitFeatureExtractor
+            self.ml_extractor = PermitFeatureExtractor(schema_version=info['schema_version'])
+        except Exception as e:
+            print(f"⚠️  Permit inference server unavailable ({e}); loading the model locally.")
+            self.ml_extractor = None
+            return False
+        self.inference = client
+        self.model_version = info['model_version']
+        print(f"✅ Using permit inference server {client.address} (version {self.model_version})")
+        return True
 
     def _load_ml_model(self):
         """Attempt to load the trained permit classifier from disk."""
@@ -102,31 +148,44 @@ class ImageVerificationSystem:
             print("⚠️  joblib not available – ML classifier disabled.")
             return
 
-        model_path = os.path.join(
-            os.path.dirname(os.path.abspath(__file__)),
-            'ml_models', 'permit_classifier.pkl',
-        )
-        if not os.path.exists(model_path):
+        if not os.path.exists(permit_inference.MODEL_PATH):
             print("ℹ️  No trained ML model found at ml_models/permit_classifier.pkl")
             print("   Run 'python train_permit_model.py' to train one.")
             return
 
         try:
-            self.ml_model = joblib.load(model_path)
+            self.ml_model, schema_version, self.model_version = permit_inference.load_permit_classifier()
             from permit_feature_extractor import PermitFeatureExtractor
-            self.ml_extractor = PermitFeatureExtractor()
-            print("✅ ML permit classifier loaded!")
+            self.ml_extractor = PermitFeatureExtractor(schema_version=schema_version)
+            print(f"✅ ML permit classifier loaded! (version {self.model_version}, "
+                  f"feature schema {schema_version})")
         except Exception as e:
             print(f"⚠️  Failed to load ML model: {e}")
             self.ml_model = None
             self.ml_extractor = None
+            self.model_version = 'no-model'
 
     # ------------------------------------------------------------------
     # ML Prediction
     # ------------------------------------------------------------------
+    def _classify(self, vec):
+        """Return ``(label, confidence)`` for one feature vector."""
+        if self.inference is not None:
+            try:
+                labels, confidences = self.inference.predict(vec)
+                return labels[0], confidences[0]
+            except permit_inference.InferenceUnavailable as e:
+                print(f"⚠️  Permit inference server failed ({e}); falling back to the local model.")
+                self.inference = None
+                self._load_ml_model()
+                if self.ml_model is None:
+                    raise
+        labels, confidences = permit_inference.score_matrix(self.ml_model, vec)
+        return labels[0], float(confidences[0])
+
     def predict_permit_ml(self, image_path):
         """
-        Run the trained ML model on the image.
+        Run the trained ML model on the image (a path or ``PermitImage``).
         Returns dict with is_permit (bool), confidence (float 0-1), label.
         """
         result = {
@@ -135,7 +194,7 @@ class ImageVerificationSystem:
             'confidence': 0.0,
             'label': 'unknown',
         }
-        if self.ml_model is None or self.ml_extractor is None:
+        if (self.ml_model is None and self.inference is None) or self.ml_extractor is None:
             return result
 
         try:
@@ -144,18 +203,12 @@ class ImageVerificationSystem:
                 return result
 
             vec = self.ml_extractor.features_to_vector(features).reshape(1, -1)
-            prediction = self.ml_model.predict(vec)[0]
-
-            # Get probability if the model supports it
-            if hasattr(self.ml_model, 'predict_proba'):
-                proba = self.ml_model.predict_proba(vec)[0]
-                confidence = float(max(proba))
-            else:
-                confidence = 0.85 if prediction == 1 else 0.15
+            # One predict_proba call gives both the label and its probability.
+            prediction, confidence = self._classify(vec)
 
             result['available'] = True
             result['is_permit'] = bool(prediction == 1)
-            result['confidence'] = round(confidence, 4)
+            result['confidence'] = round(float(confidence), 4)
             result['label'] = 'authentic' if prediction == 1 else 'non_permit'
             return result
         except Exception as e:
@@ -166,17 +219,17 @@ class ImageVerificationSystem:
     # 1. Image quality
     # ------------------------------------------------------------------
     def check_image_quality(self, image_path):
-        """Ensure the uploaded image is readable and of decent quality."""
+        """Ensure the uploaded image (path or ``PermitImage``) is readable and of decent quality."""
         try:
-            img = cv2.imread(image_path)
-            if img is None:
+            image = PermitImage.coerce(image_path)
+            if not image.valid:
                 return False, "Invalid image file"
 
-            h, w = img.shape[:2]
+            h, w = image.height, image.width
             if h < 200 or w < 200:
                 return False, f"Image too small ({w}×{h}). Please upload at least 400×300."
 
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            gray = image.gray
             lap_var = cv2.Laplacian(gray, cv2.CV_64F).var()
 
             # Improved threshold: lowered from 50 to 30 for better sensitivity
@@ -201,105 +254,192 @@ class ImageVerificationSystem:
     # ------------------------------------------------------------------
     # 2. QR Code scanning (multiple strategies)
     # ------------------------------------------------------------------
-    def _decode_qr_from_array(self, img_array):
-        """Run pyzbar on a numpy/PIL array and return decoded objects."""
+    def _decode_qr_from_array(self, img_array, stop_event=None):
+        """Run pyzbar on a numpy/PIL array and return decoded objects.
+
+        When ``stop_event`` is set (another variant already decoded) the
+        slower all-symbologies pass is skipped.
+        """
         if not PYZBAR_AVAILABLE:
             return []
         # Try QR-only first for speed, then ANY barcode as fallback
         results = pyzbar_decode(img_array, symbols=[ZBarSymbol.QRCODE])
-        if not results:
+        if not results and not (stop_event and stop_event.is_set()):
             results = pyzbar_decode(img_array)
         return results
 
+    @staticmethod
+    def _decoded_text(decoded):
+        """First non-empty payload among pyzbar results, or ``None``."""
+        for obj in decoded:
+            try:
+                data = obj.data.decode('utf-8', errors='replace').strip()
+            except Exception:
+                data = str(obj.data)
+            if data:
+                return data
+        return None
+
     def _preprocess_variants(self, image_path):
         """
         Generator that yields multiple preprocessed versions of the image
-        to maximise QR detection success rate.
+        (path or ``PermitImage``) to maximise QR detection success rate.
+        Planes shared with other stages (gray, Otsu, CLAHE) come from the
+        ``PermitImage`` cache.
         """
-        img = Image.open(image_path)
+        image = PermitImage.coerce(image_path)
+        if not image.valid:
+            return
 
         # 1️⃣  Original
-        yield np.array(img), "original"
+        yield image.rgb, "original"
 
         # 2️⃣  Grayscale
-        gray = img.convert('L')
-        yield np.array(gray), "grayscale"
+        yield image.gray, "grayscale"
 
         # 3️⃣  High contrast grayscale
-        enhancer = ImageEnhance.Contrast(gray)
+        enhancer = ImageEnhance.Contrast(Image.fromarray(image.gray))
         yield np.array(enhancer.enhance(2.5)), "high-contrast"
 
         # 4️⃣  Sharpened
-        sharpened = img.filter(ImageFilter.SHARPEN)
+        sharpened = image.pil.filter(ImageFilter.SHARPEN)
         yield np.array(sharpened), "sharpened"
 
-        cv_img = cv2.imread(image_path)
-        if cv_img is not None:
-            cv_gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
-            
-            # 5️⃣  Adaptive-threshold via OpenCV
-            thresh = cv2.adaptiveThreshold(
-                cv_gray, 255,
-                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                cv2.THRESH_BINARY, 11, 2,
-            )
-            yield thresh, "adaptive-threshold"
+        cv_gray = image.gray
+
+        # 5️⃣  Adaptive-threshold via OpenCV
+        thresh = cv2.adaptiveThreshold(
+            cv_gray, 255,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY, 11, 2,
+        )
+        yield thresh, "adaptive-threshold"
+
+        # 6️⃣  Otsu binarisation
+        otsu = image.otsu
+        yield otsu, "otsu"
 
-            # 6️⃣  Otsu binarisation
-            _, otsu = cv2.threshold(cv_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            yield otsu, "otsu"
+        # 7️⃣  Inverted (white-on-black QR codes)
+        yield image.otsu_inv, "inverted-otsu"
 
-            # 7️⃣  Inverted (white-on-black QR codes)
-            yield cv2.bitwise_not(otsu), "inverted-otsu"
+        # 8️⃣  Upscaled (helps with small QR codes)
+        if cv_gray.shape[0] < 1000:
+            upscaled = cv2.resize(cv_gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+            _, up_thresh = cv2.threshold(upscaled, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            yield up_thresh, "upscaled-otsu"
 
-            # 8️⃣  Upscaled (helps with small QR codes)
-            if cv_gray.shape[0] < 1000:
-                upscaled = cv2.resize(cv_gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-                _, up_thresh = cv2.threshold(upscaled, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                yield up_thresh, "upscaled-otsu"
+        # 9️⃣ Enhanced contrast + aggressive sharpening
+        enhanced_contrast = cv2.convertScaleAbs(cv2.Laplacian(cv_gray, cv2.CV_64F))
+        yield enhanced_contrast, "laplacian-enhanced"
 
-            # 9️⃣ Enhanced contrast + aggressive sharpening
-            enhanced_contrast = cv2.convertScaleAbs(cv2.Laplacian(cv_gray, cv2.CV_64F))
-            yield enhanced_contrast, "laplacian-enhanced"
+        # 🔟 Histogram equalization (improves visibility of dark/light areas)
+        eq = cv2.equalizeHist(cv_gray)
+        yield eq, "histogram-equalized"
 
-            # 🔟 Histogram equalization (improves visibility of dark/light areas)
-            eq = cv2.equalizeHist(cv_gray)
-            yield eq, "histogram-equalized"
+        # 1️⃣1️⃣ Morphological operations - erosion then dilation (cleanup)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        morph = cv2.morphologyEx(otsu, cv2.MORPH_CLOSE, kernel)
+        yield morph, "morphology-closed"
 
-            # 1️⃣1️⃣ Morphological operations - erosion then dilation (cleanup)
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-            morph = cv2.morphologyEx(otsu, cv2.MORPH_CLOSE, kernel)
-            yield morph, "morphology-closed"
+        # 1️⃣2️⃣ CLAHE (Contrast Limited Adaptive Histogram Equalization)
+        yield image.clahe, "clahe"
+
+
+    def _scan_variants_serial(self, image_path):
+        """Decode variants one after another; returns (data, variant) or (None, None)."""
+        for img_variant, method_name in self._preprocess_variants(image_path):
+            data = self._decoded_text(self._decode_qr_from_array(img_variant))
+            if data:
+                return data, method_name
+        return None, None
 
-            # 1️⃣2️⃣ CLAHE (Contrast Limited Adaptive Histogram Equalization)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            clahe_img = clahe.apply(cv_gray)
-            yield clahe_img, "clahe"
+    def _scan_variants_parallel(self, image_path):
+        """
+        Fan preprocessing variants out to the shared QR thread pool.
 
+        Variants are still generated lazily on this thread and submitted as
+        they are produced.  The first successful decode sets a stop flag:
+        queued decodes are cancelled, running ones skip their second pass,
+        and no further variants are generated.
+        Returns (data, winning_variant) or (None, None).
+        """
+        executor = _get_qr_executor()
+        stop = threading.Event()
+        pending = {}
+        winner = (None, None)
+
+        def _decode(img_variant):
+            if stop.is_set():
+                return None
+            return self._decoded_text(self._decode_qr_from_array(img_variant, stop_event=stop))
+
+        def _collect(futures):
+            nonlocal winner
+            for future in futures:
+                method_name = pending.pop(future)
+                if future.cancelled():
+                    continue
+                try:
+                    data = future.result()
+                except Exception as e:
+                    print(f"⚠️  QR decode failed on [{method_name}]: {e}")
+                    continue
+                if data and winner[0] is None:
+                    winner = (data, method_name)
+                    stop.set()
 
-    def scan_qr_code(self, image_path):
+        try:
+            for img_variant, method_name in self._preprocess_variants(image_path):
+                pending[executor.submit(_decode, img_variant)] = method_name
+                _collect([f for f in list(pending) if f.done()])
+                if stop.is_set():
+                    break
+            while pending and not stop.is_set():
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                _collect(done)
+        finally:
+            stop.set()
+            for future in list(pending):
+                future.cancel()
+        return winner
+
+    def scan_qr_code(self, image_path, parallel=None):
         """
         Attempt to find and decode a QR code from the permit image.
         Returns (success: bool, data: str | error_message: str, method: str).
+        ``method`` names the preprocessing variant that decoded.  Variants
+        are decoded on a thread pool unless ``parallel`` is False or
+        ``QR_SCAN_WORKERS`` is 1.
+
+        When ``cv2.QRCodeDetector`` localises the code (``PermitImage.qr_patch``)
+        the variants first run on the rectified crop only (method
+        ``qr-roi/<variant>``); the full frame is scanned if that fails.
         Falls back to OCR if QR detection fails.
         """
         if not PYZBAR_AVAILABLE:
             return False, "pyzbar library not installed", ""
 
-        for img_variant, method_name in self._preprocess_variants(image_path):
-            decoded = self._decode_qr_from_array(img_variant)
-            for obj in decoded:
-                try:
-                    data = obj.data.decode('utf-8', errors='replace').strip()
-                except Exception:
-                    data = str(obj.data)
-                if data:
-                    print(f"✅ QR decoded via [{method_name}]: {data[:120]}")
-                    return True, data, method_name
+        image = PermitImage.coerce(image_path)
+        if parallel is None:
+            parallel = QR_SCAN_WORKERS > 1
+        scan = self._scan_variants_parallel if parallel else self._scan_variants_serial
+        started = time.perf_counter()
+        data, method_name = None, None
+        patch = image.qr_patch if image.valid else None
+        if patch is not None:
+            data, method_name = scan(patch)
+            if data:
+                method_name = f"qr-roi/{method_name}"
+        if not data:
+            data, method_name = scan(image)
+        if data:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"✅ QR decoded via [{method_name}] in {elapsed_ms:.0f} ms: {data[:120]}")
+            return True, data, method_name
 
         # QR detection failed - try OCR fallback
         print("⚠️  QR code not found, attempting OCR fallback...")
-        ocr_success, ocr_data = self._extract_text_with_ocr(image_path)
+        ocr_success, ocr_data = self._extract_text_with_ocr(image)
         if ocr_success and ocr_data:
             return True, ocr_data, "ocr-fallback"
 
@@ -315,28 +455,24 @@ class ImageVerificationSystem:
         """
         Extract text from image using Tesseract OCR.
         Returns (success: bool, extracted_text: str).
+
+        Only the detected text bands of the CLAHE + Otsu plane are OCR'd, on
+        the shared ``ocr_pool``.  The result is memoised on the
+        ``PermitImage``, so the QR fallback and the text checks of one
+        submission share a single OCR pass.
         """
-        if not TESSERACT_AVAILABLE:
+        if not ocr_pool.get_ocr_pool().available:
             return False, ""
 
+        image = PermitImage.coerce(image_path)
+        return image.memo('ocr_text', lambda: self._run_ocr(image))
+
+    def _run_ocr(self, image):
         try:
-            img = cv2.imread(image_path)
-            if img is None:
+            if not image.valid:
                 return False, ""
 
-            # Preprocess for OCR
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Improve contrast
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(gray)
-            
-            # Threshold for better OCR accuracy
-            _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # Extract text
-            text = pytesseract.image_to_string(thresh)
-            
+            text = ocr_pool.ocr_text_regions(image)
             if text.strip():
                 print(f"📝 OCR extracted text: {len(text)} characters")
                 return True, text
@@ -666,8 +802,26 @@ class ImageVerificationSystem:
         If the page responds with HTTP 200 and contains expected markers,
         we consider the business registration valid.
 
+        Lookups share a pooled session, are cached per normalised URL and
+        are skipped while the BNRS circuit breaker is open (see
+        ``dti_client``).
+
         Returns (valid: bool, details: dict).
         """
+        cache_key = dti_client.normalize_url(qr_url)
+        cached = dti_client.dti_page_cache.get(cache_key)
+        if cached is not None:
+            valid, details = cached
+            details = dict(details, url_checked=qr_url, cached=True)
+            return valid, details
+
+        valid, details = self._fetch_dti_details(qr_url)
+        ttl = dti_client.cache_ttl(valid, details)
+        if ttl is not None:
+            dti_client.dti_page_cache.set(cache_key, (valid, dict(details)), ttl=ttl)
+        return valid, details
+
+    def _fetch_dti_details(self, qr_url):
         details = {
             'url_checked': qr_url,
             'reachable': False,
@@ -680,18 +834,15 @@ class ImageVerificationSystem:
         }
 
         try:
-            headers = {
-                'User-Agent': (
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                    'AppleWebKit/537.36 (KHTML, like Gecko) '
-                    'Chrome/120.0.0.0 Safari/537.36'
-                ),
-                'Accept': 'text/html,application/xhtml+xml,*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-            }
-
-            resp = requests.get(qr_url, headers=headers, timeout=15, allow_redirects=True)
+            resp = dti_client.fetch_page(qr_url)
             details['http_status'] = resp.status_code
+            if resp.status_code in dti_client.THROTTLED_STATUSES:
+                # Throttled or blocked: BNRS did not answer about this permit.
+                details['message'] = (
+                    f"DTI website refused the lookup (status {resp.status_code}). "
+                    "The QR URL looks valid; your application is saved for manual review."
+                )
+                return False, details
             details['reachable'] = True
 
             if resp.status_code != 200:
@@ -769,6 +920,12 @@ class ImageVerificationSystem:
             details['message'] = "DTI registration confirmed via BNRS."
             return True, details
 
+        except dti_client.DTIUnavailable as e:
+            details['circuit_open'] = True
+            details['message'] = (
+                f"{e} The QR URL looks valid; your application is saved for manual review."
+            )
+            return False, details
         except requests.exceptions.Timeout:
             details['message'] = (
                 "DTI website timed out. The QR URL looks valid but the DTI "
@@ -903,6 +1060,21 @@ class ImageVerificationSystem:
         """
         Complete verification pipeline (QR + ML + Name Cross-Check).
 
+        ``image_path`` may be a file path or an already-open ``PermitImage``.
+        The image is decoded once and every stage reuses its cached planes;
+        an image opened here is released when the pipeline finishes.
+        """
+        image = PermitImage.coerce(image_path)
+        try:
+            return self._run_verification(image, user_business_name, user_owner_name)
+        finally:
+            if image is not image_path:
+                image.release()
+
+    def _run_verification(self, image, user_business_name, user_owner_name):
+        """
+        Pipeline body for ``verify_permit_image``.
+
         Steps:
           1. Check image quality
           2. Run ML classifier (if model is loaded)
@@ -926,23 +1098,23 @@ class ImageVerificationSystem:
             'text_verification': None,
             'extracted_text': '',
             'timestamp': datetime.now().isoformat(),
-            'file_path': image_path,
+            'file_path': image.path,
             'permit_validation': {'passed': False, 'message': ''},
         }
 
         # ---- Step 1: Image quality ----
-        quality_ok, quality_msg = self.check_image_quality(image_path)
+        quality_ok, quality_msg = self.check_image_quality(image)
         results['quality_check'] = {'passed': quality_ok, 'message': quality_msg}
         if not quality_ok:
             results['permit_validation']['message'] = quality_msg
             return results
 
         # ---- Step 2: ML classification ----
-        ml_result = self.predict_permit_ml(image_path)
+        ml_result = self.predict_permit_ml(image)
         results['ml_prediction'] = ml_result
 
         # ---- Step 3: Scan QR code ----
-        qr_ok, qr_data, qr_method = self.scan_qr_code(image_path)
+        qr_ok, qr_data, qr_method = self.scan_qr_code(image)
         results['qr_scan'] = {
             'passed': qr_ok,
             'message': qr_data if not qr_ok else f"QR decoded ({qr_method})",
@@ -958,7 +1130,7 @@ class ImageVerificationSystem:
             qr_fields = self._parse_qr_text(qr_data)
             
             # Extract text from the actual permit image
-            ocr_success, ocr_text = self._extract_text_with_ocr(image_path)
+            ocr_success, ocr_text = self._extract_text_with_ocr(image)
             
             if ocr_success and ocr_text:
                 permit_fields = self._extract_permit_text_details(ocr_text)
@@ -1086,7 +1258,7 @@ class ImageVerificationSystem:
                 qr_fields = self._parse_qr_text(qr_data)
                 
                 # Extract permit text details (already done in Step 3b)
-                ocr_success, ocr_text = self._extract_text_with_ocr(image_path)
+                ocr_success, ocr_text = self._extract_text_with_ocr(image)
                 
                 if ocr_success and ocr_text:
                     permit_fields = self._extract_permit_text_details(ocr_text)
@@ -0,0 +1,220 @@
+"""
+Index bootstrap / migration for the PyMongo-managed collections.
+
+``ensure_indexes`` runs at application startup (see ``app.py``) and can also
+be run by hand:
+
+    python indexes.py             # create any missing indexes
+    python indexes.py --force     # re-apply every index regardless of version
+    python indexes.py --verify    # only report indexes that are missing
+    python indexes.py --explain   # report hot queries that still do a COLLSCAN
+
+Bump ``INDEX_VERSION`` whenever ``INDEX_SPECS`` changes so running servers
+pick the new indexes up on their next start.
+"""
+import argparse
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+from product_search import TEXT_INDEX_NAME, TEXT_INDEX_WEIGHTS
+
+INDEX_VERSION = 6
+
+# collection -> list of index definitions.  Each definition is passed
+# straight to ``create_index`` (``keys`` positionally, the rest as kwargs).
+INDEX_SPECS = {
+    'carts': [
+        {'keys': [('user_id', ASCENDING)], 'name': 'user_id_1'},
+    ],
+    'email_outbox': [
+        {'keys': [('status', ASCENDING), ('next_attempt_at', ASCENDING)], 'name': 'status_1_next_attempt_at_1'},
+        {'keys': [('status', ASCENDING), ('lease_expires_at', ASCENDING)], 'name': 'status_1_lease_expires_at_1'},
+    ],
+    'orders': [
+        {'keys': [('user_id', ASCENDING), ('created_at', DESCENDING)], 'name': 'user_id_1_created_at_-1'},
+        {'keys': [('seller_ids', ASCENDING), ('created_at', DESCENDING)], 'name': 'seller_ids_1_created_at_-1'},
+    ],
+    'permit_verification_cache': [
+        {'keys': [('sha256', ASCENDING), ('model_version', ASCENDING), ('names_key', ASCENDING)],
+         'name': 'sha256_1_model_version_1_names_key_1'},
+        {'keys': [('model_version', ASCENDING), ('names_key', ASCENDING), ('created_at', DESCENDING)],
+         'name': 'model_version_1_names_key_1_created_at_-1'},
+        {'keys': [('expires_at', ASCENDING)], 'name': 'expires_at_ttl', 'expireAfterSeconds': 0},
+    ],
+    'products': [
+        {'keys': [('available', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         'name': 'available_1_created_at_-1__id_-1'},
+        {'keys': [('available', ASCENDING), ('category', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         'name': 'available_1_category_1_created_at_-1__id_-1'},
+        {'keys': [('farmer', ASCENDING)], 'name': 'farmer_1'},
+        {'keys': [('farmer_user_id', ASCENDING)], 'name': 'farmer_user_id_1'},
+        {'keys': [('farmer_email', ASCENDING)], 'name': 'farmer_email_1'},
+        {'keys': [(field, TEXT) for field in TEXT_INDEX_WEIGHTS], 'name': TEXT_INDEX_NAME,
+         'weights': TEXT_INDEX_WEIGHTS, 'default_language': 'english'},
+    ],
+    'users': [
+        {'keys': [('email', ASCENDING)], 'name': 'email_1', 'unique': True},
+        {'keys': [('id', ASCENDING)], 'name': 'id_1', 'unique': True, 'sparse': True},
+        {'keys': [('role', ASCENDING)], 'name': 'role_1'},
+    ],
+}
+
+# Representative filters for the hottest queries in ``routes/``.  Used by
+# ``explain_hot_queries`` to catch regressions back to collection scans.
+HOT_QUERIES = [
+    ('carts', {'user_id': 'sample-user'}, None),
+    ('orders', {'user_id': 'sample-user'}, [('created_at', DESCENDING)]),
+    ('orders', {'seller_ids': 'sample-farmer'}, [('created_at', DESCENDING)]),
+    ('products', {'available': True}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('products', {'available': True, 'category': 'vegetables'}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('products', {'farmer': 'sample-farmer'}, None),
+    ('products', {'farmer_user_id': 'sample-farmer'}, None),
+    ('products', {'farmer_email': 'farmer@example.com'}, None),
+    ('users', {'email': 'user@example.com'}, None),
+    ('users', {'id': 'sample-user'}, None),
+    ('users', {'role': 'farmer'}, None),
+]
+
+_META_COLLECTION = 'schema_meta'
+_META_ID = 'indexes'
+
+
+def get_applied_version(db):
+    """Return the index version recorded in the database (0 if never applied)."""
+    meta = db[_META_COLLECTION].find_one({'_id': _META_ID})
+    return int(meta.get('version', 0)) if meta else 0
+
+
+def ensure_indexes(db, force=False):
+    """Create every index in ``INDEX_SPECS`` that is not already present.
+
+    Skips all work when the recorded version is current unless ``force`` is
+    set.  Returns a dict with the ``created`` and ``failed`` index names.
+    """
+    summary = {'version': INDEX_VERSION, 'created': [], 'failed': [], 'skipped': False}
+
+    if not force and get_applied_version(db) >= INDEX_VERSION:
+        summary['skipped'] = True
+        return summary
+
+    for collection, specs in INDEX_SPECS.items():
+        existing = set(db[collection].index_information().keys())
+        for spec in specs:
+            options = {k: v for k, v in spec.items() if k != 'keys'}
+            name = f"{collection}.{spec['name']}"
+            if spec['name'] in existing and not force:
+                continue
+            try:
+                db[collection].create_index(spec['keys'], **options)
+                summary['created'].append(name)
+            except OperationFailure as e:
+                # Typically duplicate data blocking a unique index; keep going
+                # so one bad collection doesn't block the rest.
+                print(f"⚠️ Could not create index {name}: {e}")
+                summary['failed'].append(name)
+
+    if not summary['failed']:
+        db[_META_COLLECTION].update_one(
+            {'_id': _META_ID},
+            {'$set': {'version': INDEX_VERSION, 'applied_at': datetime.utcnow()}},
+            upsert=True,
+        )
+    return summary
+
+
+def verify_indexes(db):
+    """Return a list of ``collection.index_name`` entries that are missing."""
+    missing = []
+    for collection, specs in INDEX_SPECS.items():
+        existing = set(db[collection].index_information().keys())
+        for spec in specs:
+            if spec['name'] not in existing:
+                missing.append(f"{collection}.{spec['name']}")
+    return missing
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if plan.get('stage'):
+        yield plan['stage']
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+
+def explain_hot_queries(db):
+    """Run ``explain()`` on each of ``HOT_QUERIES`` and report collection scans.
+
+    Returns a list of dicts ``{collection, filter, stages, collscan}``.
+    """
+    reports = []
+    for collection, query, sort in HOT_QUERIES:
+        try:
+            cursor = db[collection].find(query).limit(1)
+            if sort:
+                cursor = cursor.sort(sort)
+            plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+            stages = list(_plan_stages(plan))
+        except Exception as e:
+            print(f"⚠️ explain() failed for {collection} {query}: {e}")
+            continue
+        reports.append({
+            'collection': collection,
+            'filter': query,
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages,
+        })
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create / verify MongoDB indexes')
+    parser.add_argument('--force', action='store_true',
+                        help='Re-apply all indexes even if the recorded version is current')
+    parser.add_argument('--verify', action='store_true',
+                        help='Only report missing indexes, do not create anything')
+    parser.add_argument('--explain', action='store_true',
+                        help='Report hot queries whose winning plan is a collection scan')
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    from config import config
+
+    client = None
+    try:
+        client = MongoClient(config['development'].MONGODB_URI)
+        db = client.get_database()
+
+        if args.verify:
+            missing = verify_indexes(db)
+            if missing:
+                print(f"❌ Missing {len(missing)} index(es):")
+                for name in missing:
+                    print(f"   - {name}")
+            else:
+                print(f"✅ All indexes present (version {INDEX_VERSION})")
+        else:
+            summary = ensure_indexes(db, force=args.force)
+            if summary['skipped']:
+                print(f"✅ Indexes already at version {INDEX_VERSION}")
+            else:
+                print(f"✅ Created {len(summary['created'])} index(es), "
+                      f"{len(summary['failed'])} failed (version {INDEX_VERSION})")
+
+        if args.explain:
+            for report in explain_hot_queries(db):
+                marker = '❌ COLLSCAN' if report['collscan'] else '✅'
+                print(f"{marker} {report['collection']} {report['filter']} -> {' > '.join(report['stages'])}")
+    finally:
+        if client:
+            client.close()
+
+
+if __name__ == '__main__':
+    main()
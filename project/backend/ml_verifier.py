@@ -0,0 +1,85 @@
+"""
+Lazily constructed permit verifier.
+
+Importing ``image_verification`` pulls in OpenCV, PIL, pyzbar, pytesseract,
+fuzzywuzzy, joblib/scikit-learn and unpickles the classifier, which used to
+happen in ``app.py`` before Flask could serve a single request.  Callers now
+use ``get_verifier()``, which builds the ``ImageVerificationSystem`` on first
+use (once per process, thread-safe) and logs how long each heavy import took.
+Processes that never verify a permit never pay for it.
+
+The web process never verifies a permit itself: the verification worker
+processes (``verification_jobs``) build it in their pool initializer, and
+``VERIFIER_WARMUP`` makes ``app.py`` start that pool at boot.  A failed
+construction is remembered (``get_verifier()`` then returns ``None``) and
+retried after ``VERIFIER_RETRY_INTERVAL`` seconds.
+"""
+import importlib
+import os
+import threading
+import time
+
+VERIFIER_RETRY_INTERVAL = float(os.environ.get('VERIFIER_RETRY_INTERVAL') or 300)
+
+# Heavy optional dependencies of the pipeline, imported (and timed) first so
+# the log shows where start-up time goes.
+HEAVY_MODULES = (
+    'numpy', 'cv2', 'PIL.Image', 'pyzbar.pyzbar', 'pytesseract',
+    'fuzzywuzzy.fuzz', 'joblib', 'sklearn', 'image_verification',
+)
+
+_verifier = None
+_state = 'not-loaded'
+_error = None
+_failed_at = 0.0
+_timings = {}
+_lock = threading.Lock()
+
+
+def _timed_import(name):
+    start = time.perf_counter()
+    try:
+        importlib.import_module(name)
+        ok = True
+    except ImportError:
+        ok = False
+    elapsed = (time.perf_counter() - start) * 1000
+    _timings[name] = round(elapsed, 1)
+    print(f"   {'⏱️' if ok else '⚠️'} import {name}: {elapsed:.0f} ms{'' if ok else ' (not installed)'}")
+
+
+def _build():
+    global _verifier, _state, _error, _failed_at
+    _state = 'loading'
+    print("🔄 Loading ML verification system...")
+    start = time.perf_counter()
+    try:
+        for name in HEAVY_MODULES:
+            _timed_import(name)
+        construct_start = time.perf_counter()
+        from image_verification import ImageVerificationSystem
+        verifier = ImageVerificationSystem()
+        _timings['construct'] = round((time.perf_counter() - construct_start) * 1000, 1)
+    except Exception as e:
+        _state, _error, _failed_at = 'failed', str(e), time.monotonic()
+        print(f"⚠️ Warning: ML Verification System failed to initialize: {e}")
+        return None
+    _timings['total'] = round((time.perf_counter() - start) * 1000, 1)
+    _verifier, _state, _error = verifier, 'ready', None
+    print(f"✅ ML Verification System initialized in {_timings['total']:.0f} ms")
+    return verifier
+
+
+def get_verifier():
+    """Return the process-wide ``ImageVerificationSystem``, building it on first use.
+
+    Returns ``None`` if it could not be constructed.
+    """
+    if _verifier is not None:
+        return _verifier
+    with _lock:
+        if _verifier is not None:
+            return _verifier
+        if _state == 'failed' and time.monotonic() - _failed_at < VERIFIER_RETRY_INTERVAL:
+            return None
+        return _build()
@@ -0,0 +1,167 @@
+"""
+Bounded OCR worker pool with text-region cropping.
+
+``pytesseract.image_to_string`` starts a ``tesseract`` process per call and
+used to run on the whole thresholded permit photo.  ``ocr_text_regions``
+instead finds the text bands from the row projection of the image's
+``OCR_DETECT_SIZE`` copy (the same ``fit_within`` frame, and so the same
+``row_projection``, the feature extractor uses), scales each band's ink
+extent back to full resolution and OCRs those full-resolution crops
+concurrently on ``OCR_WORKERS`` threads.
+
+If ``tesserocr`` is installed the pool keeps ``OCR_WORKERS`` initialised
+``PyTessBaseAPI`` handles and reuses them, so no process is started per
+call; otherwise at most ``OCR_WORKERS`` ``tesseract`` subprocesses run at
+once per process.  If the ``tesserocr`` handles cannot be created (e.g.
+missing tessdata) the pool falls back to ``pytesseract``, or to no OCR.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS') or min(4, os.cpu_count() or 1))
+# Bands are found on this downscaled copy; it matches
+# PermitFeatureExtractor.STANDARD_SIZE, so the projection is shared.
+OCR_DETECT_SIZE = (800, 600)
+# Rows whose ink count is above this share of the busiest row are text.
+OCR_ROW_THRESHOLD = 0.1
+# Bands this close together (fraction of image height) are OCR'd as one block.
+OCR_MERGE_GAP = 0.02
+OCR_BAND_PADDING = 6
+# Past this share of the image height, cropping saves little: OCR the full frame.
+OCR_FULL_FRAME_COVERAGE = 0.85
+OCR_MAX_REGIONS = 12
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class OCRPool:
+    """``OCR_WORKERS`` concurrent OCR slots (tesserocr handles or subprocesses)."""
+
+    def __init__(self, workers=OCR_WORKERS, backend='auto'):
+        self.workers = max(1, int(workers))
+        if backend == 'auto':
+            backend = 'tesserocr' if TESSEROCR_AVAILABLE else 'pytesseract' if PYTESSERACT_AVAILABLE else None
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+        self._apis = queue.Queue()
+        self._slots = threading.BoundedSemaphore(self.workers)
+        if self.backend == 'tesserocr':
+            try:
+                for _ in range(self.workers):
+                    self._apis.put(tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.AUTO))
+            except Exception as e:
+                while not self._apis.empty():
+                    self._apis.get().End()
+                self.backend = 'pytesseract' if PYTESSERACT_AVAILABLE else None
+                print(f"⚠️ tesserocr unavailable ({e}); using {self.backend or 'no OCR'}")
+
+    @property
+    def available(self):
+        return self.backend is not None
+
+    def image_to_string(self, array, block=False):
+        """OCR one uint8 image; ``block=True`` treats it as a single text block."""
+        if self.backend == 'tesserocr':
+            api = self._apis.get()
+            try:
+                api.SetPageSegMode(tesserocr.PSM.SINGLE_BLOCK if block else tesserocr.PSM.AUTO)
+                api.SetImage(Image.fromarray(array))
+                return api.GetUTF8Text()
+            finally:
+                self._apis.put(api)
+        with self._slots:
+            return pytesseract.image_to_string(array, config='--psm 6' if block else '')
+
+    def map(self, arrays, block=False):
+        """OCR several images concurrently, returning their texts in order."""
+        if len(arrays) == 1:
+            return [self.image_to_string(arrays[0], block=block)]
+        return list(self._executor.map(lambda a: self.image_to_string(a, block=block), arrays))
+
+
+def get_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = OCRPool()
+            except Exception as e:
+                print(f"⚠️ OCR pool failed to start ({e}); OCR disabled")
+                _pool = OCRPool(workers=1, backend=None)
+        return _pool
+
+
+def text_regions(image):
+    """Bounding boxes ``(y0, y1, x0, x1)`` of the text bands in a ``PermitImage``.
+
+    Bands are detected on ``image.fit_within(OCR_DETECT_SIZE)`` and the boxes
+    are scaled back to ``image``'s pixel coordinates.  Returns ``None`` when
+    cropping would not help (no clear bands, or they cover most of the page).
+    """
+    frame = image.fit_within(OCR_DETECT_SIZE)
+    h_proj = frame.row_projection
+    if h_proj.size == 0 or h_proj.max() <= 0:
+        return None
+    rows = np.flatnonzero(h_proj > OCR_ROW_THRESHOLD * h_proj.max())
+    if rows.size == 0:
+        return None
+
+    height, width = frame.height, frame.width
+    gap = max(8, int(OCR_MERGE_GAP * height))
+    splits = np.flatnonzero(np.diff(rows) > gap) + 1
+    bands = [(int(b[0]), int(b[-1]) + 1) for b in np.split(rows, splits)]
+    if len(bands) > OCR_MAX_REGIONS:
+        return None
+
+    binary = frame.otsu_inv
+    scale_y, scale_x = image.height / height, image.width / width
+    boxes, covered = [], 0
+    for y0, y1 in bands:
+        y0, y1 = max(0, y0 - OCR_BAND_PADDING), min(height, y1 + OCR_BAND_PADDING)
+        cols = np.flatnonzero(binary[y0:y1].any(axis=0))
+        if cols.size == 0:
+            continue
+        x0 = max(0, int(cols[0]) - OCR_BAND_PADDING)
+        x1 = min(width, int(cols[-1]) + 1 + OCR_BAND_PADDING)
+        boxes.append((int(y0 * scale_y), min(image.height, int(np.ceil(y1 * scale_y))),
+                      int(x0 * scale_x), min(image.width, int(np.ceil(x1 * scale_x)))))
+        covered += y1 - y0
+    if not boxes or covered > OCR_FULL_FRAME_COVERAGE * height:
+        return None
+    return boxes
+
+
+def ocr_text_regions(image):
+    """OCR a ``PermitImage`` band by band (full frame as a fallback).
+
+    Returns the text, top to bottom, or ``''``.
+    """
+    pool = get_ocr_pool()
+    if not pool.available:
+        return ''
+    ocr_input = image.clahe_otsu
+    boxes = text_regions(image)
+    if boxes:
+        crops = [ocr_input[y0:y1, x0:x1] for y0, y1, x0, x1 in boxes]
+        text = '\n'.join(t.strip() for t in pool.map(crops, block=True) if t.strip())
+        if text:
+            return text
+    return pool.image_to_string(ocr_input)
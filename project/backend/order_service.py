@@ -0,0 +1,393 @@
+"""
+Order helpers shared by the API and template checkout routes.
+
+``place_order`` reserves stock, inserts the order and clears the cart in one
+MongoDB transaction; ``reserve_stock`` / ``release_stock`` do the stock part
+with a single conditional ``bulk_write``.
+
+Every order carries a denormalised ``seller_ids`` array (and each item a
+``farmer_id`` plus the full ``seller_refs`` of its product) so a farmer's
+orders can be fetched with one indexed ``{'seller_ids': farmer_id}`` query
+instead of scanning every order and resolving every item's product.
+
+Orders placed before the field existed are stamped by
+
+    python order_service.py --backfill-seller-ids
+"""
+import argparse
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+from cart_service import fetch_products_by_ids, fetch_users_by_refs
+
+FARMER_ORDERS_PAGE_SIZE = 50
+MAX_FARMER_ORDERS_PAGE_SIZE = 200
+
+# MongoDB error code for "transactions are not supported" (standalone server).
+_ILLEGAL_OPERATION = 20
+
+# Paymongo orders only become visible to sellers once they are paid.
+VISIBLE_TO_SELLER = {'$or': [
+    {'payment_provider': {'$ne': 'paymongo'}},
+    {'payment_status': 'paid'},
+]}
+
+
+class InsufficientStock(ValueError):
+    """Raised by ``place_order`` (and ``reserve_stock`` callers) when a line cannot be fulfilled."""
+
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.names = [o['name'] for o in outcomes if not o['reserved']]
+        super().__init__(f"Insufficient stock for: {', '.join(self.names)}")
+
+
+def product_seller_refs(product):
+    """All id strings a product's seller may be referenced by."""
+    refs = []
+    for key in ('farmer_user_id', 'farmer'):
+        value = product.get(key)
+        if value and str(value) not in refs:
+            refs.append(str(value))
+    return refs
+
+
+def stamp_sellers(order_items, products_by_id):
+    """Set ``farmer_id`` / ``seller_refs`` on each order item and return the order's ``seller_ids``.
+
+    ``products_by_id`` maps each item's ``product_id`` to its product
+    document, as returned by ``cart_service.fetch_products_by_ids``.
+    """
+    seller_ids = []
+    for item in order_items:
+        product = products_by_id.get(str(item.get('product_id')))
+        if not product:
+            item.setdefault('seller_refs', [])
+            continue
+        refs = product_seller_refs(product)
+        item['seller_refs'] = refs
+        if refs:
+            item['farmer_id'] = refs[0]
+        for ref in refs:
+            if ref not in seller_ids:
+                seller_ids.append(ref)
+    return seller_ids
+
+
+def sold_by(item, farmer_id):
+    """Whether an order item's product belongs to ``farmer_id`` (by any of its refs)."""
+    return item.get('farmer_id') == farmer_id or farmer_id in (item.get('seller_refs') or [])
+
+
+def _product_filter(product_id):
+    pid = str(product_id)
+    return {'_id': ObjectId(pid)} if ObjectId.is_valid(pid) else {'_id': pid}
+
+
+def release_stock(db, lines, session=None):
+    """Give back stock for ``lines`` (``product_id`` / ``quantity`` dicts) in one bulk write."""
+    ops = [
+        UpdateOne(_product_filter(line['product_id']), {'$inc': {'quantity': int(line.get('quantity', 1))}})
+        for line in lines if line.get('product_id')
+    ]
+    if ops:
+        db.products.bulk_write(ops, ordered=False, session=session)
+
+
+def insufficient_stock(lines, products_by_id):
+    """Lines whose product currently holds less stock than ordered (no writes)."""
+    short = []
+    for line in lines:
+        product = products_by_id.get(str(line.get('product_id')))
+        if product is not None and int(product.get('quantity', 0) or 0) < int(line.get('quantity', 1)):
+            short.append(line)
+    return short
+
+
+def _outcome(line, reserved):
+    return {
+        'product_id': line['product_id'],
+        'name': line.get('name', 'Product'),
+        'quantity': int(line.get('quantity', 1)),
+        'reserved': reserved,
+    }
+
+
+def reserve_stock(db, lines, session):
+    """Decrement stock for every order line in one conditional ``bulk_write``.
+
+    Each line only applies while the product still has ``quantity >= qty``,
+    so stock never goes negative.  Returns ``(ok, outcomes)`` where
+    ``outcomes`` lists ``{'product_id', 'name', 'quantity', 'reserved'}``
+    per line.
+
+    Runs inside the transaction ``session`` belongs to.  When fewer lines
+    match than were sent, ``bulk_write`` does not say which ones did, so the
+    products are read once more, outside the transaction, and a line is
+    reported ``reserved`` when the committed stock covers it.  The caller
+    must then abort the transaction (``place_order`` raises
+    ``InsufficientStock``), which undoes the lines that did apply.
+    """
+    lines = [line for line in lines if line.get('product_id')]
+    if not lines:
+        return True, []
+
+    ops = [
+        UpdateOne(
+            dict(_product_filter(line['product_id']), quantity={'$gte': int(line.get('quantity', 1))}),
+            {'$inc': {'quantity': -int(line.get('quantity', 1))}},
+        )
+        for line in lines
+    ]
+    result = db.products.bulk_write(ops, ordered=False, session=session)
+    if result.matched_count == len(ops):
+        return True, [_outcome(line, True) for line in lines]
+
+    products = fetch_products_by_ids(db, [line['product_id'] for line in lines], projection={'id': 1, 'quantity': 1})
+    outcomes = []
+    for line in lines:
+        product = products.get(str(line['product_id']))
+        in_stock = product is not None and int(product.get('quantity', 0) or 0) >= int(line.get('quantity', 1))
+        outcomes.append(_outcome(line, in_stock))
+    return False, outcomes
+
+
+def _reserve_stock_per_line(db, lines):
+    """``reserve_stock`` for servers without transactions.
+
+    Nothing can be rolled back, so each line is its own conditional update
+    whose ``matched_count`` gives its exact outcome.
+    """
+    outcomes = []
+    for line in lines:
+        if not line.get('product_id'):
+            continue
+        qty = int(line.get('quantity', 1))
+        result = db.products.update_one(
+            dict(_product_filter(line['product_id']), quantity={'$gte': qty}),
+            {'$inc': {'quantity': -qty}},
+        )
+        outcomes.append(_outcome(line, result.matched_count == 1))
+    return all(o['reserved'] for o in outcomes), outcomes
+
+
+def _transaction(client, callback):
+    with client.start_session() as session:
+        return session.with_transaction(
+            callback,
+            read_concern=ReadConcern('snapshot'),
+            write_concern=WriteConcern('majority'),
+        )
+
+
+def _place_order_without_transaction(db, order_doc, cart_id, reserve):
+    if reserve:
+        ok, outcomes = _reserve_stock_per_line(db, order_doc['items'])
+        if not ok:
+            # Compensate for the lines that did apply.
+            release_stock(db, [o for o in outcomes if o['reserved']])
+            raise InsufficientStock(outcomes)
+    try:
+        inserted_id = db.orders.insert_one(order_doc).inserted_id
+    except Exception:
+        if reserve:
+            release_stock(db, order_doc['items'])
+        raise
+    if cart_id is not None:
+        db.carts.delete_one({'_id': cart_id})
+    return inserted_id
+
+
+def place_order(db, client, order_doc, cart_id=None, reserve=True):
+    """Reserve stock, insert ``order_doc`` and delete the cart as one transaction.
+
+    Runs inside ``ClientSession.with_transaction``, which retries transient
+    errors (including write conflicts between concurrent checkouts) and
+    unknown commit results.  Nothing is visible to other readers until the
+    commit, so callers must only send emails, start payments and so on after
+    this returns.  Returns the new order's id; raises ``InsufficientStock``
+    (with nothing written) when a line cannot be fulfilled.
+
+    ``reserve=False`` skips the stock step (mobile-money orders take stock
+    when the payment clears) and ``cart_id=None`` keeps the cart.  Standalone
+    servers without transaction support get the same steps with
+    compensating writes instead.
+    """
+    def _txn(session):
+        if reserve:
+            ok, outcomes = reserve_stock(db, order_doc['items'], session)
+            if not ok:
+                raise InsufficientStock(outcomes)
+        inserted_id = db.orders.insert_one(order_doc, session=session).inserted_id
+        if cart_id is not None:
+            db.carts.delete_one({'_id': cart_id}, session=session)
+        return inserted_id
+
+    try:
+        return _transaction(client, _txn)
+    except OperationFailure as e:
+        if e.code != _ILLEGAL_OPERATION:
+            raise
+        print(f"⚠️ MongoDB transactions unavailable, placing order without one: {e}")
+        order_doc.pop('_id', None)
+        return _place_order_without_transaction(db, order_doc, cart_id, reserve)
+
+
+def reserve_available_stock(db, client, lines, attempts=3):
+    """Take whatever stock there is for ``lines`` of an order that is already paid.
+
+    All lines are tried in one transaction.  On a shortfall it is aborted
+    and retried with only the lines the committed stock still covers.
+    Returns the per-line outcomes, as ``reserve_stock`` does.
+    """
+    lines = [line for line in lines if line.get('product_id')]
+    pending = list(range(len(lines)))
+
+    def _txn(session):
+        ok, outcomes = reserve_stock(db, [lines[i] for i in pending], session)
+        if not ok:
+            raise InsufficientStock(outcomes)
+        return outcomes
+
+    for _ in range(attempts):
+        if not pending:
+            break
+        try:
+            _transaction(client, _txn)
+        except InsufficientStock as exc:
+            pending = [i for i, o in zip(pending, exc.outcomes) if o['reserved']]
+            continue
+        except OperationFailure as e:
+            if e.code != _ILLEGAL_OPERATION:
+                raise
+            return _reserve_stock_per_line(db, lines)[1]
+        return [_outcome(line, i in pending) for i, line in enumerate(lines)]
+    return [_outcome(line, False) for line in lines]
+
+
+def find_seller_orders(db, farmer_id, page=1, per_page=FARMER_ORDERS_PAGE_SIZE, paid_only=True):
+    """Return ``(orders, has_more)`` for one page of a farmer's orders.
+
+    Each order is shaped for the seller views: only the farmer's own items
+    are listed, and the buyer is resolved in one batched lookup per page.
+    ``paid_only`` hides Paymongo orders whose payment has not cleared.
+    """
+    page = max(1, int(page or 1))
+    per_page = max(1, min(int(per_page or FARMER_ORDERS_PAGE_SIZE), MAX_FARMER_ORDERS_PAGE_SIZE))
+
+    # ``seller_ids`` holds every ref of every product while ``farmer_id`` is
+    # only the preferred one, so also require an item that ``sold_by`` this
+    # farmer: pages and ``has_more`` then count the same orders that are shown.
+    query = {
+        'seller_ids': farmer_id,
+        '$or': [{'items.farmer_id': farmer_id}, {'items.seller_refs': farmer_id}],
+    }
+    if paid_only:
+        query = {'$and': [query, VISIBLE_TO_SELLER]}
+    order_docs = list(
+        db.orders.find(query)
+        .sort('created_at', -1)
+        .skip((page - 1) * per_page)
+        .limit(per_page + 1)
+    )
+    has_more = len(order_docs) > per_page
+    order_docs = order_docs[:per_page]
+
+    buyers = fetch_users_by_refs(
+        db, [o.get('user_id') for o in order_docs if o.get('user_id')],
+        projection={'id': 1, 'first_name': 1, 'email': 1},
+    )
+
+    seller_orders = []
+    for order_doc in order_docs:
+        order_items = [
+            {
+                'name': item.get('name', 'Product'),
+                'quantity': item.get('quantity', 1),
+                'price': item.get('price', 0),
+            }
+            for item in order_doc.get('items', [])
+            if sold_by(item, farmer_id)
+        ]
+        if not order_items:
+            continue
+
+        buyer = buyers.get(str(order_doc.get('user_id')))
+        seller_orders.append({
+            'id': str(order_doc.get('_id')),
+            'status': order_doc.get('status', 'pending'),
+            'delivery_status': order_doc.get('delivery_status', ''),
+            'delivery_tracking_id': order_doc.get('delivery_tracking_id'),
+            'created_at': order_doc.get('created_at'),
+            'buyer_name': (buyer.get('first_name') if buyer else 'Customer'),
+            'buyer_email': (buyer.get('email') if buyer else ''),
+            'items': order_items,
+            'total_amount': order_doc.get('total_amount', 0),
+        })
+    return seller_orders, has_more
+
+
+def backfill_seller_ids(db, batch_size=500):
+    """Stamp ``seller_ids`` / item ``farmer_id`` and ``seller_refs`` on orders created before they existed.
+
+    Products are resolved per batch with one ``$in`` query and updates go out
+    as one ``bulk_write`` per batch.  Returns the number of orders updated.
+    """
+    updated = 0
+    missing = {'$or': [{'seller_ids': {'$exists': False}}, {'items.seller_refs': {'$exists': False}}]}
+    cursor = db.orders.find(missing, {'items': 1}).batch_size(batch_size)
+    batch = []
+
+    def _flush(orders):
+        product_ids = [i.get('product_id') for o in orders for i in o.get('items', []) if i.get('product_id')]
+        products = fetch_products_by_ids(db, product_ids)
+        ops = []
+        for order in orders:
+            items = order.get('items', [])
+            seller_ids = stamp_sellers(items, products)
+            ops.append(UpdateOne(
+                {'_id': order['_id']},
+                {'$set': {'items': items, 'seller_ids': seller_ids}},
+            ))
+        if ops:
+            return db.orders.bulk_write(ops, ordered=False).modified_count
+        return 0
+
+    for order in cursor:
+        batch.append(order)
+        if len(batch) >= batch_size:
+            updated += _flush(batch)
+            batch = []
+    if batch:
+        updated += _flush(batch)
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Order maintenance')
+    parser.add_argument('--backfill-seller-ids', action='store_true',
+                        help='Stamp seller_ids / item farmer_id and seller_refs on existing orders')
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    from config import config
+
+    client = None
+    try:
+        client = MongoClient(config['development'].MONGODB_URI)
+        db = client.get_database()
+        if args.backfill_seller_ids:
+            print(f"✅ Backfilled seller_ids on {backfill_seller_ids(db)} order(s)")
+        else:
+            parser.print_help()
+    finally:
+        if client:
+            client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,11 +8,34 @@ distinguish authentic DTI permits from random images.
 
 Does NOT require Tesseract OCR; uses purely vision-based text metrics
 so the model can be trained on any machine.
+
+Feature schemas
+---------------
+A classifier must be used with the schema it was trained on
+(``train_permit_model.py`` records it in ``model_metadata.json`` as
+``feature_schema_version``); ``feature_names(schema)`` gives the vector
+layout.
+
+* ``1`` - legacy: every extractor runs on the full-resolution image.
+* ``2`` - resolution-normalised: the image is downscaled once to fit
+  ``STANDARD_SIZE`` and every extractor works on that frame (and its shared
+  gray/HSV planes).  ``width``/``height``/``image_area``/``aspect_ratio``
+  still describe the original upload.
+* ``3`` - schema 2 plus ``TEXTURE_FEATURE_NAMES``: LBP code entropy and a
+  4-angle grey-level co-occurrence matrix (0°, 45°, 90°, 135°).
+
+Run ``python permit_feature_extractor.py --benchmark-texture`` to compare
+the texture code against the original ``np.roll`` implementation.
 """
 
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
-from PIL import Image
+
+from permit_image import PermitImage
 
 # Feature names in a fixed, deterministic order (used by training & inference)
 FEATURE_NAMES = [
@@ -33,6 +56,36 @@ FEATURE_NAMES = [
     'lbp_mean', 'lbp_std', 'glcm_contrast', 'glcm_homogeneity',
 ]
 
+# Extra texture features (schema 3+)
+TEXTURE_FEATURE_NAMES = [
+    'lbp_entropy',
+    'glcm_contrast_mean', 'glcm_homogeneity_mean', 'glcm_energy',
+    'glcm_correlation', 'glcm_anisotropy',
+]
+
+LEGACY_FEATURE_SCHEMA = 1
+FEATURE_SCHEMA_VERSION = 3
+FEATURE_SCHEMAS = (1, 2, 3)
+
+
+def feature_names(schema_version):
+    """Ordered feature names produced under ``schema_version``."""
+    if schema_version >= 3:
+        return FEATURE_NAMES + TEXTURE_FEATURE_NAMES
+    return list(FEATURE_NAMES)
+
+
+# Texture engine settings
+TEXTURE_SIZE = (256, 256)
+GLCM_LEVELS = 32
+# (dy, dx) neighbour offsets for 0°, 45°, 90° and 135°
+GLCM_OFFSETS = ((0, 1), (-1, 1), (-1, 0), (-1, -1))
+# LBP neighbours, most significant bit first
+LBP_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+# Images handed to each batch worker per round trip.
+BATCH_CHUNK_SIZE = 8
+
 
 class PermitFeatureExtractor:
     """Extract a fixed-length feature vector from a permit image."""
@@ -41,44 +94,98 @@ class PermitFeatureExtractor:
     # comparable across different cameras / resolutions).
     STANDARD_SIZE = (800, 600)  # width, height
 
-    def __init__(self):
-        pass  # No external dependencies on init
+    def __init__(self, schema_version=FEATURE_SCHEMA_VERSION):
+        if schema_version not in FEATURE_SCHEMAS:
+            raise ValueError(f'Unknown feature schema version: {schema_version}')
+        self.schema_version = schema_version
+        self.feature_names = feature_names(schema_version)
+
+    @property
+    def normalized(self):
+        return self.schema_version >= 2
 
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
-    def extract_all_features(self, image_path):
-        """Return a dict of all features, or None on error."""
+    def extract_all_features(self, image):
+        """Return a dict of all features, or None on error.
+
+        ``image`` is a file path or a ``PermitImage``; the planes computed
+        here stay cached on it for later pipeline stages.
+        """
         try:
-            img = cv2.imread(image_path)
-            if img is None:
+            image = PermitImage.coerce(image)
+            if not image.valid:
                 return None
+            frame = image.fit_within(self.STANDARD_SIZE) if self.normalized else image
             features = {}
-            features.update(self._extract_quality_features(img))
-            features.update(self._extract_document_features(img))
-            features.update(self._extract_text_features(img))
-            features.update(self._extract_color_features(img))
-            features.update(self._extract_edge_features(img))
-            features.update(self._extract_qr_features(img))
-            features.update(self._extract_texture_features(img))
+            features.update(self._extract_quality_features(frame, image))
+            features.update(self._extract_document_features(frame))
+            features.update(self._extract_text_features(frame))
+            features.update(self._extract_color_features(frame))
+            features.update(self._extract_edge_features(frame))
+            features.update(self._extract_qr_features(frame))
+            features.update(self._extract_texture_features(frame))
             return features
         except Exception as e:
             print(f'Error extracting features: {e}')
             return None
 
     def features_to_vector(self, feature_dict):
-        """Convert feature dict → ordered numpy array matching FEATURE_NAMES."""
-        return np.array([float(feature_dict.get(k, 0)) for k in FEATURE_NAMES])
+        """Convert feature dict → ordered numpy array matching ``self.feature_names``."""
+        return np.array([float(feature_dict.get(k, 0)) for k in self.feature_names])
+
+    def iter_batch(self, paths, workers=None, chunksize=BATCH_CHUNK_SIZE):
+        """Yield ``(path, vector_or_None, error_or_None)`` for ``paths``, in order.
+
+        With ``workers`` > 1 images are processed by a process pool
+        (``spawn`` start method, one extractor per worker); ``None`` uses
+        every core and ``1`` runs in this process.
+        """
+        paths = list(paths)
+        workers = (os.cpu_count() or 1) if workers is None else max(1, int(workers))
+        workers = min(workers, len(paths))
+        if workers <= 1:
+            for path in paths:
+                yield (path,) + _extract_vector(self, path)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_batch_worker,
+            initargs=(self.schema_version,),
+        ) as pool:
+            for path, result in zip(paths, pool.map(_batch_worker_extract, paths, chunksize=chunksize)):
+                yield (path,) + result
+
+    def extract_batch(self, paths, workers=None, chunksize=BATCH_CHUNK_SIZE):
+        """Extract feature vectors for many images in parallel.
+
+        Returns ``(X, ok_paths, failures)``: ``X`` is an ``(n, len(self.feature_names))``
+        float32 matrix whose rows match ``ok_paths`` (input order), and
+        ``failures`` lists ``(path, error)`` for images that could not be read.
+        """
+        rows, ok_paths, failures = [], [], []
+        for path, vec, error in self.iter_batch(paths, workers=workers, chunksize=chunksize):
+            if vec is None:
+                failures.append((path, error))
+            else:
+                rows.append(vec)
+                ok_paths.append(path)
+        X = np.asarray(rows, dtype=np.float32).reshape(len(rows), len(self.feature_names))
+        return X, ok_paths, failures
 
     # ------------------------------------------------------------------
     # Individual extractors
     # ------------------------------------------------------------------
-    def _extract_quality_features(self, img):
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def _extract_quality_features(self, image, source):
+        """Sharpness/exposure from ``image``; dimensions from the original ``source``."""
+        gray = image.gray
         laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
         brightness = np.mean(gray)
         contrast = np.std(gray)
-        height, width = gray.shape
+        height, width = source.height, source.width
         resolution = width * height
         return {
             'blur_score': laplacian_var,
@@ -90,9 +197,8 @@ class PermitFeatureExtractor:
             'aspect_ratio': width / height if height > 0 else 0,
         }
 
-    def _extract_document_features(self, img):
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 50, 150)
+    def _extract_document_features(self, image):
+        edges = image.canny
         contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
         num_contours = len(contours)
         areas = [cv2.contourArea(c) for c in contours if cv2.contourArea(c) > 100]
@@ -103,20 +209,19 @@ class PermitFeatureExtractor:
             'edge_density': float(np.sum(edges > 0) / edges.size) if edges.size > 0 else 0,
         }
 
-    def _extract_text_features(self, img):
+    def _extract_text_features(self, image):
         """
         Vision-based text metrics (no OCR needed):
           - text_pixel_ratio: dark-pixel ratio in binarised image
           - horizontal_line_ratio: proxy for text lines (horizontal runs)
           - text_region_count: connected components that look like text blocks
         """
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        binary = image.otsu_inv
 
         text_pixel_ratio = float(np.sum(binary > 0) / binary.size)
 
         # Horizontal projection → count prominent "text-line" peaks
-        h_proj = np.sum(binary, axis=1)
+        h_proj = image.row_projection
         threshold = 0.1 * h_proj.max() if h_proj.max() > 0 else 1
         above = h_proj > threshold
         transitions = np.diff(above.astype(int))
@@ -133,8 +238,9 @@ class PermitFeatureExtractor:
             'text_region_count': text_region_count,
         }
 
-    def _extract_color_features(self, img):
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    def _extract_color_features(self, image):
+        img = image.bgr
+        hsv = image.hsv
         hist_h = cv2.calcHist([hsv], [0], None, [180], [0, 180])
         hist_s = cv2.calcHist([hsv], [1], None, [256], [0, 256])
         hist_v = cv2.calcHist([hsv], [2], None, [256], [0, 256])
@@ -147,8 +253,8 @@ class PermitFeatureExtractor:
             'value_entropy': float(np.sum(hist_v * np.log(hist_v + 1))),
         }
 
-    def _extract_edge_features(self, img):
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def _extract_edge_features(self, image):
+        gray = image.gray
         sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
         sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
         edge_magnitude = np.sqrt(sobelx**2 + sobely**2)
@@ -161,11 +267,17 @@ class PermitFeatureExtractor:
             'edge_magnitude_mean': float(np.mean(edge_magnitude)),
         }
 
-    def _extract_qr_features(self, img):
+    def _extract_qr_features(self, image):
         """Detect QR code presence and relative size using OpenCV's built-in detector."""
         try:
-            detector = cv2.QRCodeDetector()
-            retval, points, _ = detector.detectAndDecode(img)
+            img = image.bgr
+            if self.normalized:
+                # Only the corner points are needed; they are cached on the
+                # frame and reused by the QR scanner.
+                corners = image.qr_corners
+                points = None if corners is None else corners[None]
+            else:
+                _, points, _ = cv2.QRCodeDetector().detectAndDecode(img)
             if points is not None and len(points) > 0:
                 pts = points[0]
                 qr_w = np.linalg.norm(pts[0] - pts[1])
@@ -180,33 +292,188 @@ class PermitFeatureExtractor:
             pass
         return {'has_qr_code': 0.0, 'qr_area_ratio': 0.0}
 
-    def _extract_texture_features(self, img):
+    def _extract_texture_features(self, image):
         """
         Lightweight texture descriptors:
           - LBP (Local Binary Pattern) mean & std  → captures micro-texture
           - Simple GLCM-like contrast & homogeneity → captures macro-texture
+          - schema 3+: LBP entropy and 4-angle GLCM statistics
         """
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         # Resize for speed
-        small = cv2.resize(gray, (256, 256))
+        small = cv2.resize(image.gray, TEXTURE_SIZE)
 
-        # ---- Simple LBP ----
-        lbp = np.zeros_like(small, dtype=np.float64)
-        for dy, dx in [(-1, -1), (-1, 0), (-1, 1), (0, 1),
-                        (1, 1), (1, 0), (1, -1), (0, -1)]:
-            shifted = np.roll(np.roll(small, dy, axis=0), dx, axis=1)
-            lbp = lbp * 2 + (shifted >= small).astype(np.float64)
+        # Schemas 1-2 were trained on np.roll codes, which wrap at the borders.
+        codes = lbp_codes(small, wrap=self.schema_version < 3)
 
         # ---- GLCM-like: co-occurrence at offset (0,1) ----
-        left = small[:, :-1].astype(np.float64)
-        right = small[:, 1:].astype(np.float64)
-        diff = np.abs(left - right)
-        glcm_contrast = float(np.mean(diff ** 2))
-        glcm_homogeneity = float(np.mean(1.0 / (1.0 + diff)))
-
-        return {
-            'lbp_mean': float(np.mean(lbp)),
-            'lbp_std': float(np.std(lbp)),
-            'glcm_contrast': glcm_contrast,
-            'glcm_homogeneity': glcm_homogeneity,
+        diff = np.abs(small[:, :-1].astype(np.int32) - small[:, 1:])
+        features = {
+            'lbp_mean': float(np.mean(codes)),
+            'lbp_std': float(np.std(codes)),
+            'glcm_contrast': float(np.mean(diff * diff)),
+            'glcm_homogeneity': float(np.mean(1.0 / (1.0 + diff))),
         }
+        if self.schema_version >= 3:
+            hist = np.bincount(codes.ravel(), minlength=256) / codes.size
+            nonzero = hist[hist > 0]
+            features['lbp_entropy'] = float(-np.sum(nonzero * np.log2(nonzero)))
+            features.update(glcm_features(small))
+        return features
+
+
+# ----------------------------------------------------------------------
+# Texture engine
+# ----------------------------------------------------------------------
+def lbp_codes(gray, wrap=False):
+    """8-neighbour LBP codes of a uint8 image, as uint8.
+
+    Neighbours are read with slicing from one padded copy.  ``wrap=True``
+    pads cyclically, reproducing the original ``np.roll`` codes; otherwise
+    borders are edge-replicated.
+    """
+    padded = np.pad(gray, 1, mode='wrap' if wrap else 'edge')
+    height, width = gray.shape
+    codes = np.zeros((height, width), dtype=np.uint8)
+    for bit, (dy, dx) in zip(range(7, -1, -1), LBP_OFFSETS):
+        # np.roll(gray, (dy, dx))[y, x] == gray[y - dy, x - dx]
+        neighbour = padded[1 - dy:1 - dy + height, 1 - dx:1 - dx + width]
+        codes |= (neighbour >= gray).view(np.uint8) << bit
+    return codes
+
+
+def glcm_features(gray, levels=GLCM_LEVELS, offsets=GLCM_OFFSETS):
+    """Symmetric, normalised GLCM statistics averaged over ``offsets``.
+
+    Each co-occurrence matrix is a single ``np.bincount`` over the
+    quantised pixel pairs.
+    """
+    quantised = (gray.astype(np.uint16) * levels >> 8).astype(np.intp)
+    height, width = quantised.shape
+    i, j = np.indices((levels, levels))
+    stats = {'contrast': [], 'homogeneity': [], 'energy': [], 'correlation': []}
+    for dy, dx in offsets:
+        y0, y1 = max(0, -dy), height - max(0, dy)
+        x0, x1 = max(0, -dx), width - max(0, dx)
+        ref = quantised[y0:y1, x0:x1]
+        nbr = quantised[y0 + dy:y1 + dy, x0 + dx:x1 + dx]
+        glcm = np.bincount((ref * levels + nbr).ravel(), minlength=levels * levels)
+        glcm = glcm.reshape(levels, levels).astype(np.float64)
+        glcm += glcm.T
+        glcm /= glcm.sum()
+
+        stats['contrast'].append(np.sum(glcm * (i - j) ** 2))
+        stats['homogeneity'].append(np.sum(glcm / (1.0 + np.abs(i - j))))
+        stats['energy'].append(np.sum(glcm * glcm))
+        mu = np.sum(i * glcm)   # symmetric: row and column means match
+        var = np.sum(glcm * (i - mu) ** 2)
+        stats['correlation'].append(np.sum(glcm * (i - mu) * (j - mu)) / var if var > 0 else 1.0)
+
+    contrast = np.asarray(stats['contrast'])
+    return {
+        'glcm_contrast_mean': float(contrast.mean()),
+        'glcm_homogeneity_mean': float(np.mean(stats['homogeneity'])),
+        'glcm_energy': float(np.mean(stats['energy'])),
+        'glcm_correlation': float(np.mean(stats['correlation'])),
+        'glcm_anisotropy': float(contrast.max() - contrast.min()),
+    }
+
+
+def _legacy_texture_features(small):
+    """The original np.roll / float64 texture code, kept for benchmarking."""
+    lbp = np.zeros_like(small, dtype=np.float64)
+    for dy, dx in LBP_OFFSETS:
+        shifted = np.roll(np.roll(small, dy, axis=0), dx, axis=1)
+        lbp = lbp * 2 + (shifted >= small).astype(np.float64)
+    left = small[:, :-1].astype(np.float64)
+    right = small[:, 1:].astype(np.float64)
+    diff = np.abs(left - right)
+    return {
+        'lbp_mean': float(np.mean(lbp)),
+        'lbp_std': float(np.std(lbp)),
+        'glcm_contrast': float(np.mean(diff ** 2)),
+        'glcm_homogeneity': float(np.mean(1.0 / (1.0 + diff))),
+    }
+
+
+def benchmark_texture(image_path=None, repeats=200):
+    """Time the legacy texture code against schema 2 and schema 3 extraction."""
+    import time
+
+    if image_path:
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise SystemExit(f'Cannot read {image_path}')
+    else:
+        gray = np.random.default_rng(0).integers(0, 256, (900, 1200), dtype=np.uint8)
+    small = cv2.resize(gray, TEXTURE_SIZE)
+    frame = PermitImage(bgr=cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+
+    def _time(fn):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - start) / repeats * 1000
+
+    legacy = _legacy_texture_features(small)
+    current = PermitFeatureExtractor(schema_version=2)._extract_texture_features(frame)
+    mismatches = [k for k in legacy if not np.isclose(legacy[k], current[k], rtol=1e-9, atol=1e-9)]
+
+    print(f"Texture features on {gray.shape[1]}x{gray.shape[0]} image, {repeats} runs")
+    print(f"  legacy np.roll   : {_time(lambda: _legacy_texture_features(small)):.3f} ms")
+    print(f"  LBP (uint8)      : {_time(lambda: lbp_codes(small, wrap=True)):.3f} ms")
+    print(f"  4-angle GLCM     : {_time(lambda: glcm_features(small)):.3f} ms")
+    for schema in (2, 3):
+        extractor = PermitFeatureExtractor(schema_version=schema)
+        print(f"  schema {schema} total   : "
+              f"{_time(lambda: extractor._extract_texture_features(frame)):.3f} ms")
+    print("  schema 2 matches legacy values" if not mismatches
+          else f"  MISMATCH vs legacy: {', '.join(mismatches)}")
+
+
+# ----------------------------------------------------------------------
+# Batch workers
+# ----------------------------------------------------------------------
+_batch_extractor = None
+
+
+def _extract_vector(extractor, path):
+    """Return ``(float32 vector, None)`` or ``(None, error message)``."""
+    try:
+        with PermitImage.open(path) as image:
+            features = extractor.extract_all_features(image)
+    except Exception as e:
+        return None, str(e)
+    if features is None:
+        return None, 'unreadable image'
+    return extractor.features_to_vector(features).astype(np.float32), None
+
+
+def _init_batch_worker(schema_version):
+    global _batch_extractor
+    # One process per core already; keep OpenCV from oversubscribing.
+    cv2.setNumThreads(1)
+    _batch_extractor = PermitFeatureExtractor(schema_version=schema_version)
+
+
+def _batch_worker_extract(path):
+    return _extract_vector(_batch_extractor, path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Permit feature extractor utilities')
+    parser.add_argument('--benchmark-texture', action='store_true',
+                        help='Benchmark the texture features against the original implementation')
+    parser.add_argument('--image', help='Image to benchmark on (default: random 1200x900 noise)')
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.benchmark_texture:
+        benchmark_texture(args.image, repeats=args.repeats)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Decode-once image context for the permit verification pipeline.
+
+A ``PermitImage`` reads the file from disk once and lazily caches the
+derived planes every stage needs (grayscale, HSV, Otsu binarisation, CLAHE,
+Canny edges, ...).  ``ImageVerificationSystem`` and
+``PermitFeatureExtractor`` accept either a file path or a ``PermitImage``,
+so one submission is decoded and converted exactly once no matter how many
+stages look at it.
+
+    with PermitImage.open(path) as image:
+        verifier.verify_permit_image(image)
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+CANNY_THRESHOLDS = (50, 150)
+# QR localisation runs on these downscaled copies in turn.  The first one
+# matches PermitFeatureExtractor.STANDARD_SIZE, so detection is shared with
+# the feature extractor's frame.
+QR_DETECT_SIZES = ((800, 600), (1600, 1200))
+# Quiet-zone margin added around the QR (fraction of its side) and the
+# side length range of the rectified patch.
+QR_PATCH_MARGIN = 0.15
+QR_PATCH_MIN_SIDE = 300
+QR_PATCH_MAX_SIDE = 1000
+
+
+class PermitImage:
+    """A decoded BGR image plus lazily computed, cached derived planes."""
+
+    def __init__(self, path=None, bgr=None):
+        self.path = path
+        self._bgr = bgr
+        self._decoded = bgr is not None
+        self._planes = {}
+
+    @classmethod
+    def open(cls, path):
+        return cls(path=path)
+
+    @classmethod
+    def coerce(cls, image):
+        """Return ``image`` as a ``PermitImage`` (wrapping a path if needed)."""
+        if isinstance(image, cls):
+            return image
+        return cls(path=image)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def release(self):
+        """Drop the decoded pixels and every cached plane."""
+        self._planes.clear()
+        self._bgr = None
+        self._decoded = False
+
+    def _plane(self, name, build):
+        plane = self._planes.get(name)
+        if plane is None:
+            plane = build()
+            self._planes[name] = plane
+        return plane
+
+    def memo(self, key, build):
+        """Cache any per-image result (e.g. OCR text) alongside the planes."""
+        return self._plane(('memo', key), build)
+
+    # ------------------------------------------------------------------
+    # Source pixels
+    # ------------------------------------------------------------------
+    @property
+    def bgr(self):
+        """The decoded image (BGR, as ``cv2.imread`` returns), or ``None``."""
+        if not self._decoded:
+            self._bgr = cv2.imread(self.path) if self.path else None
+            self._decoded = True
+        return self._bgr
+
+    @property
+    def valid(self):
+        return self.bgr is not None
+
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    @property
+    def height(self):
+        return self.bgr.shape[0]
+
+    @property
+    def width(self):
+        return self.bgr.shape[1]
+
+    def fit_within(self, size):
+        """A downscaled ``PermitImage`` whose long/short sides fit ``size``.
+
+        The aspect ratio is kept and images that already fit are returned
+        as-is.  The result is cached, so its own planes are shared too.
+        """
+        long_side, short_side = max(size), min(size)
+        height, width = self.height, self.width
+        scale = min(long_side / max(height, width), short_side / min(height, width))
+        if scale >= 1.0:
+            return self
+
+        def _build():
+            dsize = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+            small = cv2.resize(self.bgr, dsize, interpolation=cv2.INTER_AREA)
+            return PermitImage(path=self.path, bgr=small)
+        return self._plane(('fit', long_side, short_side), _build)
+
+    # ------------------------------------------------------------------
+    # Derived planes (computed on first use)
+    # ------------------------------------------------------------------
+    @property
+    def rgb(self):
+        return self._plane('rgb', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    @property
+    def pil(self):
+        """RGB ``PIL.Image`` view for the PIL-based enhancement filters."""
+        return self._plane('pil', lambda: Image.fromarray(self.rgb))
+
+    @property
+    def gray(self):
+        return self._plane('gray', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def hsv(self):
+        return self._plane('hsv', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV))
+
+    @property
+    def otsu(self):
+        """Otsu-binarised grayscale (dark text on white)."""
+        return self._plane('otsu', lambda: cv2.threshold(
+            self.gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1])
+
+    @property
+    def otsu_inv(self):
+        """Inverse of ``otsu`` (ink pixels set), as used by the text metrics."""
+        return self._plane('otsu_inv', lambda: cv2.bitwise_not(self.otsu))
+
+    @property
+    def clahe(self):
+        def _build():
+            clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+            return clahe.apply(self.gray)
+        return self._plane('clahe', _build)
+
+    @property
+    def clahe_otsu(self):
+        """Otsu binarisation of the CLAHE plane (the OCR input)."""
+        return self._plane('clahe_otsu', lambda: cv2.threshold(
+            self.clahe, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1])
+
+    @property
+    def canny(self):
+        return self._plane('canny', lambda: cv2.Canny(self.gray, *CANNY_THRESHOLDS))
+
+    # ------------------------------------------------------------------
+    # QR localisation
+    # ------------------------------------------------------------------
+    def _detect_qr_here(self):
+        """``cv2.QRCodeDetector`` corners on this image's own pixels (cached)."""
+        def _build():
+            found, points = cv2.QRCodeDetector().detect(self.gray)
+            if not found or points is None or len(points) == 0:
+                return np.zeros((0, 2), dtype=np.float32)
+            return points.reshape(-1, 2)[:4].astype(np.float32)
+        return self._plane('qr_detect', _build)
+
+    @property
+    def qr_corners(self):
+        """Corners (4x2, this image's pixel coordinates) of the QR code, or ``None``.
+
+        Detection runs on the ``QR_DETECT_SIZES`` copies, smallest first, and
+        the points are scaled back up.
+        """
+        def _build():
+            for size in QR_DETECT_SIZES:
+                frame = self.fit_within(size)
+                corners = frame._detect_qr_here()
+                if len(corners):
+                    scale = np.float32([self.width / frame.width, self.height / frame.height])
+                    return corners * scale
+                if frame is self:
+                    break
+            return np.zeros((0, 2), dtype=np.float32)
+        corners = self._plane('qr_corners', _build)
+        return corners if len(corners) else None
+
+    @property
+    def qr_patch(self):
+        """Perspective-rectified square crop of the QR code as a ``PermitImage``, or ``None``.
+
+        The crop keeps a ``QR_PATCH_MARGIN`` quiet zone around the code.
+        """
+        def _build():
+            corners = self.qr_corners
+            if corners is None:
+                return False
+            grow = 1 + 2 * QR_PATCH_MARGIN
+            centre = corners.mean(axis=0)
+            quad = (centre + (corners - centre) * grow).astype(np.float32)
+            edge = float(np.linalg.norm(np.roll(corners, -1, axis=0) - corners, axis=1).max())
+            side = int(min(QR_PATCH_MAX_SIDE, max(QR_PATCH_MIN_SIDE, edge * grow)))
+            target = np.float32([[0, 0], [side - 1, 0], [side - 1, side - 1], [0, side - 1]])
+            matrix = cv2.getPerspectiveTransform(quad, target)
+            patch = cv2.warpPerspective(self.bgr, matrix, (side, side),
+                                        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            return PermitImage(path=self.path, bgr=patch)
+        patch = self._plane('qr_patch', _build)
+        return patch if patch is not False else None
+
+    @property
+    def row_projection(self):
+        """Ink pixels per row of ``otsu_inv`` (the horizontal text-line profile)."""
+        return self._plane('row_projection', lambda: np.sum(self.otsu_inv, axis=1))
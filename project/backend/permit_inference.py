@@ -0,0 +1,369 @@
+"""
+Resident inference service for the permit classifier.
+
+Without it every process that verifies permits (each verification worker,
+``rescore_permits.py``) loads its own copy of ``permit_classifier.pkl``.
+Run one server per host instead:
+
+    python permit_inference.py                # listens on PERMIT_INFERENCE_ADDRESS
+
+and set ``PERMIT_INFERENCE_ADDRESS`` for the web app as well;
+``ImageVerificationSystem`` then sends feature vectors to the server instead
+of loading the model, and falls back to loading it locally if the server
+cannot be reached.
+
+The server holds the model once.  Each connection is served by its own
+thread, which queues requests for a single batching thread.  That thread
+collects everything that arrives within ``INFERENCE_BATCH_WINDOW`` seconds
+(up to ``INFERENCE_MAX_BATCH`` rows) and scores it with one ``predict_proba``
+call.  ``python permit_inference.py --stats`` prints queue depth and batch
+size statistics from a running server.
+
+The address is a Unix socket path (default) or ``host:port``.  Requests
+travel as pickles, so a peer that authenticates can run code in the server:
+``PERMIT_INFERENCE_AUTHKEY`` must be set to a secret shared by the server and
+its clients (the server refuses to start without it, clients fall back to
+the local model).  The default socket lives in a per-user 0700 directory and
+is created with mode 0600.
+"""
+import argparse
+import getpass
+import hashlib
+import json
+import os
+import queue
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(_SCRIPT_DIR, 'ml_models')
+MODEL_PATH = os.path.join(MODEL_DIR, 'permit_classifier.pkl')
+METADATA_PATH = os.path.join(MODEL_DIR, 'model_metadata.json')
+
+INFERENCE_ADDRESS = os.environ.get('PERMIT_INFERENCE_ADDRESS') or ''
+INFERENCE_AUTHKEY = (os.environ.get('PERMIT_INFERENCE_AUTHKEY') or '').encode()
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH') or 64)
+INFERENCE_BATCH_WINDOW = float(os.environ.get('INFERENCE_BATCH_WINDOW') or 0.005)
+INFERENCE_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT') or 10)
+
+_SOCKET_OWNER = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+DEFAULT_SOCKET_DIR = os.path.join(tempfile.gettempdir(), f'farmtoclick-inference-{_SOCKET_OWNER}')
+DEFAULT_SOCKET = os.path.join(DEFAULT_SOCKET_DIR, 'permit.sock')
+
+
+# ---------------------------------------------------------------------------
+# Model helpers (shared with ImageVerificationSystem and rescore_permits.py)
+# ---------------------------------------------------------------------------
+def load_permit_classifier(model_path=MODEL_PATH, metadata_path=METADATA_PATH):
+    """Load the trained classifier.
+
+    Returns ``(model, schema_version, model_version)``; ``model_version`` is a
+    content hash of the pickle plus the feature schema.  Raises
+    ``FileNotFoundError`` when no model has been trained.
+    """
+    import joblib
+    from permit_feature_extractor import LEGACY_FEATURE_SCHEMA
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(model_path)
+    model = joblib.load(model_path)
+    # Models trained before feature schemas existed used full-resolution features.
+    schema_version = LEGACY_FEATURE_SCHEMA
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            schema_version = json.load(f).get('feature_schema_version', LEGACY_FEATURE_SCHEMA)
+    with open(model_path, 'rb') as f:
+        model_version = f"{hashlib.sha256(f.read()).hexdigest()[:16]}-f{schema_version}"
+    return model, schema_version, model_version
+
+
+def score_matrix(model, X):
+    """Return ``(labels, confidences)`` for every row of ``X`` in one model call."""
+    if hasattr(model, 'predict_proba'):
+        proba = model.predict_proba(X)
+        classes = np.asarray(getattr(model, 'classes_', np.arange(proba.shape[1])))
+        return classes[proba.argmax(axis=1)], proba.max(axis=1)
+    labels = np.asarray(model.predict(X))
+    return labels, np.where(labels == 1, 0.85, 0.15)
+
+
+def parse_address(address):
+    """``host:port`` → tuple, anything else is a Unix socket path."""
+    address = address or DEFAULT_SOCKET
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return (host or '127.0.0.1', int(port))
+    return address
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+class MicroBatcher:
+    """Collects concurrent scoring requests into batches for one model call."""
+
+    def __init__(self, model, max_batch=INFERENCE_MAX_BATCH, window=INFERENCE_BATCH_WINDOW):
+        self.model = model
+        self.max_batch = max_batch
+        self.window = window
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = Counter()
+        self.total_latency = 0.0
+        self._thread = threading.Thread(target=self._run, name='permit-batcher', daemon=True)
+        self._thread.start()
+
+    def score(self, X):
+        """Score the rows of ``X`` (blocking); returns ``(labels, confidences)``."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        expected = getattr(self.model, 'n_features_in_', None)
+        if expected is not None and X.shape[1] != expected:
+            # Reject here so one bad request cannot fail a whole batch.
+            raise ValueError(f'expected {expected} features, got {X.shape[1]}')
+        slot = {'X': X, 'done': threading.Event(), 'queued_at': time.monotonic()}
+        self._queue.put(slot)
+        with self._stats_lock:
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        slot['done'].wait()
+        if 'error' in slot:
+            raise slot['error']
+        return slot['labels'], slot['confidences']
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        rows = len(batch[0]['X'])
+        deadline = time.monotonic() + self.window
+        while rows < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                slot = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(slot)
+            rows += len(slot['X'])
+        return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._collect()
+            try:
+                labels, confidences = score_matrix(self.model, np.vstack([slot['X'] for slot in batch]))
+                offset = 0
+                for slot in batch:
+                    n = len(slot['X'])
+                    slot['labels'] = labels[offset:offset + n].tolist()
+                    slot['confidences'] = confidences[offset:offset + n].tolist()
+                    offset += n
+            except Exception as e:
+                for slot in batch:
+                    slot['error'] = e
+            now = time.monotonic()
+            with self._stats_lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.rows += rows
+                self.batch_sizes[rows] += 1
+                self.total_latency += sum(now - slot['queued_at'] for slot in batch)
+            for slot in batch:
+                slot['done'].set()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'requests': self.requests,
+                'rows': self.rows,
+                'batches': self.batches,
+                'avg_batch_rows': round(self.rows / self.batches, 2) if self.batches else 0,
+                'avg_latency_ms': round(self.total_latency / self.requests * 1000, 2) if self.requests else 0,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+            }
+
+
+def _serve_connection(conn, batcher, info):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            op = request.get('op')
+            try:
+                if op == 'predict':
+                    labels, confidences = batcher.score(request['vectors'])
+                    conn.send({'ok': True, 'labels': labels, 'confidences': confidences})
+                elif op == 'stats':
+                    conn.send({'ok': True, 'stats': batcher.stats()})
+                elif op == 'info':
+                    conn.send({'ok': True, 'info': info})
+                else:
+                    conn.send({'ok': False, 'error': f'unknown op {op!r}'})
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                conn.send({'ok': False, 'error': str(e)})
+
+
+def _prepare_socket_path(path):
+    """Make ``path`` safe to bind: private default directory, no live server on it."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory == DEFAULT_SOCKET_DIR:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.lstat(directory)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise RuntimeError(f'{directory} must be a directory owned by this user with mode 0700')
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise RuntimeError(f'{path} exists and is not a socket')
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)  # stale socket from a previous run
+    else:
+        raise RuntimeError(f'another inference server is already listening on {path}')
+    finally:
+        probe.close()
+
+
+def serve(address=INFERENCE_ADDRESS):
+    if not INFERENCE_AUTHKEY:
+        raise RuntimeError('PERMIT_INFERENCE_AUTHKEY must be set to a shared secret')
+    address = parse_address(address)
+    if isinstance(address, str):
+        _prepare_socket_path(address)
+
+    model, schema_version, model_version = load_permit_classifier()
+    info = {'model_version': model_version, 'schema_version': schema_version, 'pid': os.getpid()}
+    batcher = MicroBatcher(model)
+
+    if isinstance(address, str):
+        # Owner-only from the moment it is bound, not after a chmod.
+        old_umask = os.umask(0o177)
+        try:
+            listener = Listener(address, authkey=INFERENCE_AUTHKEY)
+        finally:
+            os.umask(old_umask)
+    else:
+        listener = Listener(address, authkey=INFERENCE_AUTHKEY)
+    print(f"✅ Permit inference server ready on {address} (model {model_version})")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # e.g. a client with the wrong authkey
+                print(f"⚠️ Rejected inference connection: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, batcher, info), daemon=True).start()
+    finally:
+        listener.close()
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+class InferenceUnavailable(Exception):
+    """The inference server could not be reached or returned an error."""
+
+
+class InferenceClient:
+    """Thread-safe client; each thread keeps its own connection."""
+
+    def __init__(self, address=INFERENCE_ADDRESS, timeout=INFERENCE_TIMEOUT):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not INFERENCE_AUTHKEY:
+                raise InferenceUnavailable('PERMIT_INFERENCE_AUTHKEY is not set')
+            try:
+                conn = Client(self.address, authkey=INFERENCE_AUTHKEY)
+            except Exception as e:
+                raise InferenceUnavailable(f'cannot connect to {self.address}: {e}') from e
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, request):
+        for attempt in (1, 2):
+            conn = self._conn()
+            try:
+                conn.send(request)
+                if not conn.poll(self.timeout):
+                    self._drop()
+                    raise InferenceUnavailable('inference server timed out')
+                response = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                # Server restarted since this connection was opened; reconnect once.
+                self._drop()
+                if attempt == 2:
+                    raise InferenceUnavailable(str(e)) from e
+        if not response.get('ok'):
+            raise InferenceUnavailable(response.get('error', 'inference failed'))
+        return response
+
+    def info(self):
+        return self._call({'op': 'info'})['info']
+
+    def stats(self):
+        return self._call({'op': 'stats'})['stats']
+
+    def predict(self, X):
+        """Return ``(labels, confidences)`` lists for the rows of ``X``."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        response = self._call({'op': 'predict', 'vectors': X})
+        return response['labels'], response['confidences']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Permit classifier inference server')
+    parser.add_argument('--address', default=INFERENCE_ADDRESS,
+                        help=f'Unix socket path or host:port (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--stats', action='store_true', help='Print statistics from a running server')
+    args = parser.parse_args()
+
+    sys.path.insert(0, _SCRIPT_DIR)
+    if args.stats:
+        client = InferenceClient(args.address)
+        print(json.dumps({'info': client.info(), 'stats': client.stats()}, indent=2))
+        return
+    try:
+        serve(args.address)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
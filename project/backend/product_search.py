@@ -0,0 +1,195 @@
+"""
+Full-text product search backed by a weighted MongoDB text index.
+
+The index itself is declared in ``indexes.INDEX_SPECS``.  When it is missing
+(fresh database, index build still running) searches fall back to an
+escaped, case-insensitive ``$regex`` on the product name so the storefront
+keeps working, just without relevance ranking.
+
+    python product_search.py --backfill-farm-names
+
+copies each farmer's ``farm_name`` onto their products so older listings are
+searchable by farm as well.
+"""
+import argparse
+import html
+import re
+
+from pymongo.errors import OperationFailure
+
+TEXT_INDEX_NAME = 'product_text_search'
+TEXT_INDEX_WEIGHTS = {
+    'name': 10,
+    'category': 5,
+    'farm_name': 3,
+    'description': 1,
+}
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+SNIPPET_WIDTH = 160
+
+# MongoDB error code for "text index required for $text query".
+_INDEX_NOT_FOUND = 27
+
+SEARCH_PROJECTION = {
+    'name': 1,
+    'description': 1,
+    'price': 1,
+    'image': 1,
+    'image_url': 1,
+    'farmer_name': 1,
+    'farm_name': 1,
+    'category': 1,
+    'quantity': 1,
+    'unit': 1,
+    'location': 1,
+    'id': 1,
+}
+
+
+def _terms(query_text):
+    return [t for t in re.findall(r'\w+', query_text.lower()) if len(t) > 1]
+
+
+def highlight_snippet(text, terms, width=SNIPPET_WIDTH):
+    """Return an HTML-escaped excerpt of ``text`` with ``terms`` wrapped in <mark>.
+
+    The excerpt is centred on the first matching term; without a match the
+    start of the text is used.
+    """
+    if not text:
+        return ''
+    text = str(text)
+    lower = text.lower()
+    first = min((i for i in (lower.find(t) for t in terms) if i >= 0), default=0)
+    start = max(0, first - width // 3)
+    end = min(len(text), start + width)
+    excerpt = text[start:end]
+
+    # Match on the raw text and escape each piece, so a term like "amp"
+    # can never land inside an entity the escaping produced.
+    parts, pos = [], 0
+    if terms:
+        pattern = re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+        for m in pattern.finditer(excerpt):
+            parts.append(html.escape(excerpt[pos:m.start()]))
+            parts.append(f'<mark>{html.escape(m.group(0))}</mark>')
+            pos = m.end()
+    parts.append(html.escape(excerpt[pos:]))
+    escaped = ''.join(parts)
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return f'{prefix}{escaped}{suffix}'
+
+
+def search_products(db, query_text, category=None, page=1, per_page=DEFAULT_PER_PAGE):
+    """Run a relevance-ranked product search.
+
+    Returns a dict with ``results`` (product docs, each with ``score`` and
+    ``highlight``), ``page``, ``per_page``, ``has_more`` and ``mode``
+    (``'text'`` or ``'fallback'``).  ``per_page=None`` returns every match
+    on one page.
+    """
+    query_text = (query_text or '').strip()
+    if per_page is None:
+        page, skip, limit = 1, 0, 0
+    else:
+        page = max(1, int(page or 1))
+        per_page = max(1, min(int(per_page or DEFAULT_PER_PAGE), MAX_PER_PAGE))
+        skip, limit = (page - 1) * per_page, per_page + 1
+    terms = _terms(query_text)
+
+    base = {'available': True}
+    if category:
+        base['category'] = category
+
+    mode = 'text'
+    try:
+        text_query = dict(base, **{'$text': {'$search': query_text}})
+        projection = dict(SEARCH_PROJECTION, score={'$meta': 'textScore'})
+        docs = list(
+            db.products.find(text_query, projection)
+            .sort([('score', {'$meta': 'textScore'})])
+            .skip(skip)
+            .limit(limit)
+        )
+    except OperationFailure as e:
+        if e.code != _INDEX_NOT_FOUND:
+            raise
+        print(f"⚠️ Product text index missing, falling back to regex search: {e}")
+        mode = 'fallback'
+        regex_query = dict(base, name={'$regex': re.escape(query_text), '$options': 'i'})
+        docs = list(
+            db.products.find(regex_query, SEARCH_PROJECTION)
+            .sort('created_at', -1)
+            .skip(skip)
+            .limit(limit)
+        )
+
+    has_more = per_page is not None and len(docs) > per_page
+    if has_more:
+        docs = docs[:per_page]
+    for doc in docs:
+        doc['_id'] = str(doc['_id'])
+        doc['id'] = doc.get('id') or doc['_id']
+        doc['score'] = round(float(doc.get('score', 0) or 0), 4)
+        doc['highlight'] = {
+            'name': highlight_snippet(doc.get('name', ''), terms),
+            'description': highlight_snippet(doc.get('description', ''), terms),
+        }
+
+    return {
+        'results': docs,
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more,
+        'mode': mode,
+    }
+
+
+def backfill_farm_names(db):
+    """Copy ``farm_name`` from each farmer onto products that lack it."""
+    updated = 0
+    for farmer in db.users.find({'role': 'farmer', 'farm_name': {'$nin': [None, '']}},
+                                {'id': 1, 'email': 1, 'farm_name': 1}):
+        refs = [r for r in (farmer.get('id'), str(farmer['_id'])) if r]
+        result = db.products.update_many(
+            {
+                '$or': [
+                    {'farmer': {'$in': refs}},
+                    {'farmer_user_id': {'$in': refs}},
+                    {'farmer_email': farmer.get('email')},
+                ],
+                'farm_name': {'$in': [None, '']},
+            },
+            {'$set': {'farm_name': farmer['farm_name']}},
+        )
+        updated += result.modified_count
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Product search maintenance')
+    parser.add_argument('--backfill-farm-names', action='store_true',
+                        help='Copy farmer farm_name onto their products for text search')
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    from config import config
+
+    client = None
+    try:
+        client = MongoClient(config['development'].MONGODB_URI)
+        db = client.get_database()
+        if args.backfill_farm_names:
+            print(f"✅ Backfilled farm_name on {backfill_farm_names(db)} product(s)")
+        else:
+            parser.print_help()
+    finally:
+        if client:
+            client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Order receipt PDFs, rendered off the request path and cached in GridFS.
+
+Receipts are keyed by order id.  ``schedule_receipt`` renders one in a small
+background pool right after checkout; the email outbox and the
+``/api/orders/<id>/receipt`` download both go through ``get_receipt_pdf``,
+which serves the stored copy and only renders on a miss.  A receipt only
+shows what is fixed at checkout (items, total, shipping name, buyer and
+``created_at``); status and payment changes never touch those fields, so a
+stored copy is never stale and there is nothing to invalidate.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import gridfs
+from gridfs.errors import NoFile
+
+from helpers import generate_receipt_pdf
+
+RECEIPT_BUCKET = 'receipts'
+RECEIPT_WORKERS = int(os.environ.get('RECEIPT_WORKERS') or 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = set()
+_inflight_lock = threading.Lock()
+# One render at a time per order within this process.
+_render_locks = {}
+
+
+def receipt_filename(order_id):
+    return f"FarmtoClick-Receipt-{order_id}.pdf"
+
+
+def _bucket(db):
+    return gridfs.GridFSBucket(db, bucket_name=RECEIPT_BUCKET)
+
+
+def load_cached_receipt(db, order_id):
+    """Return the stored PDF bytes for ``order_id``, or ``None``."""
+    try:
+        return _bucket(db).open_download_stream_by_name(receipt_filename(order_id)).read()
+    except NoFile:
+        return None
+
+
+def _find_order(db, order_id):
+    from bson import ObjectId
+
+    if ObjectId.is_valid(str(order_id)):
+        order_doc = db.orders.find_one({'_id': ObjectId(str(order_id))})
+        if order_doc:
+            return order_doc
+    return db.orders.find_one({'_id': order_id})
+
+
+def render_receipt(db, order_id):
+    """Render the receipt for ``order_id`` and store it.  Returns the PDF bytes."""
+    order_doc = _find_order(db, order_id)
+    if not order_doc:
+        return None
+
+    buyer = db.users.find_one({'id': order_doc.get('user_id')}, {'email': 1, 'first_name': 1})
+    if not buyer:
+        buyer = db.users.find_one({'_id': order_doc.get('user_id')}, {'email': 1, 'first_name': 1})
+    buyer_name = order_doc.get('shipping_name') or (buyer.get('first_name') if buyer else '')
+    buyer_email = buyer.get('email') if buyer else ''
+
+    pdf = generate_receipt_pdf(
+        str(order_doc['_id']),
+        buyer_name,
+        buyer_email,
+        order_doc.get('items', []),
+        float(order_doc.get('total_amount', 0) or 0),
+        issued_at=order_doc.get('created_at'),
+    )
+    _bucket(db).upload_from_stream(
+        receipt_filename(order_id),
+        pdf,
+        metadata={'order_id': str(order_id), 'contentType': 'application/pdf'},
+    )
+    return pdf
+
+
+def get_receipt_pdf(db, order_id):
+    """Return the receipt PDF for ``order_id``, rendering it on a cache miss."""
+    order_id = str(order_id)
+    pdf = load_cached_receipt(db, order_id)
+    if pdf is not None:
+        return pdf
+
+    with _inflight_lock:
+        lock = _render_locks.setdefault(order_id, threading.Lock())
+    with lock:
+        pdf = load_cached_receipt(db, order_id)
+        if pdf is None:
+            pdf = render_receipt(db, order_id)
+    with _inflight_lock:
+        _render_locks.pop(order_id, None)
+    return pdf
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RECEIPT_WORKERS, thread_name_prefix='receipt')
+        return _executor
+
+
+def _render_job(app, order_id):
+    from db import get_mongodb_db
+
+    try:
+        with app.app_context():
+            db, _ = get_mongodb_db()
+            if db is not None:
+                get_receipt_pdf(db, order_id)
+    except Exception as e:
+        print(f"⚠️ Receipt render failed for order {order_id}: {e}")
+    finally:
+        with _inflight_lock:
+            _inflight.discard(order_id)
+
+
+def schedule_receipt(app, order_id):
+    """Queue a background render of the receipt for ``order_id``.
+
+    ``app`` must be the real application object (``current_app._get_current_object()``).
+    Repeat calls for an order that is already queued are ignored.
+    """
+    order_id = str(order_id)
+    with _inflight_lock:
+        if order_id in _inflight:
+            return False
+        _inflight.add(order_id)
+    _get_executor().submit(_render_job, app, order_id)
+    return True
+
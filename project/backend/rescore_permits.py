@@ -0,0 +1,81 @@
+"""
+Re-score stored permit uploads with the current ML classifier.
+
+After retraining, run this to see how the new model rates every permit
+already uploaded to ``static/uploads/verifications`` (or any directory).
+Features are extracted in parallel with ``PermitFeatureExtractor.extract_batch``
+and the whole matrix is scored in one ``predict_proba`` call (on the resident
+inference server when ``PERMIT_INFERENCE_ADDRESS`` is set).
+
+    python rescore_permits.py                          # summary only
+    python rescore_permits.py --output rescore.csv     # per-file results
+    python rescore_permits.py --dir some/folder --workers 4
+"""
+import argparse
+import csv
+import os
+import sys
+
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _SCRIPT_DIR)
+
+DEFAULT_DIR = os.path.join(_SCRIPT_DIR, 'static', 'uploads', 'verifications')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def collect_permit_paths(directory):
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-score stored permit uploads with the current ML model')
+    parser.add_argument('--dir', default=DEFAULT_DIR, help='Directory of permit images (searched recursively)')
+    parser.add_argument('--workers', type=int, default=None, help='Feature extraction processes (default: all cores)')
+    parser.add_argument('--output', help='Write per-file results to this CSV file')
+    args = parser.parse_args()
+
+    from image_verification import ImageVerificationSystem
+    from permit_inference import score_matrix
+
+    verifier = ImageVerificationSystem()
+    if verifier.ml_model is None and verifier.inference is None:
+        print("❌ No trained ML model available; run train_permit_model.py first.")
+        sys.exit(1)
+
+    paths = collect_permit_paths(args.dir)
+    if not paths:
+        print(f"ℹ️ No permit images found in {args.dir}")
+        return
+    print(f"🔍 Re-scoring {len(paths)} permit image(s) with model {verifier.model_version}...")
+
+    X, ok_paths, failures = verifier.ml_extractor.extract_batch(paths, workers=args.workers)
+    labels, confidences = [], []
+    if len(ok_paths):
+        if verifier.inference is not None:
+            labels, confidences = verifier.inference.predict(X)
+        else:
+            labels, confidences = score_matrix(verifier.ml_model, X)
+
+    authentic = int(sum(1 for label in labels if label == 1))
+    print(f"✅ Scored {len(ok_paths)}: {authentic} authentic, {len(ok_paths) - authentic} non-permit")
+    for path, error in failures:
+        print(f"⚠️ {os.path.relpath(path, args.dir)}: {error}")
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['path', 'label', 'confidence', 'error'])
+            for path, label, confidence in zip(ok_paths, labels, confidences):
+                writer.writerow([path, 'authentic' if label == 1 else 'non_permit', f"{confidence:.4f}", ''])
+            for path, error in failures:
+                writer.writerow([path, '', '', error])
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -461,6 +461,80 @@ def debug_user_info():
         return {'error': str(e), 'traceback': traceback.format_exc()}, 500
 
 
+@admin_bp.route('/api/admin/cache-stats', methods=['GET'])
+@token_required
+def cache_stats():
+    """Hit/miss counters for this worker's in-process caches."""
+    try:
+        from cache import catalog_cache_stats
+
+        db, _ = get_mongodb_db(admin_bp)
+        if db is None:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        admin_user = db.users.find_one({'email': request.user_email, 'role': 'admin'})
+        if not admin_user:
+            return jsonify({'error': 'Admin access required'}), 403
+
+        return jsonify({'catalog': catalog_cache_stats()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/admin/email-outbox', methods=['GET'])
+@token_required
+def email_outbox_status():
+    """Outbox message counts by status plus the most recent failures."""
+    try:
+        from email_outbox import OUTBOX_COLLECTION, outbox_stats
+
+        db, _ = get_mongodb_db(admin_bp)
+        if db is None:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        admin_user = db.users.find_one({'email': request.user_email, 'role': 'admin'})
+        if not admin_user:
+            return jsonify({'error': 'Admin access required'}), 403
+
+        failures = []
+        for doc in db[OUTBOX_COLLECTION].find(
+            {'status': 'failed'},
+            {'to': 1, 'subject': 1, 'attempts': 1, 'last_error': 1, 'updated_at': 1},
+        ).sort('updated_at', -1).limit(20):
+            doc['_id'] = str(doc['_id'])
+            failures.append(doc)
+
+        return jsonify({'counts': outbox_stats(db), 'recent_failures': failures}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/admin/permit-inference', methods=['GET'])
+@token_required
+def permit_inference_status():
+    """Queue depth and batch statistics from the permit inference server."""
+    try:
+        from permit_inference import INFERENCE_ADDRESS, InferenceClient, InferenceUnavailable
+
+        db, _ = get_mongodb_db(admin_bp)
+        if db is None:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        admin_user = db.users.find_one({'email': request.user_email, 'role': 'admin'})
+        if not admin_user:
+            return jsonify({'error': 'Admin access required'}), 403
+
+        if not INFERENCE_ADDRESS:
+            return jsonify({'enabled': False}), 200
+        client = InferenceClient()
+        try:
+            return jsonify({'enabled': True, 'info': client.info(), 'stats': client.stats()}), 200
+        except InferenceUnavailable as e:
+            return jsonify({'enabled': True, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ------------------------------------------------------------------
 # Geocode proxy
 # ------------------------------------------------------------------
@@ -10,10 +10,21 @@ from werkzeug.utils import secure_filename
 import jwt
 
 from db import get_mongodb_db
+from cart_service import fetch_products_by_ids, hydrate_cart
+from cache import get_cached_product, invalidate_catalog, listing_cache
+from catalog import InvalidCursor, list_products_page, parse_listing_args, serialize_listing_product
+from product_search import search_products
+from facets import get_product_facets
+from order_service import (
+    InsufficientStock, find_seller_orders, insufficient_stock, place_order,
+    reserve_available_stock, stamp_sellers,
+)
 from middleware import token_required
-from helpers import allowed_file, MAX_FILE_SIZE, send_system_email, build_email_html, generate_receipt_pdf
+from email_outbox import enqueue_email
+from helpers import allowed_file, MAX_FILE_SIZE, build_email_html
 from lalamove import create_delivery_order, get_delivery_status
 from paymongo import create_checkout_session, PayMongoError, verify_webhook_signature
+from receipts import get_receipt_pdf, receipt_filename, schedule_receipt
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -35,22 +46,22 @@ def _get_paymongo_redirect_urls():
     return success_url, cancel_url
 
 
-def _finalize_paid_order(db, order_doc):
-    from bson import ObjectId
-
+def _finalize_paid_order(db, client, order_doc):
     items = order_doc.get('items', [])
-    for item in items:
-        product_id = item.get('product_id')
-        qty = int(item.get('quantity', 1))
-        if not product_id:
-            continue
-        try:
-            if ObjectId.is_valid(str(product_id)):
-                db.products.update_one({'_id': ObjectId(str(product_id))}, {'$inc': {'quantity': -qty}})
-            else:
-                db.products.update_one({'id': str(product_id)}, {'$inc': {'quantity': -qty}})
-        except Exception:
-            pass
+    try:
+        # The buyer has already paid, so keep whatever stock could be taken
+        # and flag the rest for the seller instead of rejecting the order.
+        stock_outcomes = reserve_available_stock(db, client, items)
+        if not all(o['reserved'] for o in stock_outcomes):
+            short = [o['product_id'] for o in stock_outcomes if not o['reserved']]
+            db.orders.update_one(
+                {'_id': order_doc['_id']},
+                {'$set': {'stock_shortfall': short, 'updated_at': datetime.utcnow()}},
+            )
+            print(f"⚠️ Paid order {order_doc['_id']} short on stock for {short}")
+        invalidate_catalog(*[o['product_id'] for o in stock_outcomes if o['reserved']])
+    except Exception as e:
+        print(f"Stock update error for order {order_doc.get('_id')}: {e}")
 
     try:
         product_ids = [str(item.get('product_id')) for item in items if item.get('product_id')]
@@ -73,7 +84,7 @@ def _finalize_paid_order(db, order_doc):
         total_amount = float(order_doc.get('total_amount', 0) or 0)
 
         if buyer_email:
-            receipt_pdf = generate_receipt_pdf(order_id, shipping_name, buyer_email, items, total_amount)
+            schedule_receipt(current_app._get_current_object(), order_id)
             email_html = build_email_html(
                 title="Payment Confirmed",
                 subtitle="Your payment was received",
@@ -86,18 +97,13 @@ def _finalize_paid_order(db, order_doc):
                     "<p style='margin-top:12px;'>Thank you for shopping with FarmtoClick.</p>"
                 ),
             )
-            send_system_email(
-                current_app,
+            enqueue_email(
+                db,
                 buyer_email,
                 "FarmtoClick Payment Confirmed",
                 f"Order ID: {order_id}\nTotal: {total_amount}",
                 html_body=email_html,
-                attachments=[{
-                    'filename': f"FarmtoClick-Receipt-{order_id}.pdf",
-                    'content': receipt_pdf,
-                    'maintype': 'application',
-                    'subtype': 'pdf',
-                }],
+                receipt_order_id=order_id,
             )
     except Exception as e:
         print(f"Payment confirmation email error: {e}")
@@ -211,27 +217,89 @@ def api_register():
 # ------------------------------------------------------------------
 @api_bp.route('/products', methods=['GET'])
 def api_products():
+    """Product listing, paginated when ``limit`` or ``cursor`` is given.
+
+    Query params: ``limit``, ``cursor``, ``category``, ``min_price``,
+    ``max_price``, ``farmer``.  Without ``limit``/``cursor`` every matching
+    product is returned.  The body stays a plain JSON array; the cursor for
+    the next page (if any) is returned in the ``X-Next-Cursor`` header.
+    """
+    try:
+        try:
+            filters, limit, cursor = parse_listing_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        cache_key = ('api_products', tuple(sorted(filters.items())), limit, cursor)
+        cached = listing_cache.get(cache_key)
+        if cached is None:
+            db, _ = get_mongodb_db(api_bp)
+            if db is None:
+                return jsonify({'error': 'Database connection failed'}), 500
+
+            try:
+                docs, next_cursor = list_products_page(db, filters, limit=limit, cursor=cursor)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            cached = ([serialize_listing_product(p) for p in docs], next_cursor)
+            listing_cache.set(cache_key, cached)
+
+        products, next_cursor = cached
+        response = jsonify(products)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/products/facets', methods=['GET'])
+def api_product_facets():
+    """Category, price-range, farm and location counts for available products."""
     try:
         db, _ = get_mongodb_db(api_bp)
         if db is None:
             return jsonify({'error': 'Database connection failed'}), 500
 
-        products_cursor = db.products.find({'available': True}).sort('created_at', -1)
-        products = []
-        for p in products_cursor:
-            products.append({
-                'id': str(p.get('_id', '')),
-                'name': p.get('name', ''),
-                'description': p.get('description', ''),
-                'price': p.get('price', 0),
-                'image': p.get('image', ''),
-                'farmer_name': p.get('farmer_name', ''),
-                'category': p.get('category', ''),
-                'quantity': p.get('quantity', 0),
-                'unit': p.get('unit', ''),
-                'location': p.get('location', ''),
-            })
-        return jsonify(products)
+        return jsonify(get_product_facets(db))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/products/search', methods=['GET'])
+def api_search_products():
+    """Relevance-ranked product search.  Params: ``q``, ``category``, ``page``, ``per_page``."""
+    try:
+        query_text = (request.args.get('q') or '').strip()
+        if not query_text:
+            return jsonify({'error': 'Search query is required'}), 400
+
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        category = (request.args.get('category') or '').strip() or None
+
+        cache_key = ('api_search', query_text.lower(), category, page, per_page)
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        db, _ = get_mongodb_db(api_bp)
+        if db is None:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        found = search_products(db, query_text, category=category, page=page, per_page=per_page)
+        payload = {
+            'results': [
+                dict(serialize_listing_product(doc), score=doc['score'], highlight=doc['highlight'])
+                for doc in found['results']
+            ],
+            'page': found['page'],
+            'per_page': found['per_page'],
+            'has_more': found['has_more'],
+            'mode': found['mode'],
+        }
+        listing_cache.set(cache_key, payload)
+        return jsonify(payload)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -239,12 +307,11 @@ def api_products():
 @api_bp.route('/products/<product_id>', methods=['GET'])
 def api_product_detail(product_id):
     try:
-        from bson import ObjectId
         db, _ = get_mongodb_db(api_bp)
         if db is None:
             return jsonify({'error': 'Database connection failed'}), 500
 
-        product = db.products.find_one({'_id': ObjectId(product_id)})
+        product = get_cached_product(db, product_id)
         if not product:
             return jsonify({'error': 'Product not found'}), 404
 
@@ -402,8 +469,6 @@ def api_update_profile():
 @token_required
 def api_get_cart():
     try:
-        from bson import ObjectId
-
         db, _ = get_mongodb_db(api_bp)
         if db is None:
             return jsonify({'error': 'Database connection failed'}), 500
@@ -413,31 +478,19 @@ def api_get_cart():
         total = 0.0
 
         if cart_doc:
-            for item in cart_doc.get('items', []):
-                product_id = item.get('product_id')
-                product = None
-                if product_id and ObjectId.is_valid(product_id):
-                    product = db.products.find_one({'_id': ObjectId(product_id)})
-                if not product:
-                    product = db.products.find_one({'id': product_id})
-
-                if not product:
-                    continue
-
-                qty = int(item.get('quantity', 1))
-                price = float(product.get('price', 0) or 0)
+            for line in hydrate_cart(db, cart_doc):
+                product = line['product']
+                product_id = line['product_id']
+                qty = line['quantity']
+                price = line['price']
 
                 farmer = None
-                farmer_ref = product.get('farmer') or product.get('farmer_id') or product.get('farmer_user_id')
-                if farmer_ref:
-                    farmer_doc = db.users.find_one({'id': str(farmer_ref)})
-                    if not farmer_doc and ObjectId.is_valid(str(farmer_ref)):
-                        farmer_doc = db.users.find_one({'_id': ObjectId(str(farmer_ref))})
-                    if farmer_doc:
-                        farmer = {
-                            'full_name': f"{farmer_doc.get('first_name', '')} {farmer_doc.get('last_name', '')}".strip(),
-                            'farm_name': farmer_doc.get('farm_name', ''),
-                        }
+                farmer_doc = line['farmer']
+                if farmer_doc:
+                    farmer = {
+                        'full_name': f"{farmer_doc.get('first_name', '')} {farmer_doc.get('last_name', '')}".strip(),
+                        'farm_name': farmer_doc.get('farm_name', ''),
+                    }
 
                 items.append({
                     'product': {
@@ -641,12 +694,48 @@ def api_order_tracking(order_id):
         return jsonify({'error': str(e)}), 500
 
 
-@api_bp.route('/orders', methods=['POST'])
+@api_bp.route('/orders/<order_id>/receipt', methods=['GET'])
 @token_required
-def api_create_order():
+def api_order_receipt(order_id):
     try:
+        import io
         from bson import ObjectId
+        from flask import send_file
+
+        db, _ = get_mongodb_db(api_bp)
+        if db is None:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        order_doc = None
+        if ObjectId.is_valid(order_id):
+            order_doc = db.orders.find_one({'_id': ObjectId(order_id)}, {'user_id': 1, 'payment_provider': 1, 'payment_status': 1})
+        if not order_doc:
+            return jsonify({'error': 'Order not found'}), 404
+
+        if order_doc.get('user_id') != request.user_id:
+            return jsonify({'error': 'Not authorized'}), 403
+
+        if order_doc.get('payment_provider') == 'paymongo' and order_doc.get('payment_status') != 'paid':
+            return jsonify({'error': 'Payment not confirmed'}), 400
+
+        pdf = get_receipt_pdf(db, order_id)
+        if not pdf:
+            return jsonify({'error': 'Receipt unavailable'}), 404
+
+        return send_file(
+            io.BytesIO(pdf),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=receipt_filename(order_id),
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
+
+@api_bp.route('/orders', methods=['POST'])
+@token_required
+def api_create_order():
+    try:
         data = request.get_json() or {}
         shipping_name = (data.get('shipping_name') or '').strip()
         shipping_phone = (data.get('shipping_phone') or '').strip()
@@ -657,7 +746,7 @@ def api_create_order():
         if not all([shipping_name, shipping_phone, shipping_address, payment_method_raw]):
             return jsonify({'error': 'Please fill out all shipping details and payment method'}), 400
 
-        db, _ = get_mongodb_db(api_bp)
+        db, client = get_mongodb_db(api_bp)
         if db is None:
             return jsonify({'error': 'Database connection failed'}), 500
 
@@ -669,15 +758,14 @@ def api_create_order():
         order_items = []
         total_amount = 0.0
 
-        for item in cart_doc.get('items', []):
+        cart_items = cart_doc.get('items', [])
+        products_by_id = fetch_products_by_ids(db, [i.get('product_id') for i in cart_items if i.get('product_id')])
+
+        for item in cart_items:
             product_id = item.get('product_id')
             qty = int(item.get('quantity', 1))
 
-            product_data = None
-            if product_id and ObjectId.is_valid(product_id):
-                product_data = db.products.find_one({'_id': ObjectId(product_id)})
-            if not product_data:
-                product_data = db.products.find_one({'id': product_id})
+            product_data = products_by_id.get(str(product_id))
             if not product_data:
                 continue
 
@@ -694,18 +782,22 @@ def api_create_order():
             })
             total_amount += price * qty
 
-            if not is_mobile_money:
-                try:
-                    db.products.update_one({'_id': product_data.get('_id')}, {'$inc': {'quantity': -qty}})
-                except Exception:
-                    pass
-
         if not order_items:
             return jsonify({'error': 'Unable to place order. Please try again.'}), 400
 
+        if is_mobile_money:
+            # Stock is taken when the payment clears; just refuse obvious oversells now.
+            short = insufficient_stock(order_items, products_by_id)
+            if short:
+                return jsonify({
+                    'error': 'Some items are out of stock',
+                    'out_of_stock': [line['name'] for line in short],
+                }), 409
+
         order_doc = {
             'user_id': request.user_id,
             'items': order_items,
+            'seller_ids': stamp_sellers(order_items, products_by_id),
             'total_amount': total_amount,
             'status': 'pending',
             'delivery_status': 'pending',
@@ -723,13 +815,23 @@ def api_create_order():
             'updated_at': datetime.utcnow(),
         }
 
-        order_result = db.orders.insert_one(order_doc)
-        order_id = str(order_result.inserted_id)
+        # Stock, order and cart commit together; side effects only run afterwards.
+        try:
+            order_oid = place_order(
+                db, client, order_doc,
+                cart_id=None if is_mobile_money else cart_doc['_id'],
+                reserve=not is_mobile_money,
+            )
+        except InsufficientStock as exc:
+            return jsonify({'error': 'Some items are out of stock', 'out_of_stock': exc.names}), 409
+        order_id = str(order_oid)
         order_doc['_id'] = order_id
+        if not is_mobile_money:
+            invalidate_catalog(*[line['product_id'] for line in order_items])
 
         if not is_mobile_money:
             try:
-                receipt_pdf = generate_receipt_pdf(order_id, shipping_name, request.user_email, order_items, total_amount)
+                schedule_receipt(current_app._get_current_object(), order_id)
                 email_html = build_email_html(
                     title="Order Confirmed",
                     subtitle="Your order is pending seller approval",
@@ -743,24 +845,17 @@ def api_create_order():
                         "<p>Thank you for shopping with FarmtoClick.</p>"
                     ),
                 )
-                send_system_email(
-                    current_app,
+                enqueue_email(
+                    db,
                     request.user_email,
                     "FarmtoClick Order Confirmed - Pending Approval",
                     f"Order ID: {order_id}\nTotal: {total_amount}",
                     html_body=email_html,
-                    attachments=[{
-                        'filename': f"FarmtoClick-Receipt-{order_id}.pdf",
-                        'content': receipt_pdf,
-                        'maintype': 'application',
-                        'subtype': 'pdf',
-                    }],
+                    receipt_order_id=order_id,
                 )
             except Exception as e:
                 print(f"Order confirmation email error: {e}")
 
-            db.carts.delete_one({'_id': cart_doc['_id']})
-
         if is_mobile_money:
             success_url, cancel_url = _get_paymongo_redirect_urls()
             if not success_url or not cancel_url:
@@ -787,7 +882,7 @@ def api_create_order():
                     reference_number=str(order_id),
                 )
                 db.orders.update_one(
-                    {'_id': order_result.inserted_id},
+                    {'_id': order_oid},
                     {'$set': {
                         'paymongo_checkout_id': checkout['id'],
                         'paymongo_checkout_url': checkout['checkout_url'],
@@ -805,7 +900,7 @@ def api_create_order():
                 }), 201
             except PayMongoError as exc:
                 db.orders.update_one(
-                    {'_id': order_result.inserted_id},
+                    {'_id': order_oid},
                     {'$set': {
                         'payment_status': 'failed',
                         'payment_error': str(exc),
@@ -856,7 +951,7 @@ def api_paymongo_webhook():
         if not order_id:
             return jsonify({'received': True}), 200
 
-        db, _ = get_mongodb_db(api_bp)
+        db, client = get_mongodb_db(api_bp)
         if db is None:
             return jsonify({'error': 'Database connection failed'}), 500
 
@@ -874,7 +969,7 @@ def api_paymongo_webhook():
             update_fields['paymongo_payment_id'] = data_payload.get('id')
             update_fields['paid_at'] = datetime.utcnow()
             db.orders.update_one(order_filter, {'$set': update_fields})
-            _finalize_paid_order(db, order_doc)
+            _finalize_paid_order(db, client, order_doc)
         elif event_type in ('payment.failed', 'payment.expired', 'checkout_session.payment.failed'):
             update_fields['payment_status'] = 'failed'
             update_fields['payment_failed_at'] = datetime.utcnow()
@@ -889,7 +984,6 @@ def api_paymongo_webhook():
 @token_required
 def api_farmer_orders():
     try:
-        from bson import ObjectId
         from user_model import User
 
         db, _ = get_mongodb_db(api_bp)
@@ -900,55 +994,13 @@ def api_farmer_orders():
         if not user or getattr(user, 'role', 'user') != 'farmer':
             return jsonify({'error': 'Not authorized'}), 403
 
-        farmer_id = str(user.id)
-        seller_orders = []
-        product_cache = {}
-
-        def _get_product(pid):
-            if pid in product_cache:
-                return product_cache[pid]
-            doc = None
-            try:
-                if ObjectId.is_valid(str(pid)):
-                    doc = db.products.find_one({'_id': ObjectId(str(pid))})
-            except Exception:
-                pass
-            if not doc:
-                doc = db.products.find_one({'id': str(pid)})
-            product_cache[pid] = doc
-            return doc
-
-        for order_doc in db.orders.find().sort('created_at', -1):
-            if order_doc.get('payment_provider') == 'paymongo' and order_doc.get('payment_status') != 'paid':
-                continue
-            order_items = []
-            for item in order_doc.get('items', []):
-                pdoc = _get_product(item.get('product_id'))
-                if not pdoc:
-                    continue
-                if pdoc.get('farmer') != farmer_id and pdoc.get('farmer_user_id') != farmer_id:
-                    continue
-                order_items.append({
-                    'name': item.get('name', pdoc.get('name', 'Product')),
-                    'quantity': item.get('quantity', 1),
-                    'price': item.get('price', pdoc.get('price', 0)),
-                })
-
-            if order_items:
-                buyer = db.users.find_one({'id': order_doc.get('user_id')})
-                seller_orders.append({
-                    'id': str(order_doc.get('_id')),
-                    'status': order_doc.get('status', 'pending'),
-                    'delivery_status': order_doc.get('delivery_status', ''),
-                    'delivery_tracking_id': order_doc.get('delivery_tracking_id'),
-                    'created_at': order_doc.get('created_at'),
-                    'buyer_name': (buyer.get('first_name') if buyer else 'Customer'),
-                    'buyer_email': (buyer.get('email') if buyer else ''),
-                    'items': order_items,
-                    'total_amount': order_doc.get('total_amount', 0),
-                })
-
-        return jsonify({'orders': seller_orders})
+        seller_orders, has_more = find_seller_orders(
+            db,
+            str(user.id),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', type=int),
+        )
+        return jsonify({'orders': seller_orders, 'has_more': has_more})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -989,22 +1041,7 @@ def api_update_order_status(order_id):
         if order_doc.get('payment_provider') == 'paymongo' and order_doc.get('payment_status') != 'paid':
             return jsonify({'success': False, 'message': 'Payment not confirmed'}), 400
 
-        farmer_id = str(user.id)
-
-        def _belongs_to_farmer(item):
-            pid = item.get('product_id')
-            if not pid:
-                return False
-            pdoc = None
-            if ObjectId.is_valid(str(pid)):
-                pdoc = db.products.find_one({'_id': ObjectId(str(pid))})
-            if not pdoc:
-                pdoc = db.products.find_one({'id': str(pid)})
-            if not pdoc:
-                return False
-            return pdoc.get('farmer') == farmer_id or pdoc.get('farmer_user_id') == farmer_id
-
-        if not any(_belongs_to_farmer(item) for item in order_doc.get('items', [])):
+        if str(user.id) not in order_doc.get('seller_ids', []):
             return jsonify({'success': False, 'message': 'Not authorized'}), 403
 
         update_fields = {'status': new_status, 'updated_at': datetime.utcnow()}
@@ -1052,8 +1089,8 @@ def api_update_order_status(order_id):
                         "<p style='margin-top:12px;'>Thank you for shopping with FarmtoClick.</p>"
                     ),
                 )
-                send_system_email(
-                    current_app,
+                enqueue_email(
+                    db,
                     buyer_email,
                     "FarmtoClick Order Status Update",
                     f"Order {order_id} is now {new_status.upper()}.",
@@ -1175,10 +1212,12 @@ def api_farmer_add_product():
             'farmer': str(user.id),
             'farmer_user_id': str(user.id),
             'farmer_email': user.email,
+            'farm_name': getattr(user, 'farm_name', '') or '',
             'created_at': datetime.utcnow(),
         }
 
         result = db.products.insert_one(product_doc)
+        invalidate_catalog()
         product_doc['_id'] = str(result.inserted_id)
         product_doc['id'] = product_doc.get('id') or product_doc['_id']
 
@@ -1259,6 +1298,7 @@ def api_farmer_update_product(product_id):
             return jsonify({'error': 'No valid fields to update'}), 400
 
         db.products.update_one({'_id': product_doc['_id']}, {'$set': update_doc})
+        invalidate_catalog(product_doc['_id'], product_doc.get('id'), product_id)
 
         return jsonify({'message': 'Product updated successfully'})
     except Exception as e:
@@ -1294,6 +1334,7 @@ def api_farmer_delete_product(product_id):
             return jsonify({'error': 'Not authorized'}), 403
 
         db.products.delete_one({'_id': product_doc['_id']})
+        invalidate_catalog(product_doc['_id'], product_doc.get('id'), product_id)
         return jsonify({'message': 'Product deleted successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -5,6 +5,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 
 from db import get_mongodb_db
+from cart_service import hydrate_cart
 
 cart_bp = Blueprint('cart', __name__)
 
@@ -24,28 +25,20 @@ def cart():
 
         items = []
         total = 0
-        for item in cart_doc['items']:
-            product_id = item.get('product_id')
-            product = None
-            try:
-                from bson import ObjectId
-                product = db.products.find_one({'_id': ObjectId(product_id)})
-            except Exception:
-                product = db.products.find_one({'id': product_id})
-
-            if product:
-                qty = int(item.get('quantity', 1))
-                price = float(product.get('price', 0) or 0)
-                items.append({
-                    'product_id': str(product.get('_id', product_id)),
-                    'name': product.get('name', 'Product'),
-                    'price': price,
-                    'quantity': qty,
-                    'unit': product.get('unit', ''),
-                    'image_url': product.get('image_url', ''),
-                    'subtotal': price * qty,
-                })
-                total += price * qty
+        for line in hydrate_cart(db, cart_doc, include_farmers=False):
+            product = line['product']
+            qty = line['quantity']
+            price = line['price']
+            items.append({
+                'product_id': str(product.get('_id', line['product_id'])),
+                'name': product.get('name', 'Product'),
+                'price': price,
+                'quantity': qty,
+                'unit': product.get('unit', ''),
+                'image_url': product.get('image_url', ''),
+                'subtotal': price * qty,
+            })
+            total += price * qty
 
         # Load user's shipping info
         shipping = {}
@@ -11,8 +11,11 @@ from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 
 from db import get_mongodb_db, ensure_mongoengine_user
+from cache import invalidate_catalog
+from order_service import find_seller_orders
 from helpers import allowed_file, MAX_FILE_SIZE
 from middleware import token_required
+from verification_jobs import get_job as get_verification_job, submit_verification_job
 
 farmers_bp = Blueprint('farmers', __name__)
 
@@ -154,100 +157,57 @@ def farmer_verify():
         user.business_verification_image = permit_unique
         user.business_verification_submitted_at = datetime.utcnow()
 
-        verifier = current_app.config.get('VERIFIER')
-        if verifier:
-            ml_result = verifier.verify_permit_image(
-                permit_path,
-                user_business_name=permit_business_name or user.farm_name,
-                user_owner_name=permit_owner_name,
-            )
-            user.business_verification_ml = ml_result
-            verifier.save_verification_record(
-                str(user.id), 
-                ml_result,
-                db=db,
-                user_obj=user,
-                permit_business_name=permit_business_name,
-                permit_owner_name=permit_owner_name,
-                image_filename=permit_unique,
-                image_path=permit_path
-            )
-
-            # Store QR data and business info if available
-            user.permit_qr_data = ml_result.get('qr_data', '')
-            user.permit_extracted_text = ml_result.get('extracted_text', '')
-            if ml_result.get('business_info'):
-                user.dti_business_info = ml_result['business_info']
-            if ml_result.get('ml_prediction'):
-                user.ml_prediction = ml_result['ml_prediction']
-            if ml_result.get('name_verification'):
-                user.name_verification = ml_result['name_verification']
-
-            # Binary outcome: ACCEPT or REJECT
-            # Only accept if ML validation explicitly passes (valid=True)
-            # Don't accept based on confidence alone
-            if ml_result.get('valid'):
-                # ACCEPT: User becomes farmer
-                user.business_verification_status = 'verified'
-                user.role = 'farmer'
-                
-                accept_details = []
-                if ml_result.get('valid'):
-                    accept_details.append('DTI verification passed')
-                    if ml_result.get('dti_validation', {}).get('business_name'):
-                        accept_details.append(f"Business: {ml_result['dti_validation']['business_name']}")
-                    if ml_result.get('dti_validation', {}).get('owner_name'):
-                        accept_details.append(f"Owner: {ml_result['dti_validation']['owner_name']}")
-                
-                ml_pred = ml_result.get('ml_prediction', {})
-                if ml_pred.get('available') and ml_pred.get('is_permit'):
-                    accept_details.append(f"ML confidence: {ml_pred['confidence']:.0%}")
-                
-                nv = ml_result.get('name_verification', {})
-                if nv and nv.get('overall_match') and nv.get('score', 0) > 0.5:
-                    accept_details.append(f"Name match: {nv['score']:.0%}")
-                
-                user.save(db)
-                details_str = ' | '.join(accept_details) if accept_details else ''
-                return jsonify({
-                    'status': 'verified',
-                    'message': f'✅ Business permit accepted! {details_str} You are now a verified farmer.',
-                    'confidence': ml_result.get('confidence', 0),
-                    'confidence_percentage': f"{int(ml_result.get('confidence', 0) * 100)}%",
-                    'user': {
-                        'id': str(user.id),
-                        'role': user.role,
-                        'email': user.email,
-                    }
-                }), 200
-            else:
-                # REJECT: Clear reason provided to user
-                pv = ml_result.get('permit_validation', {})
-                reason = pv.get('message', 'Permit document not recognized')
-                
-                user.business_verification_status = 'rejected'
-                user.save(db)
-                
-                return jsonify({
-                    'status': 'rejected',
-                    'message': f'❌ Permit verification failed: {reason}. Please verify you uploaded a clear image of a valid business permit and try again.',
-                    'confidence': ml_result.get('confidence', 0),
-                    'confidence_percentage': f"{int(ml_result.get('confidence', 0) * 100)}%",
-                }), 400
-        else:
-            # No verifier available - REJECT since we can't verify
-            user.business_verification_status = 'rejected'
-            user.save(db)
-            return jsonify({
-                'status': 'error',
-                'message': '❌ Unable to process permit verification at this time. Please try again later or contact support.',
-            }), 503
+        user.save(db)
+
+        # The ML + QR + OCR + DTI pipeline runs in a worker process; the
+        # client polls GET /farmer/verify/<job_id> for the outcome.
+        job_id = submit_verification_job(db, current_app.config['MONGODB_URI'], user, {
+            'user_email': user.email,
+            'permit_path': permit_path,
+            'permit_filename': permit_unique,
+            'permit_business_name': permit_business_name,
+            'permit_owner_name': permit_owner_name,
+        })
+        return jsonify({
+            'status': 'queued',
+            'job_id': job_id,
+            'status_url': f'/farmer/verify/{job_id}',
+            'message': 'Your permit was received and is being verified.',
+        }), 202
 
     except Exception as e:
         print(f"Verification error: {e}")
         return jsonify({'error': f'Verification failed: {str(e)}'}), 500
 
 
+@farmers_bp.route('/farmer/verify/<job_id>', methods=['GET'])
+@token_required
+def farmer_verify_status(job_id):
+    try:
+        db, _ = get_mongodb_db(farmers_bp)
+        if db is None:
+            return jsonify({'error': 'Database connection failed. Please try again.'}), 500
+
+        job = get_verification_job(db, job_id, request.user_email)
+        if not job:
+            return jsonify({'error': 'Verification job not found.'}), 404
+
+        response = {
+            'job_id': job['_id'],
+            'status': job['status'],
+            'created_at': job.get('created_at'),
+            'finished_at': job.get('finished_at'),
+        }
+        if job['status'] == 'done':
+            response['result'] = job.get('result')
+            response['result_status'] = job.get('result_status')
+        elif job['status'] == 'failed':
+            response['error'] = job.get('error')
+        return jsonify(response), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ------------------------------------------------------------------
 # Start selling
 # ------------------------------------------------------------------
@@ -379,48 +339,12 @@ def farmer_dashboard():
         try:
             db, _ = get_mongodb_db(farmers_bp)
             if db is not None:
-                farmer_id_str = str(current_user.id)
-                product_cache = {}
-
-                def _get_product(pid):
-                    if pid in product_cache:
-                        return product_cache[pid]
-                    doc = None
-                    try:
-                        from bson import ObjectId
-                        if ObjectId.is_valid(str(pid)):
-                            doc = db.products.find_one({'_id': ObjectId(str(pid))})
-                    except Exception:
-                        pass
-                    if not doc:
-                        doc = db.products.find_one({'id': str(pid)})
-                    product_cache[pid] = doc
-                    return doc
-
-                for order_doc in db.orders.find().sort('created_at', -1):
-                    order_items = []
-                    for item in order_doc.get('items', []):
-                        pdoc = _get_product(item.get('product_id'))
-                        if not pdoc:
-                            continue
-                        if pdoc.get('farmer') != farmer_id_str and pdoc.get('farmer_user_id') != farmer_id_str:
-                            continue
-                        order_items.append({
-                            'name': item.get('name', pdoc.get('name', 'Product')),
-                            'quantity': item.get('quantity', 1),
-                            'price': item.get('price', pdoc.get('price', 0)),
-                        })
-
-                    if order_items:
-                        buyer = db.users.find_one({'id': order_doc.get('user_id')})
-                        seller_orders.append({
-                            'id': str(order_doc['_id']),
-                            'status': order_doc.get('status', 'pending'),
-                            'created_at': order_doc.get('created_at'),
-                            'buyer_name': (buyer.get('first_name') if buyer else 'Customer'),
-                            'buyer_email': (buyer.get('email') if buyer else ''),
-                            'items': order_items,
-                        })
+                seller_orders, _ = find_seller_orders(
+                    db,
+                    str(current_user.id),
+                    page=request.args.get('orders_page', 1, type=int),
+                    paid_only=False,
+                )
         except Exception as oe:
             print(f"Seller orders load error: {oe}")
 
@@ -513,8 +437,10 @@ def manage_products():
                 'farmer': str(me_farmer.id),
                 'farmer_user_id': str(current_user.id),
                 'farmer_email': current_user.email,
+                'farm_name': getattr(current_user, 'farm_name', '') or '',
                 'created_at': datetime.utcnow(),
             })
+            invalidate_catalog()
 
             flash('Product added successfully!', 'success')
             return redirect('/manage-products')
@@ -632,6 +558,7 @@ def edit_manage_product(product_id):
             update_doc['image_url'] = url_for('static', filename=f'uploads/products/{unique_name}')
 
         db.products.update_one(query, {'$set': update_doc})
+        invalidate_catalog(product_doc['_id'], product_doc.get('id'), product_id)
         flash('Product updated successfully!', 'success')
         return redirect('/manage-products')
     except Exception as e:
@@ -657,6 +584,7 @@ def delete_product(product_id):
             return {'error': 'Product not found or unauthorized'}, 404
 
         product.delete()
+        invalidate_catalog(product_id)
         return {'success': True}, 200
     except Exception as e:
         print(f"Delete product error: {e}")
@@ -9,9 +9,14 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 
 from db import get_mongodb_db, ensure_mongoengine_user
-from helpers import send_system_email, build_email_html, generate_receipt_pdf
+from cache import invalidate_catalog
+from cart_service import fetch_products_by_ids
+from email_outbox import enqueue_email
+from helpers import build_email_html
 from lalamove import create_delivery_order
 from paymongo import create_checkout_session, PayMongoError
+from receipts import schedule_receipt
+from order_service import InsufficientStock, insufficient_stock, place_order, stamp_sellers
 
 orders_bp = Blueprint('orders', __name__)
 
@@ -52,7 +57,7 @@ def orders():
 @login_required
 def checkout():
     try:
-        db, _ = get_mongodb_db(orders_bp)
+        db, client = get_mongodb_db(orders_bp)
         if db is None:
             flash('Database connection failed. Please try again.', 'error')
             return redirect(url_for('cart.cart'))
@@ -97,17 +102,15 @@ def checkout():
         order_items = []
         total_amount = 0
 
+        products_by_id = fetch_products_by_ids(
+            db, [i.get('product_id') for i in cart_doc['items'] if i.get('product_id')]
+        )
+
         for item in cart_doc['items']:
             product_id = item.get('product_id')
             qty = int(item.get('quantity', 1))
 
-            product_data = None
-            try:
-                from bson import ObjectId
-                product_data = db.products.find_one({'_id': ObjectId(product_id)})
-            except Exception:
-                product_data = db.products.find_one({'id': product_id})
-
+            product_data = products_by_id.get(str(product_id))
             if not product_data:
                 continue
 
@@ -124,19 +127,20 @@ def checkout():
             })
             total_amount += price * qty
 
-            if not is_mobile_money:
-                try:
-                    db.products.update_one({'_id': product_data.get('_id')}, {'$inc': {'quantity': -qty}})
-                except Exception:
-                    pass
-
         if not order_items:
             flash('Unable to place order. Please try again.', 'error')
             return redirect(url_for('cart.cart'))
 
-        order_result = db.orders.insert_one({
+        if is_mobile_money:
+            short = [line['name'] for line in insufficient_stock(order_items, products_by_id)]
+            if short:
+                flash(f"Not enough stock for: {', '.join(short)}.", 'error')
+                return redirect(url_for('cart.cart'))
+
+        order_doc = {
             'user_id': current_user.id,
             'items': order_items,
+            'seller_ids': stamp_sellers(order_items, products_by_id),
             'total_amount': total_amount,
             'status': 'pending',
             'delivery_status': 'pending',
@@ -152,7 +156,20 @@ def checkout():
             'payment_channel': 'gcash' if is_mobile_money else None,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow(),
-        })
+        }
+
+        # Emails and PayMongo below only run once place_order has committed.
+        try:
+            order_oid = place_order(
+                db, client, order_doc,
+                cart_id=None if is_mobile_money else cart_doc['_id'],
+                reserve=not is_mobile_money,
+            )
+        except InsufficientStock as exc:
+            flash(f"Not enough stock for: {', '.join(exc.names)}.", 'error')
+            return redirect(url_for('cart.cart'))
+        if not is_mobile_money:
+            invalidate_catalog(*[line['product_id'] for line in order_items])
 
         if is_mobile_money:
             success_url, cancel_url = _get_paymongo_redirect_urls()
@@ -168,16 +185,16 @@ def checkout():
                 ]
                 checkout = create_checkout_session(
                     amount=int(round(total_amount * 100)),
-                    description=f'FarmtoClick Order {order_result.inserted_id}',
+                    description=f'FarmtoClick Order {order_oid}',
                     success_url=success_url,
                     cancel_url=cancel_url,
                     payment_method_types=['gcash', 'qrph'],
                     line_items=line_items,
-                    metadata={'order_id': str(order_result.inserted_id), 'user_id': str(current_user.id)},
-                    reference_number=str(order_result.inserted_id),
+                    metadata={'order_id': str(order_oid), 'user_id': str(current_user.id)},
+                    reference_number=str(order_oid),
                 )
                 db.orders.update_one(
-                    {'_id': order_result.inserted_id},
+                    {'_id': order_oid},
                     {'$set': {
                         'paymongo_checkout_id': checkout['id'],
                         'paymongo_checkout_url': checkout['checkout_url'],
@@ -189,7 +206,7 @@ def checkout():
                 return redirect(checkout['checkout_url'])
             except PayMongoError as exc:
                 db.orders.update_one(
-                    {'_id': order_result.inserted_id},
+                    {'_id': order_oid},
                     {'$set': {
                         'payment_status': 'failed',
                         'payment_error': str(exc),
@@ -200,8 +217,8 @@ def checkout():
                 return redirect(url_for('cart.cart'))
 
         try:
-            oid = str(order_result.inserted_id)
-            receipt_pdf = generate_receipt_pdf(oid, shipping_name, current_user.email, order_items, total_amount)
+            oid = str(order_oid)
+            schedule_receipt(current_app._get_current_object(), oid)
             email_html = build_email_html(
                 title="Order Confirmed",
                 subtitle="Your order is pending seller approval",
@@ -215,23 +232,17 @@ def checkout():
                     "<p>Thank you for shopping with FarmtoClick.</p>"
                 ),
             )
-            send_system_email(
-                current_app,
+            enqueue_email(
+                db,
                 current_user.email,
                 "FarmtoClick Order Confirmed - Pending Approval",
                 f"Order ID: {oid}\nTotal: {total_amount}",
                 html_body=email_html,
-                attachments=[{
-                    'filename': f"FarmtoClick-Receipt-{oid}.pdf",
-                    'content': receipt_pdf,
-                    'maintype': 'application',
-                    'subtype': 'pdf',
-                }],
+                receipt_order_id=oid,
             )
         except Exception as e:
             print(f"Order confirmation email error: {e}")
 
-        db.carts.delete_one({'_id': cart_doc['_id']})
         flash('Order placed successfully!', 'success')
         return redirect(url_for('orders.orders'))
     except Exception as e:
@@ -307,8 +318,8 @@ def update_order_status(order_id):
                     "<p style='margin-top:12px;'>Thank you for shopping with FarmtoClick.</p>"
                 ),
             )
-            send_system_email(
-                current_app,
+            enqueue_email(
+                db,
                 buyer_email,
                 "FarmtoClick Order Status Update",
                 f"Order {order_id} is now {new_status.upper()}.",
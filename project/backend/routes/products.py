@@ -5,6 +5,9 @@ from flask import Blueprint, render_template, request
 from flask_login import current_user
 
 from db import get_mongodb_db
+from cache import get_cached_product, listing_cache
+from product_search import search_products
+from facets import get_product_facets
 
 products_bp = Blueprint('products', __name__)
 
@@ -13,27 +16,38 @@ products_bp = Blueprint('products', __name__)
 def products():
     """Product listing page."""
     category_filter = request.args.get('category', '')
-    search_query = request.args.get('search', '')
+    search_query = request.args.get('search', '').strip()
 
     try:
+        cache_key = ('products_page', category_filter, search_query)
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            products_list, categories = cached
+            return render_template('products.html', products=products_list, categories=categories)
+
         db, _ = get_mongodb_db(products_bp)
         if db is None:
             return render_template('products.html', products=[], categories=[])
 
-        query = {'available': True}
-        if category_filter:
-            query['category'] = category_filter
         if search_query:
-            query['name'] = {'$regex': search_query, '$options': 'i'}
+            # The page has no pagination controls: list every ranked match.
+            products_list = search_products(
+                db, search_query, category=category_filter or None, per_page=None,
+            )['results']
+        else:
+            query = {'available': True}
+            if category_filter:
+                query['category'] = category_filter
 
-        products_cursor = db.products.find(query).sort('created_at', -1)
-        products_list = list(products_cursor)
+            products_cursor = db.products.find(query).sort('created_at', -1)
+            products_list = list(products_cursor)
 
-        for prod in products_list:
-            prod['_id'] = str(prod['_id'])
-            prod['id'] = prod.get('id') or prod['_id']
+            for prod in products_list:
+                prod['_id'] = str(prod['_id'])
+                prod['id'] = prod.get('id') or prod['_id']
 
-        categories = db.products.distinct('category')
+        categories = [c['name'] for c in get_product_facets(db)['categories']]
+        listing_cache.set(cache_key, (products_list, categories))
         return render_template('products.html', products=products_list, categories=categories)
     except Exception as e:
         print(f"Products error: {e}")
@@ -44,16 +58,11 @@ def products():
 def product_detail(product_id):
     """Single product detail page."""
     try:
-        from bson import ObjectId
         db, _ = get_mongodb_db(products_bp)
         if db is None:
             return "Database connection failed", 503
 
-        product = None
-        if ObjectId.is_valid(product_id):
-            product = db.products.find_one({'_id': ObjectId(product_id)})
-        if not product:
-            product = db.products.find_one({'id': product_id})
+        product = get_cached_product(db, product_id)
         if not product:
             return "Product not found", 404
 
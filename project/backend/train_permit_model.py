@@ -37,9 +37,12 @@ import sys
 import glob
 import json
 import random
+import hashlib
 import argparse
+import multiprocessing
 import numpy as np
 import cv2
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -55,7 +58,11 @@ import joblib
 _SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, _SCRIPT_DIR)
 
-from permit_feature_extractor import PermitFeatureExtractor, FEATURE_NAMES
+from permit_feature_extractor import (
+    PermitFeatureExtractor, FEATURE_SCHEMA_VERSION, FEATURE_SCHEMAS,
+)
+from feature_store import FeatureStore
+from permit_image import PermitImage
 
 # ---------------------------------------------------------------------------
 # Paths
@@ -64,6 +71,7 @@ TRAINING_DATA_DIR = os.path.join(_SCRIPT_DIR, 'training_data')
 AUTHENTIC_DIR = os.path.join(TRAINING_DATA_DIR, 'authentic')
 NON_PERMIT_DIR = os.path.join(TRAINING_DATA_DIR, 'non_permit')
 AUGMENTED_DIR = os.path.join(TRAINING_DATA_DIR, 'augmented')
+FEATURE_CACHE_DIR = os.path.join(TRAINING_DATA_DIR, 'feature_cache')
 MODEL_DIR = os.path.join(_SCRIPT_DIR, 'ml_models')
 MODEL_PATH = os.path.join(MODEL_DIR, 'permit_classifier.pkl')
 SCALER_PATH = os.path.join(MODEL_DIR, 'permit_scaler.pkl')
@@ -75,136 +83,310 @@ IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
 # ===================================================================
 # 1.  DATA AUGMENTATION
 # ===================================================================
+def _task_seed(seed, *parts):
+    """Stable 64-bit seed for one unit of random work (independent of worker scheduling)."""
+    digest = hashlib.sha256('|'.join(str(p) for p in (seed,) + parts).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def _split_range(n, parts):
+    """Split ``range(n)`` into at most ``parts`` contiguous chunks."""
+    parts = max(1, min(parts, n))
+    step = -(-n // parts)
+    return [range(start, min(start + step, n)) for start in range(0, n, step)]
+
+
+def _resolve_workers(workers):
+    return (os.cpu_count() or 1) if workers is None else max(1, int(workers))
+
+
+def _spawn_pool(workers, initializer, initargs):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=initializer,
+        initargs=initargs,
+    )
+
+
+def augment_variant(img, rng, np_rng):
+    """
+    Apply a random subset of capture-condition ops to ``img``.
+    ``rng`` is a ``random.Random`` and ``np_rng`` a numpy ``Generator``.
+    Returns (augmented image, list of op tags).
+    """
+    aug = img.copy()
+    ops_applied = []
+
+    # --- Rotation (slight tilt ±15°) ---
+    if rng.random() < 0.7:
+        angle = rng.uniform(-15, 15)
+        h, w = aug.shape[:2]
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        aug = cv2.warpAffine(aug, M, (w, h),
+                             borderMode=cv2.BORDER_REPLICATE)
+        ops_applied.append('rot')
+
+    # --- Perspective warp (simulates camera angle) ---
+    if rng.random() < 0.5:
+        h, w = aug.shape[:2]
+        d = int(min(h, w) * rng.uniform(0.02, 0.08))
+        pts1 = np.float32([[0, 0], [w, 0], [0, h], [w, h]])
+        pts2 = np.float32([
+            [rng.randint(0, d), rng.randint(0, d)],
+            [w - rng.randint(0, d), rng.randint(0, d)],
+            [rng.randint(0, d), h - rng.randint(0, d)],
+            [w - rng.randint(0, d), h - rng.randint(0, d)],
+        ])
+        M = cv2.getPerspectiveTransform(pts1, pts2)
+        aug = cv2.warpPerspective(aug, M, (w, h),
+                                  borderMode=cv2.BORDER_REPLICATE)
+        ops_applied.append('persp')
+
+    # --- Random crop (75-100% of image) ---
+    if rng.random() < 0.6:
+        h, w = aug.shape[:2]
+        crop_pct = rng.uniform(0.75, 0.98)
+        new_h, new_w = int(h * crop_pct), int(w * crop_pct)
+        y = rng.randint(0, h - new_h)
+        x = rng.randint(0, w - new_w)
+        aug = aug[y:y + new_h, x:x + new_w]
+        ops_applied.append('crop')
+
+    # --- Brightness change ---
+    if rng.random() < 0.7:
+        factor = rng.uniform(0.6, 1.5)
+        aug = cv2.convertScaleAbs(aug, alpha=factor, beta=0)
+        ops_applied.append('bright')
+
+    # --- Contrast change ---
+    if rng.random() < 0.5:
+        factor = rng.uniform(0.5, 1.8)
+        mean = np.mean(aug)
+        aug = np.clip((aug.astype(np.float32) - mean) * factor + mean, 0, 255).astype(np.uint8)
+        ops_applied.append('contrast')
+
+    # --- Gaussian noise ---
+    if rng.random() < 0.4:
+        sigma = rng.uniform(5, 25)
+        noise = np_rng.normal(0, sigma, aug.shape).astype(np.float32)
+        aug = np.clip(aug + noise, 0, 255).astype(np.uint8)
+        ops_applied.append('noise')
+
+    # --- Gaussian blur ---
+    if rng.random() < 0.4:
+        k = rng.choice([3, 5, 7])
+        aug = cv2.GaussianBlur(aug, (k, k), 0)
+        ops_applied.append('blur')
+
+    # --- JPEG compression artefacts ---
+    if rng.random() < 0.5:
+        quality = rng.randint(20, 70)
+        _, buf = cv2.imencode('.jpg', aug,
+                              [cv2.IMWRITE_JPEG_QUALITY, quality])
+        aug = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        ops_applied.append('jpeg')
+
+    # --- Colour jitter (hue/saturation shift) ---
+    if rng.random() < 0.4:
+        hsv = cv2.cvtColor(aug, cv2.COLOR_BGR2HSV).astype(np.float32)
+        hsv[:, :, 0] = (hsv[:, :, 0] + rng.uniform(-10, 10)) % 180
+        hsv[:, :, 1] = np.clip(hsv[:, :, 1] * rng.uniform(0.7, 1.3), 0, 255)
+        aug = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+        ops_applied.append('colour')
+
+    # --- Horizontal flip (rare, permits are usually oriented) ---
+    if rng.random() < 0.15:
+        aug = cv2.flip(aug, 1)
+        ops_applied.append('hflip')
+
+    # --- Scale / resize ---
+    if rng.random() < 0.5:
+        scale = rng.uniform(0.5, 1.5)
+        h, w = aug.shape[:2]
+        new_size = (max(100, int(w * scale)), max(100, int(h * scale)))
+        aug = cv2.resize(aug, new_size)
+        ops_applied.append('scale')
+
+    return aug, ops_applied
+
+
 class PermitAugmentor:
     """
     Generate many realistic image variants from a single permit photo.
     Simulates real-world capture conditions: angle, lighting, noise,
     partial crop, blur, colour jitter, etc.
+
+    Every variant draws from its own RNG seeded from (``seed``, source file
+    name, variant number), so output is identical however the work is
+    split across processes.  ``augment_many`` writes variants in parallel;
+    ``augment_features`` skips the disk entirely and returns feature vectors
+    computed in the workers.
     """
 
-    def __init__(self, output_dir, augmentations_per_image=30):
+    def __init__(self, output_dir, augmentations_per_image=30, seed=1337):
         self.output_dir = output_dir
         self.n = augmentations_per_image
-        os.makedirs(output_dir, exist_ok=True)
-
-    def augment_image(self, image_path, label_prefix='aug'):
-        """Generate self.n augmented copies of the given image."""
+        self.seed = seed
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def variant(self, img, image_path, i):
+        """Return (augmented image, op tags) for variant ``i`` of ``image_path``."""
+        seed = _task_seed(self.seed, Path(image_path).name, i)
+        return augment_variant(img, random.Random(seed), np.random.default_rng(seed))
+
+    def _write_variant(self, aug, ops_applied, image_path, i, label_prefix):
+        ops_tag = '_'.join(ops_applied) if ops_applied else 'orig'
+        fname = f"{label_prefix}_{Path(image_path).stem}_{i:03d}_{ops_tag}.jpg"
+        out_path = os.path.join(self.output_dir, fname)
+        cv2.imwrite(out_path, aug)
+        return out_path
+
+    def augment_image(self, image_path, label_prefix='aug', indices=None):
+        """Generate augmented copies (``self.n``, or just ``indices``) of the given image."""
         img = cv2.imread(image_path)
         if img is None:
             print(f"  [WARN] Cannot read {image_path}")
             return []
 
-        base = Path(image_path).stem
         generated = []
-
-        for i in range(self.n):
-            aug = img.copy()
-            ops_applied = []
-
-            # --- Rotation (slight tilt ±15°) ---
-            if random.random() < 0.7:
-                angle = random.uniform(-15, 15)
-                h, w = aug.shape[:2]
-                M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
-                aug = cv2.warpAffine(aug, M, (w, h),
-                                     borderMode=cv2.BORDER_REPLICATE)
-                ops_applied.append('rot')
-
-            # --- Perspective warp (simulates camera angle) ---
-            if random.random() < 0.5:
-                h, w = aug.shape[:2]
-                d = int(min(h, w) * random.uniform(0.02, 0.08))
-                pts1 = np.float32([[0, 0], [w, 0], [0, h], [w, h]])
-                pts2 = np.float32([
-                    [random.randint(0, d), random.randint(0, d)],
-                    [w - random.randint(0, d), random.randint(0, d)],
-                    [random.randint(0, d), h - random.randint(0, d)],
-                    [w - random.randint(0, d), h - random.randint(0, d)],
-                ])
-                M = cv2.getPerspectiveTransform(pts1, pts2)
-                aug = cv2.warpPerspective(aug, M, (w, h),
-                                          borderMode=cv2.BORDER_REPLICATE)
-                ops_applied.append('persp')
-
-            # --- Random crop (75-100% of image) ---
-            if random.random() < 0.6:
-                h, w = aug.shape[:2]
-                crop_pct = random.uniform(0.75, 0.98)
-                new_h, new_w = int(h * crop_pct), int(w * crop_pct)
-                y = random.randint(0, h - new_h)
-                x = random.randint(0, w - new_w)
-                aug = aug[y:y + new_h, x:x + new_w]
-                ops_applied.append('crop')
-
-            # --- Brightness change ---
-            if random.random() < 0.7:
-                factor = random.uniform(0.6, 1.5)
-                aug = np.clip(aug * factor, 0, 255).astype(np.uint8)
-                ops_applied.append('bright')
-
-            # --- Contrast change ---
-            if random.random() < 0.5:
-                factor = random.uniform(0.5, 1.8)
-                mean = np.mean(aug)
-                aug = np.clip((aug - mean) * factor + mean, 0, 255).astype(np.uint8)
-                ops_applied.append('contrast')
-
-            # --- Gaussian noise ---
-            if random.random() < 0.4:
-                sigma = random.uniform(5, 25)
-                noise = np.random.normal(0, sigma, aug.shape)
-                aug = np.clip(aug + noise, 0, 255).astype(np.uint8)
-                ops_applied.append('noise')
-
-            # --- Gaussian blur ---
-            if random.random() < 0.4:
-                k = random.choice([3, 5, 7])
-                aug = cv2.GaussianBlur(aug, (k, k), 0)
-                ops_applied.append('blur')
-
-            # --- JPEG compression artefacts ---
-            if random.random() < 0.5:
-                quality = random.randint(20, 70)
-                _, buf = cv2.imencode('.jpg', aug,
-                                      [cv2.IMWRITE_JPEG_QUALITY, quality])
-                aug = cv2.imdecode(buf, cv2.IMREAD_COLOR)
-                ops_applied.append('jpeg')
-
-            # --- Colour jitter (hue/saturation shift) ---
-            if random.random() < 0.4:
-                hsv = cv2.cvtColor(aug, cv2.COLOR_BGR2HSV).astype(np.float64)
-                hsv[:, :, 0] = (hsv[:, :, 0] + random.uniform(-10, 10)) % 180
-                hsv[:, :, 1] = np.clip(hsv[:, :, 1] * random.uniform(0.7, 1.3), 0, 255)
-                aug = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
-                ops_applied.append('colour')
-
-            # --- Horizontal flip (rare, permits are usually oriented) ---
-            if random.random() < 0.15:
-                aug = cv2.flip(aug, 1)
-                ops_applied.append('hflip')
-
-            # --- Scale / resize ---
-            if random.random() < 0.5:
-                scale = random.uniform(0.5, 1.5)
-                h, w = aug.shape[:2]
-                new_size = (max(100, int(w * scale)), max(100, int(h * scale)))
-                aug = cv2.resize(aug, new_size)
-                ops_applied.append('scale')
-
-            # Save
-            ops_tag = '_'.join(ops_applied) if ops_applied else 'orig'
-            fname = f"{label_prefix}_{base}_{i:03d}_{ops_tag}.jpg"
-            out_path = os.path.join(self.output_dir, fname)
-            cv2.imwrite(out_path, aug)
-            generated.append(out_path)
-
+        for i in (range(self.n) if indices is None else indices):
+            aug, ops_applied = self.variant(img, image_path, i)
+            generated.append(self._write_variant(aug, ops_applied, image_path, i, label_prefix))
         return generated
 
+    def _tasks(self, image_paths, workers):
+        # Split each image's variants so a single source still uses every core.
+        chunks = max(1, -(-workers // max(1, len(image_paths))))
+        return [(path, list(r)) for path in image_paths for r in _split_range(self.n, chunks)]
+
+    def augment_many(self, image_paths, label_prefix='aug', workers=None):
+        """Write ``self.n`` variants of every image using a process pool.
+        Returns the generated paths in input order."""
+        workers = _resolve_workers(workers)
+        image_paths = list(image_paths)
+        if workers <= 1 or not image_paths or self.n <= 0:
+            return [p for path in image_paths for p in self.augment_image(path, label_prefix)]
+
+        tasks = self._tasks(image_paths, workers)
+        with _spawn_pool(min(workers, len(tasks)), _init_augment_worker,
+                         (self.output_dir, self.n, self.seed, None)) as pool:
+            results = pool.map(_augment_to_disk, [(path, label_prefix, idx) for path, idx in tasks])
+            return [p for generated in results for p in generated]
+
+    def augment_features(self, image_paths, extractor, workers=None):
+        """Augment in memory and extract features in the workers (nothing is written).
+
+        Returns ``(X, failures)``: an ``(n, len(extractor.feature_names))`` float32 matrix
+        and ``(source path, error)`` pairs for variants that failed.
+        """
+        workers = _resolve_workers(workers)
+        tasks = self._tasks(list(image_paths), workers) if self.n > 0 else []
+        initargs = (None, self.n, self.seed, extractor.schema_version)
+        if workers <= 1:
+            results = [_augment_to_features(task, self, extractor) for task in tasks]
+        else:
+            with _spawn_pool(min(workers, max(1, len(tasks))), _init_augment_worker, initargs) as pool:
+                results = list(pool.map(_augment_to_features, tasks))
+
+        rows, failures = [], []
+        for vectors, errors in results:
+            rows.extend(vectors)
+            failures.extend(errors)
+        X = np.asarray(rows, dtype=np.float32).reshape(len(rows), len(extractor.feature_names))
+        return X, failures
+
+
+# Per worker process state, set up by ``_init_augment_worker``.
+_worker_augmentor = None
+_worker_extractor = None
+
+
+def _init_augment_worker(output_dir, n, seed, schema_version):
+    global _worker_augmentor, _worker_extractor
+    cv2.setNumThreads(1)
+    _worker_augmentor = PermitAugmentor(output_dir, augmentations_per_image=n, seed=seed)
+    _worker_extractor = None if schema_version is None else PermitFeatureExtractor(schema_version=schema_version)
+
+
+def _augment_to_disk(task):
+    image_path, label_prefix, indices = task
+    return _worker_augmentor.augment_image(image_path, label_prefix, indices=indices)
+
+
+def _augment_to_features(task, augmentor=None, extractor=None):
+    augmentor = augmentor or _worker_augmentor
+    extractor = extractor or _worker_extractor
+    image_path, indices = task
+    img = cv2.imread(image_path)
+    if img is None:
+        return [], [(image_path, 'unreadable image')]
+    vectors, errors = [], []
+    for i in indices:
+        aug, _ = augmentor.variant(img, image_path, i)
+        features = extractor.extract_all_features(PermitImage(bgr=aug))
+        if features is None:
+            errors.append((image_path, f'variant {i}: feature extraction failed'))
+        else:
+            vectors.append(extractor.features_to_vector(features).astype(np.float32))
+    return vectors, errors
+
 
 # ===================================================================
 # 2.  SYNTHETIC NEGATIVE GENERATOR
 # ===================================================================
-def generate_synthetic_negatives(n=60, output_dir=None):
+def synthetic_negative(rng, np_rng):
+    """
+    Draw one fake 'non-permit' image: solid colour, gradient, random
+    noise, simple shapes or stripes.
+    """
+    h, w = rng.randint(300, 900), rng.randint(400, 1200)
+    kind = rng.choice(['noise', 'solid', 'gradient', 'shapes', 'stripes'])
+
+    if kind == 'noise':
+        img = np_rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    elif kind == 'solid':
+        colour = [rng.randint(0, 255) for _ in range(3)]
+        img = np.full((h, w, 3), colour, dtype=np.uint8)
+    elif kind == 'gradient':
+        starts = [rng.randint(0, 128) for _ in range(3)]
+        stops = [rng.randint(128, 255) for _ in range(3)]
+        ramp = np.linspace(starts, stops, w).astype(np.uint8)   # (w, 3)
+        img = np.ascontiguousarray(np.broadcast_to(ramp, (h, w, 3)))
+    elif kind == 'shapes':
+        img = np.full((h, w, 3), 240, dtype=np.uint8)
+        for _ in range(rng.randint(5, 20)):
+            color = tuple(rng.randint(0, 255) for _ in range(3))
+            pt1 = (rng.randint(0, w), rng.randint(0, h))
+            pt2 = (rng.randint(0, w), rng.randint(0, h))
+            thickness = rng.randint(1, 5)
+            shape = rng.choice(['rect', 'circle', 'line'])
+            if shape == 'rect':
+                cv2.rectangle(img, pt1, pt2, color, thickness)
+            elif shape == 'circle':
+                cv2.circle(img, pt1, rng.randint(10, 100), color, thickness)
+            else:
+                cv2.line(img, pt1, pt2, color, thickness)
+    else:  # stripes
+        stripe_w = rng.randint(5, 30)
+        period = np.arange(w) // stripe_w
+        levels = np_rng.integers(100, 256, size=period[-1] // 2 + 1, dtype=np.uint8)
+        row = np.where(period % 2 == 0, levels[period // 2], 0).astype(np.uint8)
+        img = np.ascontiguousarray(np.broadcast_to(row[None, :, None], (h, w, 3)))
+    return img
+
+
+def _write_synthetic_negative(task):
+    out, i, seed = task
+    task_seed = _task_seed(seed, 'negative', i)
+    img = synthetic_negative(random.Random(task_seed), np.random.default_rng(task_seed))
+    fpath = os.path.join(out, f'synth_neg_{i:04d}.jpg')
+    cv2.imwrite(fpath, img)
+    return fpath
+
+
+def generate_synthetic_negatives(n=60, output_dir=None, seed=1337, workers=None):
     """
     Create fake 'non-permit' images: solid colours, gradients, random
     noise, simple shapes.  These help when you don't have many real
@@ -212,46 +394,13 @@ def generate_synthetic_negatives(n=60, output_dir=None):
     """
     out = output_dir or NON_PERMIT_DIR
     os.makedirs(out, exist_ok=True)
-    generated = []
-
-    for i in range(n):
-        h, w = random.randint(300, 900), random.randint(400, 1200)
-        kind = random.choice(['noise', 'solid', 'gradient', 'shapes', 'stripes'])
-
-        if kind == 'noise':
-            img = np.random.randint(0, 256, (h, w, 3), dtype=np.uint8)
-        elif kind == 'solid':
-            colour = [random.randint(0, 255) for _ in range(3)]
-            img = np.full((h, w, 3), colour, dtype=np.uint8)
-        elif kind == 'gradient':
-            img = np.zeros((h, w, 3), dtype=np.uint8)
-            for c in range(3):
-                img[:, :, c] = np.linspace(
-                    random.randint(0, 128), random.randint(128, 255), w,
-                    dtype=np.uint8).reshape(1, -1).repeat(h, axis=0)
-        elif kind == 'shapes':
-            img = np.full((h, w, 3), 240, dtype=np.uint8)
-            for _ in range(random.randint(5, 20)):
-                color = tuple(random.randint(0, 255) for _ in range(3))
-                pt1 = (random.randint(0, w), random.randint(0, h))
-                pt2 = (random.randint(0, w), random.randint(0, h))
-                thickness = random.randint(1, 5)
-                shape = random.choice(['rect', 'circle', 'line'])
-                if shape == 'rect':
-                    cv2.rectangle(img, pt1, pt2, color, thickness)
-                elif shape == 'circle':
-                    cv2.circle(img, pt1, random.randint(10, 100), color, thickness)
-                else:
-                    cv2.line(img, pt1, pt2, color, thickness)
-        else:  # stripes
-            img = np.zeros((h, w, 3), dtype=np.uint8)
-            stripe_w = random.randint(5, 30)
-            for x in range(0, w, stripe_w * 2):
-                img[:, x:x + stripe_w] = [random.randint(100, 255)] * 3
-
-        fpath = os.path.join(out, f'synth_neg_{i:04d}.jpg')
-        cv2.imwrite(fpath, img)
-        generated.append(fpath)
+    tasks = [(out, i, seed) for i in range(n)]
+    workers = min(_resolve_workers(workers), max(1, n))
+    if workers <= 1:
+        generated = [_write_synthetic_negative(task) for task in tasks]
+    else:
+        with _spawn_pool(workers, cv2.setNumThreads, (1,)) as pool:
+            generated = list(pool.map(_write_synthetic_negative, tasks, chunksize=8))
 
     print(f"  [OK] Generated {len(generated)} synthetic negatives in {out}")
     return generated
@@ -269,18 +418,17 @@ def collect_image_paths(directory):
     return sorted(set(paths))
 
 
-def extract_dataset(extractor, image_paths, label):
-    """Extract features from a list of images and assign a label.
-    Returns (X_list, y_list, paths_list)."""
-    X, y, used_paths = [], [], []
-    for path in image_paths:
-        features = extractor.extract_all_features(path)
-        if features is None:
-            continue
-        vec = extractor.features_to_vector(features)
-        X.append(vec)
-        y.append(label)
-        used_paths.append(path)
+def extract_dataset(extractor, image_paths, label, workers=None, store=None):
+    """Extract features from a list of images (in parallel) and assign a label.
+    With a ``FeatureStore`` only images not already in it are extracted.
+    Returns (X, y, paths_list)."""
+    if store is not None:
+        X, used_paths, failures = store.extract(image_paths, workers=workers)
+    else:
+        X, used_paths, failures = extractor.extract_batch(image_paths, workers=workers)
+    for path, error in failures:
+        print(f"   [SKIP] {os.path.basename(path)}: {error}")
+    y = np.full(len(used_paths), label, dtype=int)
     return X, y, used_paths
 
 
@@ -397,8 +545,26 @@ def main():
                         help='Number of augmented copies per authentic image (default: 30)')
     parser.add_argument('--neg-count', type=int, default=60,
                         help='Number of synthetic negatives to generate (default: 60)')
+    parser.add_argument('--feature-schema', type=int, default=FEATURE_SCHEMA_VERSION,
+                        choices=FEATURE_SCHEMAS,
+                        help=f'Feature schema version (default: {FEATURE_SCHEMA_VERSION}; '
+                             '1 = legacy full resolution, 2 = resolution-normalised, '
+                             '3 = normalised + extended texture features)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Augmentation / feature extraction processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=1337,
+                        help='Random seed for augmentation and negatives (default: 1337). '
+                             'Reproducible augmentations let the feature cache skip them.')
+    parser.add_argument('--no-feature-cache', action='store_true',
+                        help='Re-extract every image instead of using training_data/feature_cache')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='Augment in memory and extract features directly, '
+                             'without writing training_data/augmented')
     args = parser.parse_args()
 
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
     print("=" * 60)
     print("  DTI Business Permit — ML Model Training")
     print("=" * 60)
@@ -423,38 +589,59 @@ def main():
     if args.generate_negatives or not non_permit_paths:
         if not non_permit_paths:
             print("   No non-permit images found — auto-generating synthetic negatives...")
-        generate_synthetic_negatives(n=args.neg_count)
+        generate_synthetic_negatives(n=args.neg_count, seed=args.seed, workers=args.workers)
         non_permit_paths = collect_image_paths(NON_PERMIT_DIR)
 
     print(f"[OK] Found {len(non_permit_paths)} non-permit image(s)")
 
     # --- Augment authentic images ---
     print(f"\n[AUG] Augmenting {len(authentic_paths)} authentic image(s) "
-          f"x {args.augment_count} variants each...")
+          f"x {args.augment_count} variants each"
+          f"{' (in memory)' if args.in_memory else ''}...")
     aug_auth_dir = os.path.join(AUGMENTED_DIR, 'authentic')
     aug_neg_dir = os.path.join(AUGMENTED_DIR, 'non_permit')
 
-    augmentor = PermitAugmentor(aug_auth_dir, augmentations_per_image=args.augment_count)
-    all_authentic = list(authentic_paths)  # originals
-    for path in authentic_paths:
-        generated = augmentor.augment_image(path, label_prefix='auth')
-        all_authentic.extend(generated)
-    print(f"   Total authentic samples (orig + augmented): {len(all_authentic)}")
-
+    augmentor = PermitAugmentor(None if args.in_memory else aug_auth_dir,
+                                augmentations_per_image=args.augment_count, seed=args.seed)
     # Also augment non-permit images (less aggressively)
-    augmentor_neg = PermitAugmentor(aug_neg_dir, augmentations_per_image=max(5, args.augment_count // 3))
-    all_non_permit = list(non_permit_paths)
-    for path in non_permit_paths:
-        generated = augmentor_neg.augment_image(path, label_prefix='neg')
-        all_non_permit.extend(generated)
-    print(f"   Total non-permit samples (orig + augmented): {len(all_non_permit)}")
-
-    # --- Extract features ---
-    print("\n[FEAT] Extracting features...")
-    extractor = PermitFeatureExtractor()
-
-    X_auth, y_auth, _ = extract_dataset(extractor, all_authentic, label=1)
-    X_neg, y_neg, _ = extract_dataset(extractor, all_non_permit, label=0)
+    augmentor_neg = PermitAugmentor(None if args.in_memory else aug_neg_dir,
+                                    augmentations_per_image=max(5, args.augment_count // 3),
+                                    seed=args.seed)
+
+    print(f"\n[FEAT] Extracting features (schema v{args.feature_schema})...")
+    extractor = PermitFeatureExtractor(schema_version=args.feature_schema)
+    store = None if args.no_feature_cache else FeatureStore(FEATURE_CACHE_DIR, extractor)
+
+    if args.in_memory:
+        # Variants never touch the disk: workers augment and extract in one step.
+        X_auth, y_auth, _ = extract_dataset(extractor, authentic_paths, label=1,
+                                            workers=args.workers, store=store)
+        X_neg, y_neg, _ = extract_dataset(extractor, non_permit_paths, label=0,
+                                          workers=args.workers, store=store)
+        X_auth_aug, failures = augmentor.augment_features(authentic_paths, extractor, workers=args.workers)
+        X_neg_aug, neg_failures = augmentor_neg.augment_features(non_permit_paths, extractor, workers=args.workers)
+        for path, error in failures + neg_failures:
+            print(f"   [SKIP] {os.path.basename(path)}: {error}")
+        X_auth = np.vstack([X_auth, X_auth_aug])
+        y_auth = np.concatenate([y_auth, np.ones(len(X_auth_aug), dtype=int)])
+        X_neg = np.vstack([X_neg, X_neg_aug])
+        y_neg = np.concatenate([y_neg, np.zeros(len(X_neg_aug), dtype=int)])
+    else:
+        all_authentic = list(authentic_paths) + augmentor.augment_many(
+            authentic_paths, label_prefix='auth', workers=args.workers)
+        print(f"   Total authentic samples (orig + augmented): {len(all_authentic)}")
+        all_non_permit = list(non_permit_paths) + augmentor_neg.augment_many(
+            non_permit_paths, label_prefix='neg', workers=args.workers)
+        print(f"   Total non-permit samples (orig + augmented): {len(all_non_permit)}")
+
+        X_auth, y_auth, _ = extract_dataset(extractor, all_authentic, label=1,
+                                            workers=args.workers, store=store)
+        X_neg, y_neg, _ = extract_dataset(extractor, all_non_permit, label=0,
+                                          workers=args.workers, store=store)
+    if store is not None:
+        removed = store.compact()
+        if removed:
+            print(f"   Dropped {removed} stale cached feature vector(s)")
 
     print(f"   Authentic feature vectors: {len(X_auth)}")
     print(f"   Non-permit feature vectors: {len(X_neg)}")
@@ -463,12 +650,12 @@ def main():
         print("\n[ERROR] Not enough valid samples to train. Need >=2 of each class.")
         sys.exit(1)
 
-    X = X_auth + X_neg
-    y = y_auth + y_neg
+    X = np.vstack([X_auth, X_neg])
+    y = np.concatenate([y_auth, y_neg])
 
     # --- Train ---
     print("\n[TRAIN] Training classifier...")
-    pipeline, metadata = train_model(X, y, FEATURE_NAMES)
+    pipeline, metadata = train_model(X, y, extractor.feature_names)
 
     # --- Save model ---
     joblib.dump(pipeline, MODEL_PATH)
@@ -480,7 +667,8 @@ def main():
         'authentic_images_used': len(authentic_paths),
         'total_authentic_samples': len(X_auth),
         'total_non_permit_samples': len(X_neg),
-        'feature_names': FEATURE_NAMES,
+        'feature_names': extractor.feature_names,
+        'feature_schema_version': extractor.schema_version,
         'model_path': MODEL_PATH,
     })
     with open(METADATA_PATH, 'w') as f:
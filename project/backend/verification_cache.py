@@ -0,0 +1,152 @@
+"""
+Memoised permit verification results, keyed by image content.
+
+Farmers often re-upload the same permit photo after a rejection.  Each result
+is stored in ``permit_verification_cache`` under the SHA-256 of the upload,
+the classifier's ``model_version`` (a hash of ``permit_classifier.pkl``) and
+the names the farmer entered, since those feed the name cross-check.  A
+64-bit difference hash (dHash) of the image also matches near-identical
+re-uploads (re-encoded or lightly resized copies) within ``PHASH_MAX_DISTANCE``
+bits, but only for results that did not accept the permit: DTI certificates
+share one layout and the hash cannot see the QR code or registration number,
+so a different permit typed with the same names could otherwise inherit a
+"verified" decision.  Accepting results are reused on an exact SHA-256 match
+only.
+
+Entries for an older model never match the current key, so retraining
+invalidates the cache automatically; a TTL index drops entries after
+``VERIFY_CACHE_TTL`` seconds so DTI registration changes are eventually
+picked up.  Results that depended on an unreachable DTI server are not
+cached.
+"""
+import copy
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+CACHE_COLLECTION = 'permit_verification_cache'
+# Bump when the pipeline's decision logic changes in a way cached results
+# should not survive.
+PIPELINE_VERSION = 1
+VERIFY_CACHE_TTL = int(os.environ.get('VERIFY_CACHE_TTL') or 7 * 24 * 3600)
+PHASH_MAX_DISTANCE = 4
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dhash(gray, hash_size=8):
+    """64-bit difference hash of a grayscale image, as a signed int64 (BSON-safe)."""
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return int(np.array(value, dtype=np.uint64).astype(np.int64))
+
+
+def hamming(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def _names_key(business_name, owner_name):
+    return '|'.join(' '.join((n or '').lower().split()) for n in (business_name, owner_name))
+
+
+def _model_key(model_version):
+    return f"{model_version}:p{PIPELINE_VERSION}"
+
+
+def fingerprint(image, business_name, owner_name, model_version):
+    """Compute the cache identity of an upload (``image`` is a ``PermitImage``)."""
+    return {
+        'sha256': file_sha256(image.path),
+        'phash': dhash(image.gray) if image.valid else None,
+        'model_version': _model_key(model_version),
+        'names_key': _names_key(business_name, owner_name),
+    }
+
+
+def _hit(doc, image_path, match, distance=0):
+    result = copy.deepcopy(doc['result'])
+    result['file_path'] = image_path
+    result['timestamp'] = datetime.now().isoformat()
+    result['cache_hit'] = {'match': match, 'distance': distance, 'cached_at': doc['created_at'].isoformat()}
+    return result
+
+
+def lookup(db, fp, image_path):
+    """Return a cached result for ``fp`` (adjusted for this upload) or ``None``."""
+    coll = db[CACHE_COLLECTION]
+    now = datetime.utcnow()
+    base = {'model_version': fp['model_version'], 'names_key': fp['names_key'], 'expires_at': {'$gt': now}}
+
+    doc = coll.find_one(dict(base, sha256=fp['sha256']))
+    if doc:
+        return _hit(doc, image_path, 'exact')
+
+    if fp['phash'] is None:
+        return None
+    best, best_distance = None, PHASH_MAX_DISTANCE + 1
+    near = dict(base, phash={'$ne': None}, **{'result.valid': {'$ne': True}})
+    for doc in coll.find(near, {'phash': 1}).sort('created_at', -1).limit(200):
+        distance = hamming(fp['phash'], doc['phash'])
+        if distance < best_distance:
+            best, best_distance = doc, distance
+    if best is None:
+        return None
+    return _hit(coll.find_one({'_id': best['_id']}), image_path, 'perceptual', best_distance)
+
+
+def cacheable(result):
+    """Only deterministic outcomes are cached; DTI outages are retried."""
+    dti = result.get('dti_validation')
+    if dti and not dti.get('reachable', True):
+        return False
+    return not result.get('permit_validation', {}).get('pending_manual_review')
+
+
+def store(db, fp, result):
+    if not cacheable(result):
+        return False
+    now = datetime.utcnow()
+    db[CACHE_COLLECTION].replace_one(
+        {'_id': f"{fp['sha256']}:{fp['model_version']}:{fp['names_key']}"},
+        dict(fp, result=result, created_at=now, expires_at=now + timedelta(seconds=VERIFY_CACHE_TTL)),
+        upsert=True,
+    )
+    return True
+
+
+def verify_with_cache(db, verifier, image_path, business_name, owner_name):
+    """``verifier.verify_permit_image`` memoised on image content and model version."""
+    from permit_image import PermitImage
+
+    with PermitImage.open(image_path) as image:
+        fp = None
+        try:
+            fp = fingerprint(image, business_name, owner_name, verifier.model_version)
+            cached = lookup(db, fp, image_path)
+            if cached is not None:
+                print(f"⚡ Verification cache hit ({cached['cache_hit']['match']}) for {os.path.basename(image_path)}")
+                return cached
+        except Exception as e:
+            print(f"⚠️ Verification cache lookup failed: {e}")
+
+        result = verifier.verify_permit_image(
+            image, user_business_name=business_name, user_owner_name=owner_name,
+        )
+        if fp is not None:
+            try:
+                store(db, fp, result)
+            except Exception as e:
+                print(f"⚠️ Verification cache store failed: {e}")
+        return result
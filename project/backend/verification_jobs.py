@@ -0,0 +1,268 @@
+"""
+Background permit verification jobs.
+
+``POST /farmer/verify`` saves the upload, records a job in the
+``verification_jobs`` collection and hands it to a process pool, answering
+``202`` straight away.  The worker process runs the full ML + QR + OCR + DTI
+pipeline, applies the outcome to the user (role promotion, verification
+status, ``save_verification_record``) and stores the response payload on the
+job, which ``GET /farmer/verify/<job_id>`` serves to the polling client.
+
+Workers are started with the ``spawn`` method so they never inherit the web
+process's Mongo clients or background threads; each one builds its own
+``ImageVerificationSystem`` and database connections once, at start-up.
+``spawn`` re-imports the parent's main script in every worker, so ``app.py``
+skips its bootstrap (Mongo connect, indexes, email workers, blueprints) when
+imported as ``__mp_main__``.
+"""
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+JOBS_COLLECTION = 'verification_jobs'
+VERIFY_WORKERS = int(os.environ.get('VERIFY_WORKERS') or 2)
+# Start the workers (and build their verifiers) at boot, not on the first upload.
+VERIFIER_WARMUP = (os.environ.get('VERIFIER_WARMUP') or '').lower() in ('1', 'true', 'yes')
+# Jobs still queued/running after this long were lost (e.g. a restart).
+VERIFY_JOB_TIMEOUT = int(os.environ.get('VERIFY_JOB_TIMEOUT') or 600)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Per worker process state, set up by ``_init_worker``.
+_worker_db = None
+
+
+# ---------------------------------------------------------------------------
+# Result handling (runs in the worker)
+# ---------------------------------------------------------------------------
+def apply_verification_result(db, user, ml_result, permit_business_name,
+                              permit_owner_name, permit_filename, permit_path,
+                              verifier):
+    """Apply a pipeline result to ``user`` and return ``(payload, http_status)``."""
+    if ml_result is None:
+        # No verifier available - REJECT since we can't verify
+        user.business_verification_status = 'rejected'
+        user.save(db)
+        return {
+            'status': 'error',
+            'message': '❌ Unable to process permit verification at this time. Please try again later or contact support.',
+        }, 503
+
+    user.business_verification_ml = ml_result
+    verifier.save_verification_record(
+        str(user.id),
+        ml_result,
+        db=db,
+        user_obj=user,
+        permit_business_name=permit_business_name,
+        permit_owner_name=permit_owner_name,
+        image_filename=permit_filename,
+        image_path=permit_path
+    )
+
+    # Store QR data and business info if available
+    user.permit_qr_data = ml_result.get('qr_data', '')
+    user.permit_extracted_text = ml_result.get('extracted_text', '')
+    if ml_result.get('business_info'):
+        user.dti_business_info = ml_result['business_info']
+    if ml_result.get('ml_prediction'):
+        user.ml_prediction = ml_result['ml_prediction']
+    if ml_result.get('name_verification'):
+        user.name_verification = ml_result['name_verification']
+
+    # Binary outcome: ACCEPT or REJECT
+    # Only accept if ML validation explicitly passes (valid=True)
+    # Don't accept based on confidence alone
+    if ml_result.get('valid'):
+        # ACCEPT: User becomes farmer
+        user.business_verification_status = 'verified'
+        user.role = 'farmer'
+
+        accept_details = ['DTI verification passed']
+        if ml_result.get('dti_validation', {}).get('business_name'):
+            accept_details.append(f"Business: {ml_result['dti_validation']['business_name']}")
+        if ml_result.get('dti_validation', {}).get('owner_name'):
+            accept_details.append(f"Owner: {ml_result['dti_validation']['owner_name']}")
+
+        ml_pred = ml_result.get('ml_prediction', {})
+        if ml_pred.get('available') and ml_pred.get('is_permit'):
+            accept_details.append(f"ML confidence: {ml_pred['confidence']:.0%}")
+
+        nv = ml_result.get('name_verification', {})
+        if nv and nv.get('overall_match') and nv.get('score', 0) > 0.5:
+            accept_details.append(f"Name match: {nv['score']:.0%}")
+
+        user.save(db)
+        details_str = ' | '.join(accept_details)
+        return {
+            'status': 'verified',
+            'message': f'✅ Business permit accepted! {details_str} You are now a verified farmer.',
+            'confidence': ml_result.get('confidence', 0),
+            'confidence_percentage': f"{int(ml_result.get('confidence', 0) * 100)}%",
+            'user': {
+                'id': str(user.id),
+                'role': user.role,
+                'email': user.email,
+            }
+        }, 200
+
+    # REJECT: Clear reason provided to user
+    pv = ml_result.get('permit_validation', {})
+    reason = pv.get('message', 'Permit document not recognized')
+
+    user.business_verification_status = 'rejected'
+    user.save(db)
+
+    return {
+        'status': 'rejected',
+        'message': f'❌ Permit verification failed: {reason}. Please verify you uploaded a clear image of a valid business permit and try again.',
+        'confidence': ml_result.get('confidence', 0),
+        'confidence_percentage': f"{int(ml_result.get('confidence', 0) * 100)}%",
+    }, 400
+
+
+# ---------------------------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------------------------
+def _init_worker(mongodb_uri):
+    global _worker_db
+    from mongoengine import connect
+    from pymongo import MongoClient
+
+    connect(host=mongodb_uri)
+    _worker_db = MongoClient(mongodb_uri).get_database()
+    # Build the verifier up front; jobs still ask ``get_verifier()`` each
+    # time so a failed build is retried after VERIFIER_RETRY_INTERVAL.
+    from ml_verifier import get_verifier
+    get_verifier()
+
+
+def _set_job(db, job_id, **fields):
+    fields['updated_at'] = datetime.utcnow()
+    db[JOBS_COLLECTION].update_one({'_id': job_id}, {'$set': fields})
+
+
+def run_verification_job(job_id, params):
+    """Worker entry point: verify one upload and record the outcome on the job."""
+    from ml_verifier import get_verifier
+    from user_model import User
+    from verification_cache import verify_with_cache
+
+    db = _worker_db
+    verifier = get_verifier()
+    _set_job(db, job_id, status='running', started_at=datetime.utcnow())
+    try:
+        user = User.get_by_email(db, params['user_email'])
+        if not user:
+            _set_job(db, job_id, status='failed', error='User not found.', finished_at=datetime.utcnow())
+            return
+
+        ml_result = None
+        if verifier is not None:
+            ml_result = verify_with_cache(
+                db, verifier,
+                params['permit_path'],
+                params['permit_business_name'] or user.farm_name,
+                params['permit_owner_name'],
+            )
+        payload, http_status = apply_verification_result(
+            db, user, ml_result,
+            params['permit_business_name'],
+            params['permit_owner_name'],
+            params['permit_filename'],
+            params['permit_path'],
+            verifier,
+        )
+        _set_job(db, job_id, status='done', result=payload, result_status=http_status,
+                 finished_at=datetime.utcnow())
+    except Exception as e:
+        print(f"Verification error: {e}")
+        _set_job(db, job_id, status='failed', error=f'Verification failed: {e}', finished_at=datetime.utcnow())
+
+
+# ---------------------------------------------------------------------------
+# Web process side
+# ---------------------------------------------------------------------------
+def _get_pool(mongodb_uri):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=VERIFY_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(mongodb_uri,),
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _warm():
+    return os.getpid()
+
+
+def warm_pool(mongodb_uri):
+    """Start every worker process now; each builds its verifier in ``_init_worker``."""
+    pool = _get_pool(mongodb_uri)
+    for _ in range(VERIFY_WORKERS):
+        pool.submit(_warm)
+
+
+def pool_state():
+    return 'running' if _pool is not None else 'not-started'
+
+
+def submit_verification_job(db, mongodb_uri, user, params):
+    """Record a queued job for ``user`` and hand it to the process pool.
+
+    ``params`` carries ``permit_path``, ``permit_filename``,
+    ``permit_business_name``, ``permit_owner_name`` and ``user_email``.
+    Returns the job id.
+    """
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    db[JOBS_COLLECTION].insert_one({
+        '_id': job_id,
+        'user_id': str(user.id),
+        'user_email': user.email,
+        'status': 'queued',
+        'permit_filename': params.get('permit_filename'),
+        'created_at': now,
+        'updated_at': now,
+    })
+    try:
+        _get_pool(mongodb_uri).submit(run_verification_job, job_id, params)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool and retry once.
+        _reset_pool()
+        _get_pool(mongodb_uri).submit(run_verification_job, job_id, params)
+    return job_id
+
+
+def get_job(db, job_id, user_email):
+    """Return the job owned by ``user_email``, or ``None``.
+
+    Jobs stuck in ``queued``/``running`` past ``VERIFY_JOB_TIMEOUT`` are
+    reported (and recorded) as failed.
+    """
+    job = db[JOBS_COLLECTION].find_one({'_id': job_id, 'user_email': user_email})
+    if not job:
+        return None
+    if job['status'] in ('queued', 'running') and \
+            job['created_at'] < datetime.utcnow() - timedelta(seconds=VERIFY_JOB_TIMEOUT):
+        job['status'] = 'failed'
+        job['error'] = 'Verification timed out. Please submit your permit again.'
+        _set_job(db, job_id, status=job['status'], error=job['error'])
+    return job
@@ -2,6 +2,29 @@ import React, { useState, useRef, useEffect } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 
+const API_BASE = 'http://localhost:5001';
+const VERIFY_POLL_INTERVAL_MS = 2000;
+// The server fails jobs that are still running after 10 minutes.
+const VERIFY_POLL_MAX_ATTEMPTS = 330;
+
+// POST /farmer/verify answers 202 with a job; poll it until the worker is done.
+const waitForVerificationJob = async (statusUrl, token) => {
+  for (let attempt = 0; attempt < VERIFY_POLL_MAX_ATTEMPTS; attempt += 1) {
+    await new Promise((resolve) => setTimeout(resolve, VERIFY_POLL_INTERVAL_MS));
+    const response = await fetch(`${API_BASE}${statusUrl}`, {
+      headers: { 'Authorization': `Bearer ${token}` },
+    });
+    const job = await response.json();
+    if (!response.ok) {
+      throw new Error(job.error || 'Unable to check the verification status.');
+    }
+    if (job.status === 'done' || job.status === 'failed') {
+      return job;
+    }
+  }
+  throw new Error('Verification is taking longer than expected. Please check back later.');
+};
+
 const FarmerVerify = () => {
   const { user, token, logout, updateUser } = useAuth();
   const navigate = useNavigate();
@@ -364,7 +387,7 @@ const FarmerVerify = () => {
     formDataToSend.append('permit_owner_name', formData.permit_owner_name);
 
     try {
-      const response = await fetch('http://localhost:5001/farmer/verify', {
+      const response = await fetch(`${API_BASE}/farmer/verify`, {
         method: 'POST',
         headers: {
           'Authorization': `Bearer ${token}`,
@@ -372,9 +395,23 @@ const FarmerVerify = () => {
         body: formDataToSend,
       });
 
-      if (response.ok) {
-        const data = await response.json();
-        
+      let data = await response.json();
+      let ok = response.ok;
+
+      if (response.status === 202 && data.status_url) {
+        setSuccessMessage('Permit received. Verifying your documents, this can take a minute...');
+        const job = await waitForVerificationJob(data.status_url, token);
+        setSuccessMessage('');
+        if (job.status === 'failed') {
+          data = { error: job.error };
+          ok = false;
+        } else {
+          data = job.result || {};
+          ok = job.result_status < 400;
+        }
+      }
+
+      if (ok) {
         // Update user context if verification was successful
         if (data.status === 'verified' && data.user) {
           const updatedUser = {
@@ -388,18 +425,21 @@ const FarmerVerify = () => {
         
         // Include confidence score in success message
         const confidenceMsg = data.confidence_percentage ? ` (Confidence: ${data.confidence_percentage})` : '';
-        setSuccessMessage(`Verification submitted successfully!${confidenceMsg} Redirecting...`);
+        setSuccessMessage(`${data.message || 'Verification submitted successfully!'}${confidenceMsg} Redirecting...`);
         setTimeout(() => navigate('/farmers'), 2000);
       } else {
         // Display server-side validation errors with confidence score if available
-        const errorData = await response.json();
-        const errorMsg = errorData.error || errorData.message || 'An error occurred while submitting.';
-        const confidenceMsg = errorData.confidence_percentage ? ` (Confidence: ${errorData.confidence_percentage})` : '';
+        const errorMsg = data.error || data.message || 'An error occurred while submitting.';
+        const confidenceMsg = data.confidence_percentage ? ` (Confidence: ${data.confidence_percentage})` : '';
         setValidationErrors({ submit: `Submission issue: ${errorMsg}${confidenceMsg}` });
         window.scrollTo(0, 0);
       }
     } catch (error) {
-      setValidationErrors({ submit: 'Network error. Please check your connection and try again.' });
+      setSuccessMessage('');
+      const errorMsg = error instanceof TypeError
+        ? 'Network error. Please check your connection and try again.'
+        : error.message;
+      setValidationErrors({ submit: errorMsg });
       window.scrollTo(0, 0);
     } finally {
       setIsLoading(false);